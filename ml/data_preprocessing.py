@@ -1,48 +1,41 @@
 from __future__ import annotations
 
 
-import csv, math
+import os, sys, csv, glob, json, shutil, argparse
 from pathlib import Path
 import statistics as stats
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 
 from collections import Counter, deque
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, Iterable, Iterator, List, Tuple, Optional
+
+import numpy as np
+
+_SERVER_DIR = Path(__file__).resolve().parent.parent / "server"
+if str(_SERVER_DIR) not in sys.path: sys.path.insert(0, str(_SERVER_DIR))
+
+from signals import (
+    VALID_LABELS, PUMP_REASON_LABELS,
+    SignalParams, DEFAULT_PARAMS, SignalState, finite, map_reason_to_label, decide_label, params_from_config,
+)
+from storage import log_parts, open_text   # the collector's rotated-log layout (`<stem>.<UTC stamp><suffix>[.gz|.zst]`)
 
 CSV_IN  = Path("data/old/telemetry_b_test.csv")
 CSV_OUT = Path("data/training.csv")
-
-NIGHT_LUX            = 30.0
-GLARE_LUX            = 2000.0
-IR_DELTA_HOT         = 5.0
-IR_ABS_HOT           = 45.0
-AIR_FIRE_ABS         = 50.0
-AIR_HOT_T            = 40.0
-AIR_HOT_LOW_RH       = 15.0
-DT_STRAT             = 1.0
-DT_INV               = -0.8
-DT60_COLD            = -0.5
-TDS_JUMP_ABS         = 200.0
-TDS_JUMP_FRAC        = 0.25
-TDS_DWELL_SEC        = 10
-DAY_ON_FACTOR        = 5.0
-SUDDEN_LIGHT_FACTOR  = 10.0
-SUDDEN_DARK_FACTOR   = 0.2
-SUDDEN_WINDOW_SEC    = 3
-SUDDEN_HOLD_SEC      = 3
-P_DROP_HPA           = 6.0
-OVERHEAT_UN          = 30.0
-COOL_ON_C            = 30.0
-COOL_OFF_C           = 29.5
-TAP_MIN_SEC          = 0.7
-TAP_MAX_SEC          = 2.0
-DISTURB_DWELL_SEC    = 5.0
-PUMP_SELF_MASK_SEC   = 8.0
+CHUNK_ROWS = 65536
+EMA_BLOCK = 64
 
 FEATURES = [
     "micRMS","lux","tMid","dT_tb","DOproxy","tds_mV",
     "irObj","irAmb","airT","airRH","pressure_hPa",
     "pump","manual_override"
 ]
+FLOAT_COLS = ("ts","micRMS","lux","tMid","dT_tb","DOproxy","tds_mV",
+              "irObj","irAmb","airT","airRH","pressure_hPa")
+BOOL_COLS = ("pump","manual_override")
+STR_COLS = ("reason","device")
+TRUE_STRINGS = ("1","true","t","yes","y")
 
 def F(r: Dict[str, Any], k: str) -> float:
     try:
@@ -63,294 +56,472 @@ def I(r: Dict[str, Any], k: str) -> Optional[int]:
 
 def B(r: Dict[str, Any], k: str) -> bool:
     s = str(r.get(k, "")).strip().lower()
-    return s in ("1","true","t","yes","y")
-
-def finite(x: Any) -> bool:
-    try: return math.isfinite(x)
-    except Exception: return False
-
-rows: List[Dict[str, Any]] = []
-if not CSV_IN.exists():
-    raise SystemExit(f"Missing {CSV_IN}")
-
-with CSV_IN.open(newline="") as f:
-    rdr = csv.DictReader(f)
-    for r in rdr:
-        rows.append({
-            "ts": F(r,"ts"),
-            "ms": F(r,"ms"),
-            "pump": B(r,"pump"),
-            "manual_override": B(r,"manual_override"),
-            "alert": B(r,"alert"),
-            "reason": (r.get("reason") or "").strip(),
-            "rec_ms": I(r,"rec_ms") or 0,
-            "tTop": F(r,"tTop"),
-            "tMid": F(r,"tMid"),
-            "tBot": F(r,"tBot"),
-            "dT_tb": F(r,"dT_tb"),
-            "pressure_hPa": F(r,"pressure_hPa"),
-            "lux": F(r,"lux"),
-            "irObj": F(r,"irObj"),
-            "irAmb": F(r,"irAmb"),
-            "airT": F(r,"airT"),
-            "airRH": F(r,"airRH"),
-            "tds_mV": F(r,"tds_mV"),
-            "tds_sat": B(r,"tds_sat"),
-            "micRMS": F(r,"micRMS"),
-            "DOproxy": F(r,"DOproxy"),
-        })
-
-if not rows:
-    raise SystemExit("No data in telemetry.csv")
-
-mic_vals = [r["micRMS"] for r in rows if finite(r["micRMS"])]
-mu_mic = stats.median(mic_vals) if mic_vals else 0.0
-sd_mic = stats.pstdev(mic_vals) if len(mic_vals) > 1 else 1.0
-sd_mic = sd_mic or 1.0
-def z_mic(x: float) -> float:
-    return 0.0 if not finite(x) else (x - mu_mic) / sd_mic
-
-def row_dt(prev: Dict[str, Any], cur: Dict[str, Any]) -> float:
-    if finite(prev.get("ts")) and finite(cur.get("ts")):
-        dt = cur["ts"] - prev["ts"]
-        if 0.2 <= dt <= 5.0:
-            return float(dt)
-    return 1.0
-
-win_tMid_60 = deque(maxlen=60)
-lux_hist    = deque(maxlen=max(5, SUDDEN_WINDOW_SEC+1))
-baro_hist: deque[Tuple[float,float]] = deque()
-tds_base: Optional[float] = None
-tds_since_s: float = 0.0
-abrupt_dark_since_s: float = 0.0
-disturb_since_s: Optional[float] = None
-pump_on_at_s: Optional[float] = None
-is_day = False
-day_switch_ts: Optional[float] = None
-
-feats: List[List[float]] = []
-labels: List[str] = []
-
-VALID_LABELS = {
-    "calm","cold-shock","cooling-hot","disturbance","flashlight-night","glare",
-    "human-tap","manual-override","other","pump-self","tds-spike","uniform-overheat"
-}
-
-def map_reason_to_label(reason: str) -> str:
-    r = (reason or "").strip().lower()
-    if r in ("", "none"):
-        return "none"
-
-    exact = {
-        "cold_shock": "cold-shock",
-        "tds_spike": "tds-spike",
-        "uniform_overheat": "uniform-overheat",
-        "cooling_hot": "cooling-hot",
-        "human_tap": "human-tap",
-        "disturbance": "disturbance",
-        "flashlight_night": "flashlight-night",
-        "heater_lamp": "glare",
-    }
-    if r in exact: return exact[r]
-
-    if "cooling_hot" in r: return "cooling-hot"
-    if "flashlight" in r and "night" in r: return "flashlight-night"
-    if "heater_lamp" in r: return "glare"
-    if "cold_shock" in r: return "cold-shock"
-    if "tds_spike" in r: return "tds-spike"
-    if "uniform_overheat" in r: return "uniform-overheat"
-
-    if ("strat" in r) or ("inv" in r) or ("lowc" in r) or ("baro" in r) or ("night_mild" in r):
-        return "pump-hint"
-
-    if "safe_hold_sensor" in r or "abrupt_dark" in r:
-        return "other"
-
-    return "other"
-
-def recompute_signals(idx: int, prev: Optional[Dict[str, Any]], cur: Dict[str, Any], dt_s: float) -> Dict[str, bool]:
-    global is_day, day_switch_ts, tds_base, tds_since_s, abrupt_dark_since_s, disturb_since_s, pump_on_at_s
-
-    mic = cur["micRMS"]; lux = cur["lux"]; tMid = cur["tMid"]; dT = cur["dT_tb"]
-    irO = cur["irObj"];  irA = cur["irAmb"]; airT = cur["airT"]; RH = cur["airRH"]
-    tds = cur["tds_mV"]; P   = cur["pressure_hPa"]
-    pump = cur["pump"];  m_override = cur["manual_override"]
-
-    if pump and pump_on_at_s is None:
-        pump_on_at_s = cur["ts"] if finite(cur["ts"]) else 0.0
-    if not pump:
-        pump_on_at_s = None
-
-    win_tMid_60.append(tMid)
-    cold_shock = False
-    if len(win_tMid_60) == win_tMid_60.maxlen and finite(tMid) and finite(win_tMid_60[0]):
-        cold_shock = (tMid - win_tMid_60[0]) <= DT60_COLD
-
-    stratified = (finite(dT) and dT > DT_STRAT)
-    inversion  = (finite(dT) and dT < DT_INV)
-
-    glare = (finite(lux) and lux >= GLARE_LUX)
-    heater_lamp = glare and (
-        (finite(irO) and finite(irA) and (irO - irA) >= IR_DELTA_HOT) or
-        (finite(irO) and irO >= IR_ABS_HOT)
-    )
-
-    ambient_fire = (finite(airT) and airT >= AIR_FIRE_ABS) or \
-                   (finite(airT) and finite(RH) and (airT >= AIR_HOT_T and RH <= AIR_HOT_LOW_RH))
-    overheat_un = (finite(tMid) and tMid > OVERHEAT_UN and (finite(dT) and abs(dT) < 0.3))
-
-    if finite(tds):
-        if tds_base is None: tds_base = tds
-        tds_base = (1 - 0.01)*tds_base + 0.01*tds
-    tds_spike_now = (finite(tds) and tds_base is not None and
-                     (tds - tds_base) > max(TDS_JUMP_ABS, TDS_JUMP_FRAC * tds_base))
-    if tds_spike_now: tds_since_s += dt_s
-    else:             tds_since_s = 0.0
-    tds_spike = (tds_since_s >= TDS_DWELL_SEC)
-
-    if finite(P) and finite(cur["ts"]):
-        baro_hist.append((cur["ts"], P))
-        cutoff = cur["ts"] - 3*3600
-        while baro_hist and baro_hist[0][0] < cutoff:
-            baro_hist.popleft()
-    baro_drop = False
-    if baro_hist:
-        p_now = baro_hist[-1][1]; p_old = baro_hist[0][1]
-        if finite(p_now) and finite(p_old):
-            baro_drop = (p_old - p_now) >= P_DROP_HPA
-
-    if not is_day and finite(lux) and lux > NIGHT_LUX * max(2.0, DAY_ON_FACTOR):
-        is_day = True; day_switch_ts = cur["ts"]
-    if is_day and finite(lux) and lux < NIGHT_LUX:
-        is_day = False; day_switch_ts = cur["ts"]
-
-    lux_hist.append((cur["ts"], lux if finite(lux) else 0.0))
-    flashlight_night = False
-    abrupt_dark_day  = False
-    if len(lux_hist) >= 2:
-        t_now, L_now = lux_hist[-1]
-        base_L = L_now
-        base_t = t_now
-        for t, L in reversed(lux_hist):
-            base_L = L; base_t = t
-            if not finite(t_now) or not finite(t): break
-            if (t_now - t) >= SUDDEN_WINDOW_SEC: break
-        ratio_up = (L_now/base_L) if base_L > 0 else (999.0 if L_now > 0 else 1.0)
-        ratio_down = (base_L/L_now) if L_now > 0 else 1.0
-
-        night_flash_now = (not is_day) and (ratio_up >= SUDDEN_LIGHT_FACTOR)
-        if night_flash_now:
-            flashlight_night = True
-
-        day_dark_now = is_day and (ratio_down <= SUDDEN_DARK_FACTOR)
-        if day_dark_now:
-            abrupt_dark_since_s += dt_s
+    return s in TRUE_STRINGS
+
+# --- chunked column reader ---
+
+def _float_col(vals: List[Optional[str]]) -> np.ndarray:
+    try:
+        return np.array(["nan" if v is None or v == "" else v for v in vals], dtype=np.float64)
+    except ValueError:
+        return np.fromiter((F({"v": v}, "v") for v in vals), dtype=np.float64, count=len(vals))
+
+def _bool_col(vals: List[Optional[str]]) -> np.ndarray:
+    u, inv = np.unique(np.array([str(v) for v in vals], dtype=object), return_inverse=True)
+    return np.array([s.strip().lower() in TRUE_STRINGS for s in u], dtype=bool)[inv] if len(u) else np.zeros(0, bool)
+
+def _str_col(vals: List[Optional[str]]) -> np.ndarray:
+    return np.array([(v or "").strip() for v in vals], dtype=object)
+
+def iter_csv_chunks(path: Path, chunk_rows: int = CHUNK_ROWS,
+                    columns: Iterable[str] = FLOAT_COLS + BOOL_COLS + STR_COLS) -> Iterator[Dict[str, np.ndarray]]:
+    """Read a telemetry CSV as dicts of column arrays, `chunk_rows` rows at a time.
+
+    Rotated parts of the same log are read first, each under its own header.
+    Parsing follows F/B above: missing or unparsable numbers become NaN, missing booleans False.
+    """
+    for part in log_parts(path):
+        with open_text(part) as f:
+            rdr = csv.reader(f)
+            header = next(rdr, None)
+            if header is None: continue
+            pos = {k: i for i, k in enumerate(header)}          # last duplicate wins, as in DictReader
+            width = len(header)
+            while True:
+                block = [r if len(r) >= width else r + [None] * (width - len(r))
+                         for r in islice(rdr, chunk_rows) if r]
+                if not block: break
+                cols = list(zip(*block))
+                out: Dict[str, np.ndarray] = {}
+                for k in columns:
+                    j = pos.get(k)
+                    vals = [None] * len(block) if j is None else cols[j]
+                    if k in BOOL_COLS: out[k] = _bool_col(vals)
+                    elif k in STR_COLS: out[k] = _str_col(vals)
+                    else: out[k] = _float_col(vals)
+                yield out
+
+def split_devices(dev: np.ndarray) -> List[Tuple[str, Optional[np.ndarray]]]:
+    """(device, row index) groups of a chunk's `device` column in first-seen order.
+
+    The index is None when the whole chunk is one device, so callers can use the chunk as is
+    instead of copying it; rows within a group keep file order.
+    """
+    u, first, inv = np.unique(dev.astype(str), return_index=True, return_inverse=True)
+    if len(u) <= 1: return [(str(u[0]) if len(u) else "", None)]
+    return [(str(u[g]), np.flatnonzero(inv == g)) for g in np.argsort(first)]
+
+def mic_baseline(path: Path, chunk_rows: int = CHUNK_ROWS) -> Tuple[Dict[str, Tuple[float, float]], int]:
+    """Per-device (median, pstdev) of finite micRMS over the whole file, plus the row count.
+
+    Files without a device column are a single stream keyed "". Only the finite mic values are held.
+    """
+    parts: Dict[str, List[np.ndarray]] = {}; rows = 0
+    for c in iter_csv_chunks(path, chunk_rows, ("micRMS", "device")):
+        m = c["micRMS"]; rows += len(m)
+        for dev, idx in split_devices(c["device"]):
+            v = m if idx is None else m[idx]
+            parts.setdefault(dev, []).append(v[np.isfinite(v)])
+    out: Dict[str, Tuple[float, float]] = {}
+    for dev, ps in parts.items():
+        mic = np.concatenate(ps)
+        mu = float(np.median(mic)) if len(mic) else 0.0
+        sd = stats.pstdev(mic) if len(mic) > 1 else 1.0
+        out[dev] = (mu, sd or 1.0)
+    return out, rows
+
+# --- vectorized signal computation ---
+
+def _runs(active: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    d = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+def _dwell(active: np.ndarray, dt: np.ndarray, carry: float, fresh_zero: bool = False) -> np.ndarray:
+    """Accumulated seconds within each run of `active` (0 elsewhere), summed in row order.
+
+    A run touching row 0 continues from `carry`. With `fresh_zero` a new run starts at 0.0
+    on its first row instead of adding that row's dt (the disturbance timer).
+    """
+    out = np.zeros(len(active))
+    for s, e in zip(*_runs(active)):
+        if s == 0 and carry is not None:
+            out[s:e] = np.cumsum(np.concatenate(([carry], dt[s:e])))[1:]
+        elif fresh_zero:
+            out[s:e] = np.cumsum(np.concatenate(([0.0], dt[s + 1:e])))
+        else:
+            out[s:e] = np.cumsum(dt[s:e])
+    return out
+
+def _ffill_index(mark: np.ndarray) -> np.ndarray:
+    return np.maximum.accumulate(np.where(mark, np.arange(len(mark)), -1)) if len(mark) else np.zeros(0, np.int64)
+
+class BlockEMA:
+    """y = (1 - alpha) * y + alpha * x over successive arrays, starting at the first x.
+
+    Evaluated EMA_BLOCK values at a time by matrix product, which is exact up to float rounding.
+    """
+    def __init__(self, alpha: float):
+        self.alpha = alpha; self.y: Optional[float] = None
+        keep = 1 - alpha; k = np.arange(EMA_BLOCK)
+        self._T = np.tril(alpha * keep ** (k[:, None] - k[None, :]).clip(0))
+        self._pow = keep ** (k + 1)
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        a = self.alpha; keep = 1 - a
+        out = np.empty_like(x)
+        if not len(x): return out
+        i0 = 0
+        if self.y is None:
+            self.y = keep * x[0] + a * x[0]; out[0] = self.y; i0 = 1
+        rest = x[i0:]; n = len(rest)
+        if n:
+            nb = -(-n // EMA_BLOCK)
+            X = np.zeros(nb * EMA_BLOCK); X[:n] = rest
+            part = X.reshape(nb, EMA_BLOCK) @ self._T.T
+            y0 = np.empty(nb); y = self.y; last_pow = self._pow[-1]
+            for b in range(nb):
+                y0[b] = y; y = last_pow * y + part[b, -1]
+            out[i0:] = (part + y0[:, None] * self._pow[None, :]).ravel()[:n]
+            self.y = float(out[-1])
+        return out
+
+class StreamLabeler:
+    """Vectorized labeller for one device stream, carrying window state across chunks.
+
+    Produces the same signals as SignalState.step applied row by row.
+    """
+    def __init__(self, params: SignalParams = DEFAULT_PARAMS, mic_mu: float = 0.0, mic_sd: float = 1.0):
+        self.params = params
+        self.mic_mu = mic_mu; self.mic_sd = mic_sd or 1.0
+        self.n_seen = 0
+        self.prev_ts = float("nan")
+        self.tmid_tail = np.empty(0)
+        self.lux_t = np.empty(0); self.lux_L = np.empty(0)
+        self.baro_t = np.empty(0); self.baro_p = np.empty(0); self.baro_drop = False
+        self.tds_ema = BlockEMA(params.tds_ema_alpha)
+        self.tds_since = 0.0
+        self.dark_since = 0.0
+        self.disturb_since: Optional[float] = None
+        self.pump_on_at: Optional[float] = None
+        self.is_day = False
+
+    def _baro(self, ts: np.ndarray, P: np.ndarray) -> np.ndarray:
+        p = self.params; n = len(ts)
+        valid = np.isfinite(P) & np.isfinite(ts)
+        vt = ts[valid]; vp = P[valid]
+        et = np.concatenate((self.baro_t, vt)); ep = np.concatenate((self.baro_p, vp))
+        k = len(self.baro_t)
+        if not len(vt):
+            return np.full(n, self.baro_drop)
+        if np.all(np.diff(et) >= 0):
+            ptr = np.maximum.accumulate(np.searchsorted(et, vt - p.baro_window_sec, "left"))
+            drop_v = (ep[ptr] - vp) >= p.p_drop_hpa
+            head = int(ptr[-1])
+        else:
+            hist = deque(zip(self.baro_t.tolist(), self.baro_p.tolist()))
+            drop_v = np.empty(len(vt), bool)
+            for i, (t, pv) in enumerate(zip(vt.tolist(), vp.tolist())):
+                hist.append((t, pv))
+                while hist and hist[0][0] < t - p.baro_window_sec: hist.popleft()
+                drop_v[i] = (hist[0][1] - hist[-1][1]) >= p.p_drop_hpa
+            head = len(et) - len(hist)
+        self.baro_t = et[head:]; self.baro_p = ep[head:]
+        out = np.empty(n, bool)
+        idx = _ffill_index(valid)
+        rank = np.cumsum(valid) - 1
+        out[:] = np.where(idx >= 0, drop_v[np.maximum(rank, 0)], self.baro_drop)
+        self.baro_drop = bool(drop_v[-1])
+        return out
+
+    def signals(self, c: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        p = self.params; fin = np.isfinite
+        ts = c["ts"]; n = len(ts); ar = np.arange(n); gi = self.n_seen + ar
+        mic = c["micRMS"]; lux = c["lux"]; tMid = c["tMid"]; dT = c["dT_tb"]
+        irO = c["irObj"]; irA = c["irAmb"]; airT = c["airT"]; RH = c["airRH"]
+        tds = c["tds_mV"]; P = c["pressure_hPa"]; pump = c["pump"]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            prev = np.concatenate(([self.prev_ts], ts[:-1]))
+            d = ts - prev
+            dt = np.where(fin(prev) & fin(ts) & (d >= 0.2) & (d <= 5.0), d, 1.0)
+
+            prev_pump = np.concatenate(([self.pump_on_at is not None], pump[:-1]))
+            starts = pump & ~prev_pump
+            at = _ffill_index(starts)
+            start_val = np.where(fin(ts), ts, 0.0)
+            carry_on = self.pump_on_at if self.pump_on_at is not None else np.nan
+            on_at = np.where(pump, np.where(at >= 0, start_val[np.maximum(at, 0)], carry_on), np.nan)
+            within_self_mask = pump & fin(ts) & ((ts - on_at) < p.pump_self_mask_sec)
+
+            W = p.tmid_window; k = len(self.tmid_tail)
+            ext = np.concatenate((self.tmid_tail, tMid))
+            full = gi >= W - 1
+            w0 = np.where(full, ext[np.clip(ar + k - (W - 1), 0, None)], np.nan)
+            cold_shock = full & fin(tMid) & fin(w0) & ((tMid - w0) <= p.dt60_cold)
+
+            stratified = dT > p.dt_strat
+            inversion = dT < p.dt_inv
+            glare = lux >= p.glare_lux
+            heater_lamp = glare & (((irO - irA) >= p.ir_delta_hot) | (irO >= p.ir_abs_hot))
+            ambient_fire = (airT >= p.air_fire_abs) | ((airT >= p.air_hot_t) & (RH <= p.air_hot_low_rh))
+            overheat_un = (tMid > p.overheat_un) & (np.abs(dT) < 0.3)
+
+            ftds = fin(tds)
+            base = np.full(n, np.nan); base[ftds] = self.tds_ema(tds[ftds])
+            spike_now = ftds & ((tds - base) > np.maximum(p.tds_jump_abs, p.tds_jump_frac * base))
+            since = _dwell(spike_now, dt, self.tds_since)
+            tds_spike = since >= p.tds_dwell_sec
+
+            baro_drop = self._baro(ts, P)
+
+            fl = fin(lux)
+            trig = np.where(fl & (lux > p.day_on_lux), 1, np.where(fl & (lux < p.night_lux), 0, -1))
+            last = _ffill_index(trig >= 0)
+            is_day = np.where(last >= 0, trig[np.maximum(last, 0)] == 1, self.is_day)
+
+            Lv = np.where(fl, lux, 0.0)
+            H = p.lux_hist_len; k = len(self.lux_t)
+            et = np.concatenate((self.lux_t, ts)); eL = np.concatenate((self.lux_L, Lv))
+            base_L = np.full(n, np.nan); done = np.zeros(n, bool)
+            for lag in range(H):
+                avail = (gi - lag) >= 0
+                j = np.clip(ar + k - lag, 0, None)
+                tl = et[j]; Ll = eL[j]
+                take = avail & ~done
+                base_L = np.where(take, Ll, base_L)
+                done |= take & (~fin(ts) | ~fin(tl) | ((ts - tl) >= p.sudden_window_sec))
+            have = gi >= 1
+            ratio_up = np.where(base_L > 0, Lv / base_L, np.where(Lv > 0, 999.0, 1.0))
+            ratio_down = np.where(Lv > 0, base_L / Lv, 1.0)
+            flashlight_night = have & ~is_day & (ratio_up >= p.sudden_light_factor)
+            dark_now = have & is_day & (ratio_down <= p.sudden_dark_factor)
+            dark = _dwell(dark_now, dt, self.dark_since)
+            abrupt_dark_day = have & (dark >= p.sudden_hold_sec)
+
+            zr = np.where(fin(mic), (mic - self.mic_mu) / self.mic_sd, 0.0)
+            ripple = (zr >= 1.0) & ~within_self_mask
+            dur = _dwell(ripple, dt, self.disturb_since, fresh_zero=True)
+            human_tap = ripple & ~pump & (p.tap_min_sec <= dur) & (dur <= p.tap_max_sec)
+            disturbance = ripple & (dur >= p.disturb_dwell_sec)
+            cooling_hot = tMid >= p.cool_on_c
+
+        if n:
+            self.n_seen += n
+            self.prev_ts = float(ts[-1])
+            self.tmid_tail = ext[-(W - 1):] if W > 1 else np.empty(0)
+            self.lux_t = et[-(H - 1):]; self.lux_L = eL[-(H - 1):]
+            self.tds_since = float(since[-1])
+            if have[-1]: self.dark_since = float(dark[-1])
+            self.disturb_since = float(dur[-1]) if ripple[-1] else None
+            self.pump_on_at = float(on_at[-1]) if pump[-1] else None
+            self.is_day = bool(is_day[-1])
+
+        return dict(
+            cold_shock=cold_shock, stratified=stratified, inversion=inversion, glare=glare,
+            heater_lamp=heater_lamp, ambient_fire=ambient_fire, overheat_un=overheat_un,
+            tds_spike=tds_spike, baro_drop=baro_drop, flashlight_night=flashlight_night,
+            abrupt_dark_day=abrupt_dark_day, human_tap=human_tap, disturbance=disturbance,
+            cooling_hot=cooling_hot, zr=zr, is_day=is_day,
+        )
+
+def reason_labels(reasons: np.ndarray) -> np.ndarray:
+    u, inv = np.unique(reasons.astype(str), return_inverse=True)
+    return np.array([map_reason_to_label(r) for r in u], dtype=object)[inv] if len(u) else np.empty(0, object)
+
+def decide_labels(c: Dict[str, np.ndarray], sig: Dict[str, np.ndarray], rl: np.ndarray,
+                  params: SignalParams = DEFAULT_PARAMS) -> np.ndarray:
+    """Vectorized decide_label: same rule order, evaluated with np.select."""
+    pump = c["pump"]; mo = c["manual_override"]; L = c["lux"]
+    g = sig["glare"] | sig["heater_lamp"]
+    pump_lbl = np.select(
+        [np.isin(rl, list(PUMP_REASON_LABELS)), rl == "pump-hint", sig["cooling_hot"], sig["tds_spike"],
+         sig["cold_shock"], sig["overheat_un"], sig["flashlight_night"], g],
+        [rl, "pump-self", "cooling-hot", "tds-spike", "cold-shock", "uniform-overheat", "flashlight-night", "glare"],
+        default="pump-self")
+    with np.errstate(invalid="ignore"):
+        calm = (~np.isfinite(L) | (L < 0.5*params.glare_lux)) & (sig["zr"] <= 1.0)
+    idle_lbl = np.select(
+        [np.isin(rl, list(VALID_LABELS - {"pump-self","manual-override"})), sig["flashlight_night"], g,
+         sig["tds_spike"], sig["cold_shock"], sig["overheat_un"], sig["human_tap"], sig["disturbance"],
+         sig["cooling_hot"], calm],
+        [rl, "flashlight-night", "glare", "tds-spike", "cold-shock", "uniform-overheat", "human-tap",
+         "disturbance", "cooling-hot", "calm"],
+        default="other")
+    return np.where(pump & mo, "manual-override", np.where(pump, pump_lbl, idle_lbl)).astype(object)
+
+def feature_columns(c: Dict[str, np.ndarray]) -> List[np.ndarray]:
+    return [c[k].astype(np.float64) if k in BOOL_COLS else c[k] for k in FEATURES]
+
+def label_one(c: Dict[str, np.ndarray], labeler: StreamLabeler) -> np.ndarray:
+    """Labels for a chunk of one device's rows, advancing that device's `labeler` past them.
+
+    Chunks must be fed in file order to the labeler that saw the device's earlier rows.
+    """
+    sig = labeler.signals(c)
+    return decide_labels(c, sig, reason_labels(c["reason"]), labeler.params)
+
+def label_chunks(chunks: Iterable[Dict[str, np.ndarray]], baselines: Dict[str, Tuple[float, float]],
+                 params: SignalParams = DEFAULT_PARAMS) -> Iterator[Tuple[List[np.ndarray], np.ndarray]]:
+    """Label the chunks of one file with a separate StreamLabeler per device; rows keep file order."""
+    labelers: Dict[str, StreamLabeler] = {}
+    def get(dev: str) -> StreamLabeler:
+        if dev not in labelers: labelers[dev] = StreamLabeler(params, *baselines.get(dev, (0.0, 1.0)))
+        return labelers[dev]
+    for c in chunks:
+        groups = split_devices(c["device"])
+        if groups[0][1] is None:
+            labels = label_one(c, get(groups[0][0]))
+        else:
+            labels = np.empty(len(c["ts"]), dtype=object)
+            for dev, idx in groups:
+                labels[idx] = label_one({k: v[idx] for k, v in c.items()}, get(dev))
+        yield feature_columns(c), labels
+
+def _write_labelled(csv_in: Path, f, params: SignalParams, chunk_rows: int) -> Dict[str, Any]:
+    baselines, rows = mic_baseline(csv_in, chunk_rows)
+    w = csv.writer(f); cnt: Counter = Counter()
+    for cols, labels in label_chunks(iter_csv_chunks(csv_in, chunk_rows), baselines, params):
+        lbl = labels.tolist()
+        w.writerows(zip(*[col.tolist() for col in cols], lbl))
+        cnt.update(lbl)
+    return {"file": str(csv_in), "rows": rows, "devices": sorted(baselines), "counts": cnt}
+
+def label_file(csv_in: Path = CSV_IN, csv_out: Path = CSV_OUT, params: SignalParams = DEFAULT_PARAMS,
+               chunk_rows: int = CHUNK_ROWS) -> Counter:
+    """Label one telemetry CSV into a training CSV with bounded memory; returns label counts."""
+    csv_in = Path(csv_in); csv_out = Path(csv_out)
+    if not any(p.exists() for p in log_parts(csv_in)):
+        raise SystemExit(f"Missing {csv_in}")
+    csv_out.parent.mkdir(exist_ok=True)
+    with csv_out.open("w", newline="") as f:
+        csv.writer(f).writerow(FEATURES + ["label"])
+        summary = _write_labelled(csv_in, f, params, chunk_rows)
+    if not summary["rows"]:
+        raise SystemExit(f"No data in {csv_in}")
+    return summary["counts"]
+
+def _label_part(job: Tuple[Path, Path, SignalParams, int]) -> Dict[str, Any]:
+    csv_in, part, params, chunk_rows = job
+    with part.open("w", newline="") as f:
+        return _write_labelled(csv_in, f, params, chunk_rows)
+
+def expand_inputs(patterns: Iterable[str]) -> List[Path]:
+    """Expand globs into a sorted, de-duplicated file list, so merge order never depends on the shell.
+
+    Rotated parts of a log that is itself listed are dropped: reading the log reads them too.
+    """
+    seen: Dict[str, Path] = {}
+    for pat in patterns:
+        hits = glob.glob(pat, recursive=True) if glob.has_magic(pat) else [pat]
+        if not hits: raise SystemExit(f"No files match {pat}")
+        for h in hits:
+            if not Path(h).is_file(): raise SystemExit(f"Missing {h}")
+            seen.setdefault(os.path.normpath(h), Path(h))
+    rotated = {os.path.normpath(q) for p in seen.values() for q in log_parts(p) if q != p}
+    return [seen[k] for k in sorted(seen) if k not in rotated]
+
+def label_files(inputs: List[Path], csv_out: Path = CSV_OUT, params: SignalParams = DEFAULT_PARAMS,
+                chunk_rows: int = CHUNK_ROWS, jobs: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Label many telemetry CSVs in a process pool and merge them into one training CSV.
+
+    Each file is labelled into its own part file; parts are concatenated in input order,
+    so the merged output is the same whatever the worker count or scheduling.
+    """
+    csv_out = Path(csv_out); csv_out.parent.mkdir(exist_ok=True)
+    parts = [csv_out.with_name(f".{csv_out.name}.part{i:04d}") for i in range(len(inputs))]
+    tmp = csv_out.with_name(f".{csv_out.name}.tmp")
+    work = [(Path(p), part, params, chunk_rows) for p, part in zip(inputs, parts)]
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(work)))
+    try:
+        if jobs == 1:
+            summaries = [_label_part(j) for j in work]
         else:
-            abrupt_dark_since_s = 0.0
-        abrupt_dark_day = (abrupt_dark_since_s >= SUDDEN_HOLD_SEC)
-
-    zr = z_mic(mic)
-    within_self_mask = False
-    if pump_on_at_s is not None and finite(cur["ts"]):
-        within_self_mask = (cur["ts"] - pump_on_at_s) < PUMP_SELF_MASK_SEC
-
-    ripple_now = (zr >= 1.0) and not within_self_mask
-    if ripple_now:
-        if disturb_since_s is None: disturb_since_s = 0.0
-        else: disturb_since_s += dt_s
-    else:
-        disturb_since_s = None
-
-    human_tap = False
-    disturbance = False
-    if disturb_since_s is not None:
-        dur = disturb_since_s
-        if (not pump) and (TAP_MIN_SEC <= dur <= TAP_MAX_SEC):
-            human_tap = True
-        if dur >= DISTURB_DWELL_SEC:
-            disturbance = True
-
-    cooling_hot = (finite(tMid) and tMid >= COOL_ON_C)
-
-    return dict(
-        cold_shock=cold_shock,
-        stratified=stratified,
-        inversion=inversion,
-        glare=glare,
-        heater_lamp=heater_lamp,
-        ambient_fire=ambient_fire,
-        overheat_un=overheat_un,
-        tds_spike=tds_spike,
-        baro_drop=baro_drop,
-        flashlight_night=flashlight_night,
-        abrupt_dark_day=abrupt_dark_day,
-        human_tap=human_tap,
-        disturbance=disturbance,
-        cooling_hot=cooling_hot,
-        zr=zr,
-        is_day=is_day,
-    )
-
-def decide_label(cur: Dict[str, Any], sig: Dict[str, bool], reason_lbl: str) -> str:
-    pump = cur["pump"]; m_override = cur["manual_override"]
-
-    if pump and m_override:
-        return "manual-override"
-    if pump and not m_override:
-        if reason_lbl in {"cooling-hot","cold-shock","tds-spike","uniform-overheat",
-                          "human-tap","disturbance","flashlight-night","glare"}:
-            return reason_lbl
-        if reason_lbl == "pump-hint":
-            return "pump-self"
-        if   sig["cooling_hot"]:      return "cooling-hot"
-        elif sig["tds_spike"]:        return "tds-spike"
-        elif sig["cold_shock"]:       return "cold-shock"
-        elif sig["overheat_un"]:      return "uniform-overheat"
-        elif sig["flashlight_night"]: return "flashlight-night"
-        elif sig["glare"] or sig["heater_lamp"]: return "glare"
-        else: return "pump-self"
-
-    if reason_lbl in VALID_LABELS and reason_lbl not in {"pump-self","manual-override"}:
-        return reason_lbl
-
-    if   sig["flashlight_night"]: return "flashlight-night"
-    elif sig["glare"] or sig["heater_lamp"]: return "glare"
-    elif sig["tds_spike"]:        return "tds-spike"
-    elif sig["cold_shock"]:       return "cold-shock"
-    elif sig["overheat_un"]:      return "uniform-overheat"
-    elif sig["human_tap"]:        return "human-tap"
-    elif sig["disturbance"]:      return "disturbance"
-    elif sig["cooling_hot"]:      return "cooling-hot"
-
-    L = cur["lux"]; zr = sig["zr"]
-    if (not finite(L) or L < 0.5*GLARE_LUX) and zr <= 1.0:
-        return "calm"
-    return "other"
-
-for i, r in enumerate(rows):
-    prev = rows[i-1] if i > 0 else None
-    dt_s = row_dt(prev, r) if prev else 1.0
-
-    sig = recompute_signals(i, prev, r, dt_s)
-
-    reason_lbl = map_reason_to_label(r["reason"])
-
-    lbl = decide_label(r, sig, reason_lbl)
-
-    feats.append([
-        r["micRMS"], r["lux"], r["tMid"], r["dT_tb"], r["DOproxy"], r["tds_mV"],
-        r["irObj"], r["irAmb"], r["airT"], r["airRH"], r["pressure_hPa"],
-        1.0 if r["pump"] else 0.0, 1.0 if r["manual_override"] else 0.0
-    ])
-    labels.append(lbl)
-
-CSV_OUT.parent.mkdir(exist_ok=True)
-with CSV_OUT.open("w", newline="") as f:
-    w = csv.writer(f)
-    w.writerow(FEATURES + ["label"])
-    for v, l in zip(feats, labels):
-        w.writerow(v + [l])
-
-cnt = Counter(labels)
-print(f"OK: wrote {CSV_OUT} rows={len(labels)}")
-print("Label counts:", dict(sorted(cnt.items(), key=lambda x: x[0])))
\ No newline at end of file
+            with ProcessPoolExecutor(max_workers=jobs) as ex:
+                summaries = list(ex.map(_label_part, work))
+        with tmp.open("w", newline="") as out:
+            csv.writer(out).writerow(FEATURES + ["label"])
+            for part in parts:
+                with part.open(newline="") as f: shutil.copyfileobj(f, out, 1 << 20)
+        os.replace(tmp, csv_out)
+    finally:
+        for p in parts + [tmp]:
+            if p.exists(): p.unlink()
+    return summaries
+
+# --- row-by-row reference (the original script), used for parity checks ---
+
+def read_rows(csv_in: Path) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    for part in log_parts(csv_in):
+        with open_text(part) as f:
+            for r in csv.DictReader(f):
+                rows.append({
+                    "ts": F(r,"ts"), "pump": B(r,"pump"), "manual_override": B(r,"manual_override"),
+                    "reason": (r.get("reason") or "").strip(), "device": (r.get("device") or "").strip(),
+                    **{k: F(r, k) for k in FLOAT_COLS if k != "ts"},
+                })
+    return rows
+
+def reference_labels(csv_in: Path, params: SignalParams = DEFAULT_PARAMS) -> Tuple[List[List[float]], List[str]]:
+    rows = read_rows(csv_in)
+    states: Dict[str, SignalState] = {}
+    for dev in dict.fromkeys(r["device"] for r in rows):
+        mic_vals = [r["micRMS"] for r in rows if r["device"] == dev and finite(r["micRMS"])]
+        mu_mic = stats.median(mic_vals) if mic_vals else 0.0
+        sd_mic = stats.pstdev(mic_vals) if len(mic_vals) > 1 else 1.0
+        states[dev] = SignalState(params, mu_mic, sd_mic or 1.0)
+    feats: List[List[float]] = []; labels: List[str] = []
+    for r in rows:
+        sig = states[r["device"]].step(r)
+        labels.append(decide_label(r, sig, map_reason_to_label(r["reason"]), params))
+        feats.append([(1.0 if r[k] else 0.0) if k in BOOL_COLS else r[k] for k in FEATURES])
+    return feats, labels
+
+def check_parity(csv_in: Path, params: SignalParams = DEFAULT_PARAMS, chunk_rows: int = CHUNK_ROWS) -> int:
+    """Compare the vectorized pipeline against the row-by-row reference; returns mismatching rows."""
+    ref_feats, ref_labels = reference_labels(csv_in, params)
+    baselines, _ = mic_baseline(csv_in, chunk_rows)
+    bad = 0; i = 0
+    for cols, labels in label_chunks(iter_csv_chunks(csv_in, chunk_rows), baselines, params):
+        for row, lbl in zip(zip(*[col.tolist() for col in cols]), labels.tolist()):
+            same = all(a == b or (a != a and b != b) for a, b in zip(row, ref_feats[i]))
+            if not same or lbl != ref_labels[i]:
+                if bad < 10: print(f"row {i}: vectorized={lbl} reference={ref_labels[i]}", file=sys.stderr)
+                bad += 1
+            i += 1
+    return bad + abs(i - len(ref_labels))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Label telemetry CSVs into one training CSV.")
+    ap.add_argument("inputs", nargs="*", default=[str(CSV_IN)], help="CSV files or quoted globs")
+    ap.add_argument("-o", "--out", type=Path, default=CSV_OUT)
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--check", action="store_true", help="verify against the row-by-row reference instead of writing")
+    ap.add_argument("--config", type=Path, default=None,
+                    help="device config JSON (e.g. ubiguard_config.json) whose thresholds override the defaults")
+    a = ap.parse_args(argv)
+    inputs = expand_inputs(a.inputs)
+    params = params_from_config(json.loads(a.config.read_text())) if a.config else DEFAULT_PARAMS
+    if a.check:
+        failed = 0
+        for p in inputs:
+            bad = check_parity(p, params, a.chunk_rows); failed += bool(bad)
+            print(f"parity {'OK' if not bad else 'FAILED'}: {p} mismatches={bad}")
+        return 1 if failed else 0
+    summaries = label_files(inputs, a.out, params, a.chunk_rows, a.jobs)
+    if not any(s["rows"] for s in summaries):
+        raise SystemExit(f"No data in {', '.join(map(str, inputs))}")
+    cnt: Counter = Counter()
+    for s in summaries:
+        cnt.update(s["counts"])
+        if len(summaries) > 1:
+            devs = ",".join(d or "-" for d in s["devices"])
+            print(f"  {s['file']}: rows={s['rows']} devices={devs} "
+                  + " ".join(f"{k}={v}" for k, v in sorted(s["counts"].items())))
+    print(f"OK: wrote {a.out} rows={sum(cnt.values())}")
+    print("Label counts:", dict(sorted(cnt.items(), key=lambda x: x[0])))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import os, sys, json, time, shutil, hashlib, argparse
+from pathlib import Path
+from collections import Counter
+from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from signals import SignalParams, DEFAULT_PARAMS, params_from_config
+from data_preprocessing import (
+    CHUNK_ROWS, FLOAT_COLS, BOOL_COLS, STR_COLS, BlockEMA, StreamLabeler, expand_inputs, iter_csv_chunks,
+    log_parts, mic_baseline, label_one, split_devices,
+)
+
+META_PATH = Path(__file__).resolve().parent.parent / "firmware" / "preprocess.json"
+CACHE_DIR = Path("data/features")
+FORMAT = 1
+DTDT_ROWS = 60        # dTdt_mid = tMid - tMid 60 rows earlier, as server/inference.py
+TDS_ALPHA = 0.01      # tds_delta = tds_mV - EMA(tds_mV), as server/inference.py
+DERIVED = ("dTdt_mid", "tds_delta")
+DROPNA = ("micRMS", "lux", "tMid", "dT_tb", "DOproxy", "tds_mV")   # rows train_model.ipynb drops
+HASH_BLOCK = 1 << 20
+
+def model_meta(path: Path = META_PATH) -> Tuple[List[str], List[str]]:
+    """(input_features, classes) the firmware model was exported with."""
+    meta = json.loads(Path(path).read_text(encoding="utf-8"))
+    return list(meta["input_features"]), list(meta["classes"])
+
+class _Derived:
+    """dTdt_mid / tds_delta for one device stream, carried across chunks (inference.derive_features)."""
+    def __init__(self):
+        self.tail = np.empty(0); self.ema = BlockEMA(TDS_ALPHA)
+
+    def push(self, c: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        t = c["tMid"]; n = len(t); k = len(self.tail)
+        ext = np.concatenate((self.tail, t)); j = np.arange(n) + k - DTDT_ROWS
+        with np.errstate(invalid="ignore"):
+            d = np.where(j >= 0, t - ext[np.clip(j, 0, None)], 0.0)
+        self.tail = ext[-DTDT_ROWS:]
+        tds = c["tds_mV"]; fin = np.isfinite(tds); delta = np.zeros(n)
+        delta[fin] = tds[fin] - self.ema(tds[fin])
+        return {"dTdt_mid": np.nan_to_num(d, nan=0.0), "tds_delta": delta}
+
+def feature_chunks(csv_in: Path, features: Sequence[str], classes: Sequence[str],
+                   params: SignalParams = DEFAULT_PARAMS,
+                   chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray, Counter]]:
+    """(float32 X, int8 y, label counts) per chunk of one telemetry CSV.
+
+    Labels come from the same per-device StreamLabeler as data_preprocessing.py; labels that
+    are not model classes count as "other", and rows with a missing core sensor are dropped.
+    """
+    extra = tuple(f for f in features if f not in FLOAT_COLS + BOOL_COLS + DERIVED)
+    other = classes.index("other") if "other" in classes else 0
+    code = {c: i for i, c in enumerate(classes)}
+    baselines, _ = mic_baseline(csv_in, chunk_rows)
+    labelers: Dict[str, StreamLabeler] = {}; derived: Dict[str, _Derived] = {}
+    for c in iter_csv_chunks(csv_in, chunk_rows, FLOAT_COLS + extra + BOOL_COLS + STR_COLS):
+        n = len(c["ts"])
+        labels = np.empty(n, dtype=object); der = {f: np.empty(n) for f in DERIVED}
+        for dev, idx in split_devices(c["device"]):
+            part = c if idx is None else {k: v[idx] for k, v in c.items()}
+            if dev not in labelers:
+                labelers[dev] = StreamLabeler(params, *baselines.get(dev, (0.0, 1.0))); derived[dev] = _Derived()
+            lbl = label_one(part, labelers[dev]); d = derived[dev].push(part)
+            if idx is None: labels = lbl; der = d
+            else:
+                labels[idx] = lbl
+                for f in DERIVED: der[f][idx] = d[f]
+        keep = np.logical_and.reduce([np.isfinite(c[k]) for k in DROPNA])
+        X = np.column_stack([der[f] if f in der else c[f] for f in features]).astype(np.float32)[keep]
+        kept = labels[keep]
+        y = np.array([code.get(s, other) for s in kept.tolist()], dtype=np.int8)
+        yield X, y, Counter(kept.tolist())
+
+# --- content-addressed cache ---
+
+def _digests(paths: Sequence[Path], cache_dir: Path) -> List[str]:
+    """sha256 of each file, remembered in `sources.json` by (size, mtime) so unchanged files are
+    hashed once, not on every run."""
+    memo_path = cache_dir / "sources.json"
+    try: memo = json.loads(memo_path.read_text())
+    except (OSError, ValueError): memo = {}
+    out = []; dirty = False
+    for p in paths:
+        st = p.stat(); key = str(p.resolve()); m = memo.get(key)
+        if not m or m["size"] != st.st_size or m["mtime_ns"] != st.st_mtime_ns:
+            h = hashlib.sha256()
+            with p.open("rb") as f:
+                for b in iter(lambda: f.read(HASH_BLOCK), b""): h.update(b)
+            m = memo[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}; dirty = True
+        out.append(m["sha256"])
+    if dirty:
+        tmp = memo_path.with_name(f".sources.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(memo)); os.replace(tmp, memo_path)
+    return out
+
+def cache_key(digests: Sequence[Sequence[str]], features: Sequence[str], classes: Sequence[str],
+              params: SignalParams) -> str:
+    spec = {"format": FORMAT, "sources": [list(d) for d in digests], "features": list(features),
+            "classes": list(classes), "params": asdict(params), "dtdt_rows": DTDT_ROWS,
+            "tds_alpha": TDS_ALPHA, "dropna": list(DROPNA)}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:24]
+
+class FeatureSet:
+    """A materialized feature matrix: `X` (rows, features) float32 and `y` int8 class indices,
+    both read-only memory maps, so opening one costs nothing however large it is."""
+    def __init__(self, path: Path, hit: bool = True):
+        self.path = Path(path); self.hit = hit
+        self.meta: Dict[str, Any] = json.loads((self.path / "meta.json").read_text())
+        n = self.meta["rows"]; k = len(self.meta["features"])
+        self.X = np.memmap(self.path / "X.f32", np.float32, "r", shape=(n, k)) if n else np.empty((0, k), np.float32)
+        self.y = np.memmap(self.path / "y.i8", np.int8, "r", shape=(n,)) if n else np.empty(0, np.int8)
+
+    @property
+    def key(self) -> str: return self.meta["key"]
+    @property
+    def features(self) -> List[str]: return self.meta["features"]
+    @property
+    def classes(self) -> List[str]: return self.meta["classes"]
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+def _write_part(job: Tuple[Path, Path, List[str], List[str], SignalParams, int]) -> Dict[str, Any]:
+    csv_in, part, features, classes, params, chunk_rows = job
+    rows = 0; cnt: Counter = Counter()
+    with part.with_suffix(".f32").open("wb") as fx, part.with_suffix(".i8").open("wb") as fy:
+        for X, y, c in feature_chunks(csv_in, features, classes, params, chunk_rows):
+            fx.write(X.tobytes()); fy.write(y.tobytes()); rows += len(y); cnt.update(c)
+    return {"file": str(csv_in), "rows": rows, "counts": cnt}
+
+def materialize(inputs: Sequence[Path], cache_dir: Path = CACHE_DIR, features: Optional[Sequence[str]] = None,
+                classes: Optional[Sequence[str]] = None, params: SignalParams = DEFAULT_PARAMS,
+                chunk_rows: int = CHUNK_ROWS, jobs: Optional[int] = None) -> FeatureSet:
+    """The FeatureSet for `inputs`, built once and then served from `cache_dir`.
+
+    The cache key hashes the input contents (rotated parts included), the feature list, the
+    classes and the labelling parameters, so a hit needs only a stat per file. A miss labels
+    the files in a process pool, each streaming its chunks into raw part files, and moves the
+    finished directory into place atomically; memory stays at one chunk per worker.
+    """
+    meta_f, meta_c = model_meta() if features is None or classes is None else (None, None)
+    features = list(features or meta_f); classes = list(classes or meta_c)
+    unknown = [f for f in features if f in STR_COLS]
+    if unknown: raise SystemExit(f"Not numeric features: {', '.join(unknown)}")
+    cache_dir = Path(cache_dir); cache_dir.mkdir(parents=True, exist_ok=True)
+    inputs = [Path(p) for p in inputs]
+    parts = [log_parts(p) for p in inputs]
+    for p, ps in zip(inputs, parts):
+        if not any(q.exists() for q in ps): raise SystemExit(f"Missing {p}")
+    digests = [_digests([q for q in ps if q.exists()], cache_dir) for ps in parts]
+    key = cache_key(digests, features, classes, params)
+    final = cache_dir / key
+    if (final / "meta.json").exists():
+        return FeatureSet(final)
+    tmp = cache_dir / f".{key}.{os.getpid()}.tmp"
+    if tmp.exists(): shutil.rmtree(tmp)
+    tmp.mkdir()
+    try:
+        work = [(p, tmp / f"part{i:04d}", features, classes, params, chunk_rows) for i, p in enumerate(inputs)]
+        jobs = max(1, min(jobs or os.cpu_count() or 1, len(work)))
+        t0 = time.perf_counter()
+        if jobs == 1:
+            summaries = [_write_part(j) for j in work]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as ex:
+                summaries = list(ex.map(_write_part, work))
+        for suffix, name in ((".f32", "X.f32"), (".i8", "y.i8")):
+            files = [w[1].with_suffix(suffix) for w in work]
+            if len(files) == 1: os.replace(files[0], tmp / name); continue
+            with (tmp / name).open("wb") as out:
+                for f in files:
+                    with f.open("rb") as src: shutil.copyfileobj(src, out, HASH_BLOCK)
+                    f.unlink()
+        cnt: Counter = Counter()
+        for s in summaries: cnt.update(s["counts"])
+        meta = {"key": key, "format": FORMAT, "features": features, "classes": classes,
+                "rows": sum(s["rows"] for s in summaries), "counts": dict(sorted(cnt.items())),
+                "sources": [{"file": s["file"], "rows": s["rows"], "sha256": d} for s, d in zip(summaries, digests)],
+                "params": asdict(params), "build_s": round(time.perf_counter() - t0, 3), "created": time.time()}
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=1))
+        try:
+            os.replace(tmp, final)
+        except OSError:
+            if not (final / "meta.json").exists(): raise   # otherwise another run built it first
+    finally:
+        if tmp.exists(): shutil.rmtree(tmp)
+    return FeatureSet(final, hit=False)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Materialize model features and labels as memory-mapped arrays.")
+    ap.add_argument("inputs", nargs="+", help="telemetry CSV files or quoted globs")
+    ap.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    ap.add_argument("--features", default=None, help="comma-separated (default: firmware/preprocess.json)")
+    ap.add_argument("--config", type=Path, default=None, help="device config JSON whose thresholds label the rows")
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    a = ap.parse_args(argv)
+    params = params_from_config(json.loads(a.config.read_text())) if a.config else DEFAULT_PARAMS
+    t0 = time.perf_counter()
+    fs = materialize(expand_inputs(a.inputs), a.cache_dir, a.features.split(",") if a.features else None,
+                     params=params, chunk_rows=a.chunk_rows, jobs=a.jobs)
+    print(f"{'hit' if fs.hit else 'built'} {fs.path} rows={len(fs)} features={','.join(fs.features)} "
+          f"in {time.perf_counter() - t0:.3f} s")
+    print("Label counts:", fs.meta["counts"])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import os, sys, json, math, time, argparse, itertools
+from pathlib import Path
+from collections import Counter
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from signals import SignalParams, CONFIG_MS_KEYS, params_from_config
+from data_preprocessing import (
+    CSV_IN, CHUNK_ROWS, FLOAT_COLS, BOOL_COLS, STR_COLS, StreamLabeler, decide_labels, reason_labels,
+    iter_csv_chunks, log_parts, mic_baseline, split_devices,
+)
+
+CONFIG_IN = Path("ubiguard_config.json")
+EXTRA_COLS = ("tTop", "tBot")
+
+# firmware constants the pump policy uses (esp32s3 2.ino)
+STRAT_DWELL_SEC     = 60.0
+MIN_ON_SEC          = 5.0
+SENSOR_FAULT_TICKS  = 5
+HOUR_WINDOW_SEC     = 3600.0
+NIGHT_RESET_SEC     = 600.0
+GENTLE_SEC          = 10.0
+GENTLE_COOLDOWN_SEC = 300.0
+BARO_MIN_TMID       = 20.0
+STRAT_REC_SEC       = 180.0
+LOW_C_REC_SEC       = 15.0
+BARO_REC_SEC        = 10.0
+
+@dataclass(frozen=True)
+class PumpParams:
+    """The pump-policy part of the device config; defaults are the firmware's `Config`."""
+    do_lo: float = 5.0
+    do_hi: float = 7.0
+    cap_hour_ms: float = 30 * 60 * 1000
+    cap_night_ms: float = 3 * 3600 * 1000
+    cool_on_c: float = 30.0
+    cool_off_c: float = 29.5
+    cool_burst_ms: float = 20000
+    ml_gate: bool = False
+
+PUMP_KEYS = {f.name for f in fields(PumpParams)}
+SIGNAL_KEYS = {f.name for f in fields(SignalParams)}
+
+def split_config(cfg: Dict[str, Any]) -> Tuple[SignalParams, PumpParams]:
+    """Detector thresholds and pump policy of one device config (keys as in ubiguard_config.json)."""
+    return params_from_config(cfg), PumpParams(**{k: v for k, v in cfg.items() if k in PUMP_KEYS})
+
+def load_config(path: Path) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text()) if Path(path).exists() else {}
+
+def load_series(csv_in: Path, chunk_rows: int = CHUNK_ROWS) -> List[Dict[str, Any]]:
+    """The recorded telemetry as one dict of columns per device, plus its mic baseline and row spacing."""
+    if not any(p.exists() for p in log_parts(csv_in)):
+        raise SystemExit(f"Missing {csv_in}")
+    baselines, _ = mic_baseline(csv_in, chunk_rows)
+    parts: Dict[str, List[Dict[str, np.ndarray]]] = {}
+    for c in iter_csv_chunks(csv_in, chunk_rows, FLOAT_COLS + EXTRA_COLS + BOOL_COLS + STR_COLS):
+        for dev, idx in split_devices(c["device"]):
+            parts.setdefault(dev, []).append(c if idx is None else {k: v[idx] for k, v in c.items()})
+    out = []
+    for dev, ps in parts.items():
+        c = {k: np.concatenate([p[k] for p in ps]) for k in ps[0]}
+        ts = c["ts"]
+        with np.errstate(invalid="ignore"):
+            d = np.diff(ts, prepend=np.nan)
+            c["dt"] = np.where(np.isfinite(d) & (d >= 0.2) & (d <= 5.0), d, 1.0)   # signals.row_dt
+        fin = ts[np.isfinite(ts)]
+        out.append({"device": dev, "cols": c, "mic": baselines.get(dev, (0.0, 1.0)),
+                    "span_s": float(fin[-1] - fin[0]) if len(fin) > 1 else 0.0})
+    return out
+
+_SERIES: List[Dict[str, Any]] = []
+
+def _init(series: List[Dict[str, Any]]) -> None:
+    global _SERIES
+    _SERIES = series; _signals.cache_clear()
+
+@lru_cache(maxsize=8)
+def _signals(i: int, sp: SignalParams) -> Dict[str, np.ndarray]:
+    """Detector signals of series `i`; they do not depend on the pump policy, so a sweep over pump
+    keys reuses them. The pump-dependent ones (ripple, tap, disturbance) are redone by `simulate`."""
+    s = _SERIES[i]
+    return StreamLabeler(sp, *s["mic"]).signals(s["cols"])
+
+def simulate(c: Dict[str, np.ndarray], sig: Dict[str, np.ndarray], sp: SignalParams,
+             pp: PumpParams) -> Dict[str, Any]:
+    """Run the firmware's alert and pump-recommendation rules over one recorded stream.
+
+    One tick per row, with the recorded sensors and the given config: blockers, reason chain,
+    cooling hysteresis, stratification dwell, DO*/baro/night-mild bursts, hourly and nightly
+    duty caps, minimum on-time and auto-off all follow loop() in the firmware, driving a
+    simulated pump in place of the recorded one. Not modelled: the ML gate, manual
+    overrides, and the firmware restarting its TDS / abrupt-dark timers when the pump stops.
+    """
+    ts = c["ts"].tolist(); dt = c["dt"].tolist(); tMid = c["tMid"].tolist()
+    tTop = c["tTop"].tolist(); tBot = c["tBot"].tolist(); doc = c["DOproxy"].tolist()
+    with np.errstate(invalid="ignore"):
+        dark_v = (c["lux"] < sp.night_lux).tolist()
+        hazard = (sig["heater_lamp"] | sig["flashlight_night"] | sig["abrupt_dark_day"] | sig["tds_spike"]
+                  | sig["cold_shock"]).tolist()
+        baro_v = (sig["baro_drop"] & (c["tMid"] >= BARO_MIN_TMID)).tolist()
+    zr = sig["zr"].tolist(); strat_v = sig["stratified"].tolist(); inv_v = sig["inversion"].tolist()
+    heat = sig["heater_lamp"].tolist(); flash = sig["flashlight_night"].tolist()
+    adark = sig["abrupt_dark_day"].tolist(); tds = sig["tds_spike"].tolist()
+    cold = sig["cold_shock"].tolist(); over = sig["overheat_un"].tolist()
+    n = len(ts)
+    pump = np.zeros(n, bool); alert = np.zeros(n, bool)
+    tap_a = np.zeros(n, bool); dist_a = np.zeros(n, bool); reasons: List[str] = [""] * n
+    burst = pp.cool_burst_ms / 1000.0; cap_h = pp.cap_hour_ms / 1000.0; cap_n = pp.cap_night_ms / 1000.0
+    mask = sp.pump_self_mask_sec; tap_lo = sp.tap_min_sec; tap_hi = sp.tap_max_sec; dwell = sp.disturb_dwell_sec
+    active = False; on_at = off_at = 0.0; disturb = strat_s = inv_s = None; fault = 0
+    hour_at = ts[0] if n and ts[0] == ts[0] else 0.0
+    duty_h = duty_n = pump_s = 0.0; was_dark = False; bright_at = None; gentle_at = -math.inf
+    starts: Counter = Counter(); alerts: Counter = Counter(); caps: Counter = Counter()
+    prev_alert = False; blocked_off = 0
+    for i in range(n):
+        t = ts[i]; d = dt[i]; tm = tMid[i]
+        if active and t >= off_at:
+            active = False; disturb = None
+        fault = fault + 1 if (tTop[i] != tTop[i] or tm != tm or tBot[i] != tBot[i]) else 0
+        sensor_fault = fault >= SENSOR_FAULT_TICKS
+        strat_s = (0.0 if strat_s is None else strat_s + d) if strat_v[i] else None
+        inv_s = (0.0 if inv_s is None else inv_s + d) if inv_v[i] else None
+        dark = dark_v[i]
+        if t - hour_at >= HOUR_WINDOW_SEC:
+            hour_at = t - (t - hour_at) % HOUR_WINDOW_SEC; duty_h = 0.0
+        if active:
+            duty_h += d; pump_s += d
+            if dark: duty_n += d
+        if dark:
+            was_dark = True; bright_at = None
+        elif was_dark:
+            if bright_at is None: bright_at = t
+            if t - bright_at >= NIGHT_RESET_SEC: duty_n = 0.0; was_dark = False; bright_at = None
+        if zr[i] >= 1.0 and not (active and t - on_at < mask):
+            disturb = 0.0 if disturb is None else disturb + d
+        else:
+            disturb = None
+        tap = disturb is not None and not active and tap_lo <= disturb <= tap_hi
+        dist = disturb is not None and disturb >= dwell
+        blockers = sensor_fault or hazard[i] or tap or dist
+
+        reason = "none"
+        if sensor_fault: reason = "safe_hold_sensor"
+        elif flash[i]: reason = "flashlight_night"
+        elif adark[i]: reason = "abrupt_dark_day"
+        elif heat[i]: reason = "heater_lamp"
+        elif tds[i]: reason = "tds_spike"
+        elif cold[i]: reason = "cold_shock"
+        elif over[i]: reason = "uniform_overheat"
+        elif tap: reason = "human_tap"
+        elif dist: reason = "disturbance"
+        help_ = False; rec = 0.0
+        if not blockers:
+            if tm >= pp.cool_on_c:
+                help_ = True; rec = burst
+                reason = "cooling_hot" if reason == "none" else reason + "_cooling"
+            stratified = strat_s is not None and strat_s >= STRAT_DWELL_SEC
+            if stratified or (inv_s is not None and inv_s >= STRAT_DWELL_SEC):
+                help_ = True; rec = max(rec, STRAT_REC_SEC)
+                tag = "strat" if stratified else "inv"
+                reason = (tag if stratified else "inversion") if reason == "none" else f"{reason}_{tag}"
+            dc = doc[i]
+            if dc <= pp.do_lo:
+                help_ = True; rec = max(rec, LOW_C_REC_SEC)
+                reason = "low_Cstar" if reason == "none" else reason + "_lowC*"
+            if baro_v[i] and dc <= pp.do_hi:
+                help_ = True; rec = max(rec, BARO_REC_SEC)
+                reason = "baro_drop" if reason == "none" else reason + "_baro"
+            if (dark and zr[i] < 1.0 and not active and pp.do_lo < dc <= pp.do_hi
+                    and t - gentle_at >= GENTLE_COOLDOWN_SEC):
+                help_ = True; rec = max(rec, GENTLE_SEC)
+                if reason == "none": reason = "night_mild"
+        if tm <= pp.cool_off_c and help_ and rec == burst:
+            help_ = False; rec = 0.0
+        if help_ and rec > 0:
+            cap = "cap_hour" if duty_h >= cap_h else ("cap_night" if was_dark and duty_n >= cap_n else None)
+            if cap:
+                reason = cap if reason == "none" else f"{reason}_{cap}"
+                help_ = False; rec = 0.0; caps[cap] += 1
+        if blockers and active:
+            if t - on_at >= MIN_ON_SEC or sensor_fault:
+                active = False; disturb = None; blocked_off += 1
+        elif help_ and not active and rec > 0:
+            active = True; on_at = t; off_at = t + rec
+            if "night_mild" in reason: gentle_at = t
+            starts[reason] += 1
+        elif not help_ and active:
+            if t - on_at >= MIN_ON_SEC and (hazard[i] or sensor_fault):
+                active = False; disturb = None; blocked_off += 1
+
+        al = sensor_fault or hazard[i] or over[i]
+        if al and not prev_alert: alerts[reason] += 1
+        prev_alert = al
+        pump[i] = active; alert[i] = al; tap_a[i] = tap; dist_a[i] = dist
+        reasons[i] = reason if (al or help_) else ("human_tap" if tap else ("disturbance" if dist else "none"))
+
+    labels = decide_labels({"pump": pump, "manual_override": np.zeros(n, bool), "lux": c["lux"]},
+                           {**sig, "human_tap": tap_a, "disturbance": dist_a},
+                           reason_labels(np.array(reasons, dtype=object)), sp)
+    return {"samples": n, "alert_samples": int(alert.sum()), "alerts": alerts, "pump_on_s": pump_s,
+            "pump_starts": starts, "pump_off_blocked": blocked_off, "cap_blocked": caps,
+            "labels": Counter(labels.tolist())}
+
+def recorded(c: Dict[str, np.ndarray], sig: Dict[str, np.ndarray], sp: SignalParams) -> Dict[str, Any]:
+    """The same figures for what the device actually did (its pump column and reasons)."""
+    pump = c["pump"]
+    rising = pump & ~np.concatenate(([False], pump[:-1]))
+    labels = decide_labels(c, sig, reason_labels(c["reason"]), sp)
+    return {"samples": len(pump), "pump_on_s": float(c["dt"][pump].sum()),
+            "pump_starts": Counter(c["reason"][rising].tolist()), "labels": Counter(labels.tolist())}
+
+def _merge(acc: Dict[str, Any], r: Dict[str, Any]) -> Dict[str, Any]:
+    for k, v in r.items():
+        if k not in acc: acc[k] = Counter(v) if isinstance(v, Counter) else v
+        else: acc[k] += v
+    return acc
+
+def _finish(r: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for k, v in r.items():
+        if isinstance(v, Counter):
+            out[k] = dict(sorted(v.items()))
+            if k in ("alerts", "pump_starts", "cap_blocked"): out[k + "_total"] = sum(v.values())
+        else:
+            out[k] = round(v, 1) if isinstance(v, float) else v
+    return out
+
+def _run_one(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    sp, pp = split_config(cfg)
+    acc: Dict[str, Any] = {}
+    t0 = time.perf_counter()
+    for i, s in enumerate(_SERIES):
+        _merge(acc, simulate(s["cols"], _signals(i, sp), sp, pp))
+    return {**_finish(acc), "secs": round(time.perf_counter() - t0, 4)}
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Every combination of the grid values; detector keys vary slowest so consecutive
+    configs share their signals."""
+    bad = sorted(set(grid) - SIGNAL_KEYS - PUMP_KEYS - set(CONFIG_MS_KEYS))
+    if bad: raise SystemExit(f"Unknown config keys: {', '.join(bad)}")
+    keys = sorted(grid, key=lambda k: (k in PUMP_KEYS and k not in SIGNAL_KEYS, k))
+    return [dict(zip(keys, vals)) for vals in itertools.product(*(grid[k] for k in keys))]
+
+def sweep(series: List[Dict[str, Any]], base: Dict[str, Any], grid: Dict[str, List[Any]],
+          jobs: Optional[int] = None) -> Dict[str, Any]:
+    """Replay `series` once per grid point (applied over the `base` config) in a process pool.
+
+    The recorded data is sent to each worker once, at start-up; results come back in grid order.
+    """
+    points = expand_grid(grid) or [{}]
+    cfgs = [{**base, **p} for p in points]
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(cfgs)))
+    t0 = time.perf_counter()
+    if jobs == 1:
+        _init(series); results = [_run_one(c) for c in cfgs]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init, initargs=(series,)) as ex:
+            results = list(ex.map(_run_one, cfgs, chunksize=max(1, len(cfgs) // (jobs * 4))))
+    wall = time.perf_counter() - t0
+    _init(series)
+    sp = params_from_config(base)
+    rec: Dict[str, Any] = {}
+    for i, s in enumerate(series): _merge(rec, recorded(s["cols"], _signals(i, sp), sp))
+    rows = sum(len(s["cols"]["ts"]) for s in series); span = sum(s["span_s"] for s in series)
+    return {"base": base, "grid": grid, "devices": [s["device"] or "-" for s in series], "rows": rows,
+            "span_s": round(span, 1), "configs": len(cfgs), "jobs": jobs, "wall_s": round(wall, 3),
+            "samples_per_s": round(rows * len(cfgs) / wall) if wall else None,
+            "speedup": round(span * len(cfgs) / wall) if wall else None,
+            "recorded": _finish(rec),
+            "results": [{"config": p, **r} for p, r in zip(points, results)]}
+
+def _value(s: str) -> Any:
+    try: return json.loads(s)
+    except ValueError: return s
+
+def parse_grid(specs: Iterable[str], grid_file: Optional[Path] = None) -> Dict[str, List[Any]]:
+    grid: Dict[str, List[Any]] = json.loads(Path(grid_file).read_text()) if grid_file else {}
+    for spec in specs:
+        k, sep, vals = spec.partition("=")
+        if not sep or not vals: raise SystemExit(f"Bad --grid {spec!r}, expected key=v1,v2,...")
+        grid[k.strip()] = [_value(v) for v in vals.split(",")]
+    return grid
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Replay recorded telemetry through the alert and pump rules "
+                                             "for a grid of config values.")
+    ap.add_argument("input", nargs="?", default=str(CSV_IN), help="telemetry CSV (rotated parts are read too)")
+    ap.add_argument("--config", type=Path, default=CONFIG_IN, help="base device config JSON")
+    ap.add_argument("--grid", action="append", default=[], metavar="KEY=V1,V2", help="values to sweep (repeatable)")
+    ap.add_argument("--grid-file", type=Path, default=None, help='JSON {"key": [values], ...}')
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    ap.add_argument("-o", "--out", type=Path, default=None, help="write the full report as JSON")
+    a = ap.parse_args(argv)
+    grid = parse_grid(a.grid, a.grid_file)
+    series = load_series(Path(a.input))
+    rep = sweep(series, load_config(a.config), grid, a.jobs)
+    if a.out:
+        a.out.write_text(json.dumps(rep, indent=1))
+    print(f"replayed {rep['rows']} rows ({rep['span_s'] / 3600:.1f} h) x {rep['configs']} configs "
+          f"in {rep['wall_s']} s on {rep['jobs']} workers: {rep['samples_per_s']} samples/s, "
+          f"{rep['speedup']}x real time")
+    r = rep["recorded"]
+    print(f"  recorded: pump_on_s={r['pump_on_s']} pump_starts={r['pump_starts_total']}")
+    for res in rep["results"]:
+        cfg = " ".join(f"{k}={v}" for k, v in res["config"].items()) or "(base)"
+        top = ", ".join(f"{k}={v}" for k, v in sorted(res["labels"].items(), key=lambda kv: -kv[1])[:4])
+        print(f"  {cfg}: alerts={res['alerts_total']} pump_on_s={res['pump_on_s']} "
+              f"pump_starts={res['pump_starts_total']} caps={res['cap_blocked_total']} labels: {top}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
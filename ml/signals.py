@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import math
+from collections import deque
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, Optional, Tuple
+
+NIGHT_LUX            = 30.0
+GLARE_LUX            = 2000.0
+IR_DELTA_HOT         = 5.0
+IR_ABS_HOT           = 45.0
+AIR_FIRE_ABS         = 50.0
+AIR_HOT_T            = 40.0
+AIR_HOT_LOW_RH       = 15.0
+DT_STRAT             = 1.0
+DT_INV               = -0.8
+DT60_COLD            = -0.5
+TDS_JUMP_ABS         = 200.0
+TDS_JUMP_FRAC        = 0.25
+TDS_DWELL_SEC        = 10
+DAY_ON_FACTOR        = 5.0
+SUDDEN_LIGHT_FACTOR  = 10.0
+SUDDEN_DARK_FACTOR   = 0.2
+SUDDEN_WINDOW_SEC    = 3
+SUDDEN_HOLD_SEC      = 3
+P_DROP_HPA           = 6.0
+OVERHEAT_UN          = 30.0
+COOL_ON_C            = 30.0
+COOL_OFF_C           = 29.5
+TAP_MIN_SEC          = 0.7
+TAP_MAX_SEC          = 2.0
+DISTURB_DWELL_SEC    = 5.0
+PUMP_SELF_MASK_SEC   = 8.0
+
+TMID_WINDOW          = 60
+BARO_WINDOW_SEC      = 3 * 3600
+TDS_EMA_ALPHA        = 0.01
+
+VALID_LABELS = {
+    "calm","cold-shock","cooling-hot","disturbance","flashlight-night","glare",
+    "human-tap","manual-override","other","pump-self","tds-spike","uniform-overheat"
+}
+PUMP_REASON_LABELS = {"cooling-hot","cold-shock","tds-spike","uniform-overheat",
+                      "human-tap","disturbance","flashlight-night","glare"}
+
+@dataclass(frozen=True)
+class SignalParams:
+    night_lux: float = NIGHT_LUX
+    glare_lux: float = GLARE_LUX
+    ir_delta_hot: float = IR_DELTA_HOT
+    ir_abs_hot: float = IR_ABS_HOT
+    air_fire_abs: float = AIR_FIRE_ABS
+    air_hot_t: float = AIR_HOT_T
+    air_hot_low_rh: float = AIR_HOT_LOW_RH
+    dt_strat: float = DT_STRAT
+    dt_inv: float = DT_INV
+    dt60_cold: float = DT60_COLD
+    tds_jump_abs: float = TDS_JUMP_ABS
+    tds_jump_frac: float = TDS_JUMP_FRAC
+    tds_dwell_sec: float = TDS_DWELL_SEC
+    day_on_factor: float = DAY_ON_FACTOR
+    sudden_light_factor: float = SUDDEN_LIGHT_FACTOR
+    sudden_dark_factor: float = SUDDEN_DARK_FACTOR
+    sudden_window_sec: float = SUDDEN_WINDOW_SEC
+    sudden_hold_sec: float = SUDDEN_HOLD_SEC
+    p_drop_hpa: float = P_DROP_HPA
+    overheat_un: float = OVERHEAT_UN
+    cool_on_c: float = COOL_ON_C
+    cool_off_c: float = COOL_OFF_C
+    tap_min_sec: float = TAP_MIN_SEC
+    tap_max_sec: float = TAP_MAX_SEC
+    disturb_dwell_sec: float = DISTURB_DWELL_SEC
+    pump_self_mask_sec: float = PUMP_SELF_MASK_SEC
+    tmid_window: int = TMID_WINDOW
+    baro_window_sec: float = BARO_WINDOW_SEC
+    tds_ema_alpha: float = TDS_EMA_ALPHA
+
+    @property
+    def lux_hist_len(self) -> int:
+        return max(5, int(self.sudden_window_sec) + 1)
+
+    @property
+    def day_on_lux(self) -> float:
+        return self.night_lux * max(2.0, self.day_on_factor)
+
+    def with_overrides(self, **kw: Any) -> "SignalParams":
+        names = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in kw.items() if k in names})
+
+DEFAULT_PARAMS = SignalParams()
+
+# device config keys (ubiguard_config.json, GET /config/get) kept in ms where SignalParams uses seconds
+CONFIG_MS_KEYS = {"sudden_window_ms": "sudden_window_sec"}
+
+def params_from_config(cfg: Dict[str, Any], base: SignalParams = DEFAULT_PARAMS) -> SignalParams:
+    """`base` with the thresholds of a device config applied; pump-only keys are ignored."""
+    kw = {CONFIG_MS_KEYS.get(k, k): (v / 1000.0 if k in CONFIG_MS_KEYS else v) for k, v in cfg.items()}
+    return base.with_overrides(**kw)
+
+def finite(x: Any) -> bool:
+    try: return math.isfinite(x)
+    except Exception: return False
+
+def map_reason_to_label(reason: str) -> str:
+    r = (reason or "").strip().lower()
+    if r in ("", "none"):
+        return "none"
+
+    exact = {
+        "cold_shock": "cold-shock",
+        "tds_spike": "tds-spike",
+        "uniform_overheat": "uniform-overheat",
+        "cooling_hot": "cooling-hot",
+        "human_tap": "human-tap",
+        "disturbance": "disturbance",
+        "flashlight_night": "flashlight-night",
+        "heater_lamp": "glare",
+    }
+    if r in exact: return exact[r]
+
+    if "cooling_hot" in r: return "cooling-hot"
+    if "flashlight" in r and "night" in r: return "flashlight-night"
+    if "heater_lamp" in r: return "glare"
+    if "cold_shock" in r: return "cold-shock"
+    if "tds_spike" in r: return "tds-spike"
+    if "uniform_overheat" in r: return "uniform-overheat"
+
+    if ("strat" in r) or ("inv" in r) or ("lowc" in r) or ("baro" in r) or ("night_mild" in r):
+        return "pump-hint"
+
+    if "safe_hold_sensor" in r or "abrupt_dark" in r:
+        return "other"
+
+    return "other"
+
+def decide_label(cur: Dict[str, Any], sig: Dict[str, Any], reason_lbl: str,
+                 params: SignalParams = DEFAULT_PARAMS) -> str:
+    pump = cur["pump"]; m_override = cur["manual_override"]
+
+    if pump and m_override:
+        return "manual-override"
+    if pump and not m_override:
+        if reason_lbl in PUMP_REASON_LABELS:
+            return reason_lbl
+        if reason_lbl == "pump-hint":
+            return "pump-self"
+        if   sig["cooling_hot"]:      return "cooling-hot"
+        elif sig["tds_spike"]:        return "tds-spike"
+        elif sig["cold_shock"]:       return "cold-shock"
+        elif sig["overheat_un"]:      return "uniform-overheat"
+        elif sig["flashlight_night"]: return "flashlight-night"
+        elif sig["glare"] or sig["heater_lamp"]: return "glare"
+        else: return "pump-self"
+
+    if reason_lbl in VALID_LABELS and reason_lbl not in {"pump-self","manual-override"}:
+        return reason_lbl
+
+    if   sig["flashlight_night"]: return "flashlight-night"
+    elif sig["glare"] or sig["heater_lamp"]: return "glare"
+    elif sig["tds_spike"]:        return "tds-spike"
+    elif sig["cold_shock"]:       return "cold-shock"
+    elif sig["overheat_un"]:      return "uniform-overheat"
+    elif sig["human_tap"]:        return "human-tap"
+    elif sig["disturbance"]:      return "disturbance"
+    elif sig["cooling_hot"]:      return "cooling-hot"
+
+    L = cur["lux"]; zr = sig["zr"]
+    if (not finite(L) or L < 0.5*params.glare_lux) and zr <= 1.0:
+        return "calm"
+    return "other"
+
+def row_dt(prev_ts: Optional[float], cur_ts: float) -> float:
+    if finite(prev_ts) and finite(cur_ts):
+        dt = cur_ts - prev_ts
+        if 0.2 <= dt <= 5.0:
+            return float(dt)
+    return 1.0
+
+class SignalState:
+    """Per-stream detector state: one `update` per sample, O(1) amortized.
+
+    This is the reference implementation of the labelling rules; the vectorized pipeline in
+    data_preprocessing.py must agree with it row for row. `mic_mu`/`mic_sd` set the micRMS
+    baseline used for the ripple z-score.
+    """
+    def __init__(self, params: SignalParams = DEFAULT_PARAMS, mic_mu: float = 0.0, mic_sd: float = 1.0):
+        self.params = params
+        self.mic_mu = mic_mu; self.mic_sd = mic_sd or 1.0
+        self.win_tMid = deque(maxlen=params.tmid_window)
+        self.lux_hist: deque = deque(maxlen=params.lux_hist_len)
+        self.baro_hist: deque[Tuple[float, float]] = deque()
+        self.tds_base: Optional[float] = None
+        self.tds_since_s = 0.0
+        self.abrupt_dark_since_s = 0.0
+        self.disturb_since_s: Optional[float] = None
+        self.pump_on_at_s: Optional[float] = None
+        self.is_day = False
+        self.day_switch_ts: Optional[float] = None
+        self.prev_ts: Optional[float] = None
+        self.samples = 0
+
+    def z_mic(self, x: float) -> float:
+        return 0.0 if not finite(x) else (x - self.mic_mu) / self.mic_sd
+
+    def step(self, cur: Dict[str, Any]) -> Dict[str, Any]:
+        dt_s = row_dt(self.prev_ts, cur["ts"]) if self.samples else 1.0
+        self.prev_ts = cur["ts"]; self.samples += 1
+        return self.update(cur, dt_s)
+
+    def update(self, cur: Dict[str, Any], dt_s: float) -> Dict[str, Any]:
+        p = self.params
+        mic = cur["micRMS"]; lux = cur["lux"]; tMid = cur["tMid"]; dT = cur["dT_tb"]
+        irO = cur["irObj"];  irA = cur["irAmb"]; airT = cur["airT"]; RH = cur["airRH"]
+        tds = cur["tds_mV"]; P   = cur["pressure_hPa"]
+        pump = cur["pump"]
+
+        if pump and self.pump_on_at_s is None:
+            self.pump_on_at_s = cur["ts"] if finite(cur["ts"]) else 0.0
+        if not pump:
+            self.pump_on_at_s = None
+
+        self.win_tMid.append(tMid)
+        cold_shock = False
+        if len(self.win_tMid) == self.win_tMid.maxlen and finite(tMid) and finite(self.win_tMid[0]):
+            cold_shock = (tMid - self.win_tMid[0]) <= p.dt60_cold
+
+        stratified = (finite(dT) and dT > p.dt_strat)
+        inversion  = (finite(dT) and dT < p.dt_inv)
+
+        glare = (finite(lux) and lux >= p.glare_lux)
+        heater_lamp = glare and (
+            (finite(irO) and finite(irA) and (irO - irA) >= p.ir_delta_hot) or
+            (finite(irO) and irO >= p.ir_abs_hot)
+        )
+
+        ambient_fire = (finite(airT) and airT >= p.air_fire_abs) or \
+                       (finite(airT) and finite(RH) and (airT >= p.air_hot_t and RH <= p.air_hot_low_rh))
+        overheat_un = (finite(tMid) and tMid > p.overheat_un and (finite(dT) and abs(dT) < 0.3))
+
+        if finite(tds):
+            if self.tds_base is None: self.tds_base = tds
+            self.tds_base = (1 - p.tds_ema_alpha)*self.tds_base + p.tds_ema_alpha*tds
+        tds_spike_now = (finite(tds) and self.tds_base is not None and
+                         (tds - self.tds_base) > max(p.tds_jump_abs, p.tds_jump_frac * self.tds_base))
+        if tds_spike_now: self.tds_since_s += dt_s
+        else:             self.tds_since_s = 0.0
+        tds_spike = (self.tds_since_s >= p.tds_dwell_sec)
+
+        if finite(P) and finite(cur["ts"]):
+            self.baro_hist.append((cur["ts"], P))
+            cutoff = cur["ts"] - p.baro_window_sec
+            while self.baro_hist and self.baro_hist[0][0] < cutoff:
+                self.baro_hist.popleft()
+        baro_drop = False
+        if self.baro_hist:
+            p_now = self.baro_hist[-1][1]; p_old = self.baro_hist[0][1]
+            if finite(p_now) and finite(p_old):
+                baro_drop = (p_old - p_now) >= p.p_drop_hpa
+
+        if not self.is_day and finite(lux) and lux > p.day_on_lux:
+            self.is_day = True; self.day_switch_ts = cur["ts"]
+        if self.is_day and finite(lux) and lux < p.night_lux:
+            self.is_day = False; self.day_switch_ts = cur["ts"]
+
+        self.lux_hist.append((cur["ts"], lux if finite(lux) else 0.0))
+        flashlight_night = False
+        abrupt_dark_day  = False
+        if len(self.lux_hist) >= 2:
+            t_now, L_now = self.lux_hist[-1]
+            base_L = L_now
+            for t, L in reversed(self.lux_hist):
+                base_L = L
+                if not finite(t_now) or not finite(t): break
+                if (t_now - t) >= p.sudden_window_sec: break
+            ratio_up = (L_now/base_L) if base_L > 0 else (999.0 if L_now > 0 else 1.0)
+            ratio_down = (base_L/L_now) if L_now > 0 else 1.0
+
+            if (not self.is_day) and (ratio_up >= p.sudden_light_factor):
+                flashlight_night = True
+
+            if self.is_day and (ratio_down <= p.sudden_dark_factor):
+                self.abrupt_dark_since_s += dt_s
+            else:
+                self.abrupt_dark_since_s = 0.0
+            abrupt_dark_day = (self.abrupt_dark_since_s >= p.sudden_hold_sec)
+
+        zr = self.z_mic(mic)
+        within_self_mask = False
+        if self.pump_on_at_s is not None and finite(cur["ts"]):
+            within_self_mask = (cur["ts"] - self.pump_on_at_s) < p.pump_self_mask_sec
+
+        ripple_now = (zr >= 1.0) and not within_self_mask
+        if ripple_now:
+            if self.disturb_since_s is None: self.disturb_since_s = 0.0
+            else: self.disturb_since_s += dt_s
+        else:
+            self.disturb_since_s = None
+
+        human_tap = False
+        disturbance = False
+        if self.disturb_since_s is not None:
+            dur = self.disturb_since_s
+            if (not pump) and (p.tap_min_sec <= dur <= p.tap_max_sec):
+                human_tap = True
+            if dur >= p.disturb_dwell_sec:
+                disturbance = True
+
+        cooling_hot = (finite(tMid) and tMid >= p.cool_on_c)
+
+        return dict(
+            cold_shock=cold_shock,
+            stratified=stratified,
+            inversion=inversion,
+            glare=glare,
+            heater_lamp=heater_lamp,
+            ambient_fire=ambient_fire,
+            overheat_un=overheat_un,
+            tds_spike=tds_spike,
+            baro_drop=baro_drop,
+            flashlight_night=flashlight_night,
+            abrupt_dark_day=abrupt_dark_day,
+            human_tap=human_tap,
+            disturbance=disturbance,
+            cooling_hot=cooling_hot,
+            zr=zr,
+            is_day=self.is_day,
+        )
@@ -0,0 +1,25 @@
+"""The chunked StreamLabeler pipeline labels recorded telemetry exactly like the row-by-row SignalState.
+
+Run from ml/: python -m pytest -q
+"""
+import csv, random
+from pathlib import Path
+
+import pytest
+
+from data_preprocessing import check_parity
+
+RECORDED = Path(__file__).resolve().parent.parent / "server" / "data" / "old"
+
+@pytest.mark.parametrize("name", ["telemetry_b_test.csv", "telemetry_test.csv"])
+@pytest.mark.parametrize("chunk_rows", [777, 65536])
+def test_recorded_file_has_no_mismatches(name, chunk_rows):
+    assert check_parity(RECORDED / name, chunk_rows=chunk_rows) == 0
+
+def test_interleaved_devices_have_no_mismatches(tmp_path):
+    rng = random.Random(5); src = tmp_path / "telemetry.csv"
+    with (RECORDED / "telemetry_b_test.csv").open(newline="") as f, src.open("w", newline="") as out:
+        rdr = csv.DictReader(f)
+        w = csv.DictWriter(out, fieldnames=list(rdr.fieldnames) + ["device"]); w.writeheader()
+        for r in rdr: w.writerow(dict(r, device=rng.choice(["pond-a", "pond-b", "pond-c"])))
+    assert check_parity(src, chunk_rows=1000) == 0
@@ -0,0 +1,121 @@
+import random, asyncio, collections
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+DISCORD_MAX_EMBEDS = 10
+DISCORD_MAX_CHARS = 6000   # all embeds of one message together
+EMBED_TEXT_KEYS = ("title", "description")
+
+def embed_chars(embed: Dict[str, Any]) -> int:
+    """Characters of an embed as Discord counts them against DISCORD_MAX_CHARS."""
+    n = sum(len(str(embed.get(k) or "")) for k in EMBED_TEXT_KEYS)
+    n += sum(len(str(f.get("name") or "")) + len(str(f.get("value") or "")) for f in embed.get("fields") or [])
+    n += len(str((embed.get("footer") or {}).get("text") or "")) + len(str((embed.get("author") or {}).get("name") or ""))
+    return n
+
+class DiscordDispatcher:
+    """Asyncio webhook sender: bounded drop-oldest queue, burst coalescing, 429/backoff retries.
+
+    `enqueue` never blocks and never does I/O, so it is safe to call from request handlers.
+    A single worker task drains the queue through one pooled `httpx.AsyncClient`.
+    """
+    def __init__(self, url_fn: Callable[[], str], username: str = "UBi-Guardian",
+                 max_queue: int = 500, coalesce_secs: float = 0.5, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, timeout: float = 6.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url_fn = url_fn; self.username = username
+        self.coalesce_secs = coalesce_secs; self.max_retries = max_retries
+        self.backoff_base = backoff_base; self.backoff_max = backoff_max; self.timeout = timeout
+        self.transport = transport   # tests plug in an httpx.MockTransport webhook
+        self._q: Deque[Dict[str, Any]] = collections.deque(maxlen=max_queue)
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._busy = False   # a batch taken off the queue is being sent
+        self.sent = 0; self.dropped = 0; self.retried = 0; self.failed = 0; self.messages = 0
+
+    async def start(self) -> None:
+        if self._task is not None: return
+        self._wake = asyncio.Event()
+        self._client = httpx.AsyncClient(timeout=self.timeout, transport=self.transport,
+                                         limits=httpx.Limits(max_connections=4, max_keepalive_connections=2))
+        self._task = asyncio.create_task(self._run(), name="ubi-discord")
+
+    async def stop(self, drain_secs: float = 5.0) -> None:
+        if self._task is None: return
+        try:
+            loop = asyncio.get_running_loop(); end = loop.time() + drain_secs
+            while (self._q or self._busy) and loop.time() < end: await asyncio.sleep(0.05)
+        finally:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            await self._client.aclose()
+            self._task = None; self._client = None
+
+    def enqueue(self, embed: Dict[str, Any]) -> bool:
+        dropped = len(self._q) == self._q.maxlen
+        if dropped: self.dropped += 1
+        self._q.append(embed)
+        if self._wake is not None: self._wake.set()
+        return not dropped
+
+    def depth(self) -> int:
+        return len(self._q)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": len(self._q), "sent": self.sent, "messages": self.messages,
+                "retried": self.retried, "dropped": self.dropped, "failed": self.failed}
+
+    async def _run(self) -> None:
+        while True:
+            if not self._q:
+                self._wake.clear()
+                await self._wake.wait()
+            if len(self._q) < DISCORD_MAX_EMBEDS and self.coalesce_secs > 0:
+                await asyncio.sleep(self.coalesce_secs)
+            batch: List[Dict[str, Any]] = []; chars = 0
+            while self._q and len(batch) < DISCORD_MAX_EMBEDS:
+                n = embed_chars(self._q[0])
+                if batch and chars + n > DISCORD_MAX_CHARS: break
+                batch.append(self._q.popleft()); chars += n
+            if not batch: continue
+            self._busy = True
+            try: await self._send(batch)
+            finally: self._busy = False
+
+    def _backoff(self, attempt: int) -> float:
+        d = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return d * (0.5 + random.random() / 2)
+
+    async def _send(self, embeds: List[Dict[str, Any]]) -> None:
+        url = self.url_fn()
+        if not url:
+            self.dropped += len(embeds); return
+        body = {"content": None, "embeds": embeds, "username": self.username}
+        for attempt in range(self.max_retries + 1):
+            delay: Optional[float] = None
+            try:
+                r = await self._client.post(url, json=body)
+                if r.status_code < 300:
+                    self.sent += len(embeds); self.messages += 1; return
+                if r.status_code == 429:
+                    delay = _retry_after(r)
+                elif r.status_code < 500:
+                    if len(embeds) > 1:   # rejected as a whole (e.g. too long): halves go on their own
+                        half = len(embeds) // 2
+                        await self._send(embeds[:half]); await self._send(embeds[half:]); return
+                    break
+            except httpx.HTTPError:
+                pass
+            if attempt == self.max_retries: break
+            self.retried += 1
+            await asyncio.sleep(delay if delay is not None else self._backoff(attempt))
+        self.failed += len(embeds)
+
+def _retry_after(r: httpx.Response) -> Optional[float]:
+    try: return float(r.json().get("retry_after"))
+    except Exception: pass
+    try: return float(r.headers.get("retry-after"))
+    except (TypeError, ValueError): return None
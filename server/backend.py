@@ -0,0 +1,61 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+class TelemetryBackend:
+    """What the collector needs from a telemetry store.
+
+    Writer side, driven by storage.StorageWriter from its thread: `name`, `open`,
+    `write(rows)` with schema.TelemetryRecord tuples (or dicts), `flush(sync)`, `close`, and
+    `position()` / `rewind(pos)` so the write-ahead log can cut it back after a crash.
+
+    Reader side, safe from any thread: columns come back as numpy arrays with the column
+    store's conventions, float32 sensors (NaN for null), int ms/rec_ms with colstore.INT_NULL,
+    and with `decode` strings as objects ("" for null) and booleans as "True"/"False"/"".
+    With `decode=False` booleans are plain bool arrays.
+    """
+    kind = ""
+    name = ""
+    repaired_rows = 0
+    rollup_secs = 0   # granularity of `rollup`, 0 when there are no rollups
+
+    # --- writer side ---
+    def open(self) -> None: raise NotImplementedError
+    def write(self, objs: List[Any]) -> None: raise NotImplementedError
+    def flush(self, sync: bool) -> None: raise NotImplementedError
+    def close(self) -> None: raise NotImplementedError
+    def position(self) -> Dict[str, Any]: raise NotImplementedError
+    def rewind(self, pos: Dict[str, Any]) -> None: raise NotImplementedError
+
+    # --- reader side ---
+    def read(self, t0: Optional[float] = None, t1: Optional[float] = None, fields: Optional[Sequence[str]] = None,
+             device: Optional[str] = None, decode: bool = True) -> Dict[str, np.ndarray]:
+        raise NotImplementedError
+
+    def iter_chunks(self, t0: Optional[float] = None, t1: Optional[float] = None,
+                    fields: Optional[Sequence[str]] = None, device: Optional[str] = None,
+                    chunk_rows: int = 8192) -> Iterator[Dict[str, np.ndarray]]:
+        """Decoded rows in ts order, in pieces of at most `chunk_rows`."""
+        raise NotImplementedError
+
+    def recent_events(self, fields: Sequence[str], t0: Optional[float], t1: Optional[float],
+                      device: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """The newest `limit` alert / pump-recommendation rows as records, oldest first."""
+        raise NotImplementedError
+
+    def first_ts(self) -> Optional[float]: raise NotImplementedError
+    def last_ts(self) -> Optional[float]: raise NotImplementedError
+
+    def rollup(self, t0: float, t1: float, fields: Sequence[str], device: Optional[str],
+               bucket: float) -> Optional[Dict[str, Any]]:
+        """Bucket aggregates from precomputed per-minute rollups, or None when this backend has
+        none (or `bucket` is not a whole number of minutes).
+
+        Buckets start at `start` (t0 down to the minute); the result holds `b` bucket numbers,
+        `n` rows per bucket, `count` / `first` / `last` over all of them and per field a
+        (count, sum, min, max) tuple of arrays; query.from_rollup shapes it like /query.
+        """
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.kind, "repaired_rows": self.repaired_rows}
@@ -0,0 +1,215 @@
+"""Ingest benchmark: replay a recorded telemetry CSV against /ingest and report throughput,
+latency percentiles, RSS growth and disk bytes per sample.
+
+    python bench_ingest.py --mode inproc --samples 20000 --devices 4
+    python bench_ingest.py --mode http --rate 200 --devices 8 --out bench.json
+    python bench_ingest.py --mode http --url http://127.0.0.1:5001 --samples 5000
+    python bench_ingest.py --mode http --workers 4 --concurrency 64
+
+`inproc` drives the ASGI app directly (no sockets); `http` spawns uvicorn on a temporary data
+dir unless --url points at a running collector (serve.py with --workers > 1). Results are written as JSON for diffing.
+"""
+import os, sys, csv, json, time, socket, asyncio, argparse, platform, tempfile, subprocess, statistics
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_REPLAY = HERE / "data" / "old" / "telemetry_b_test.csv"
+SLICES = 10
+
+def load_payloads(path: Path) -> List[Dict[str, Any]]:
+    out = []
+    with path.open(newline="") as f:
+        for r in csv.DictReader(f):
+            p = {k: v for k, v in r.items() if k and v not in ("", None) and k not in ("ts", "device")}
+            out.append(p)
+    if not out: raise SystemExit(f"No rows in {path}")
+    return out
+
+def rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"): return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+def dir_bytes(root: Path) -> int:
+    return sum(p.stat().st_size for p in root.rglob("*") if p.is_file()) if root.exists() else 0
+
+def pct(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals: return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+def lat_summary(lat: List[float]) -> Dict[str, Any]:
+    s = sorted(lat)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {"n": len(s), "p50_ms": ms(pct(s, 0.50)), "p90_ms": ms(pct(s, 0.90)), "p99_ms": ms(pct(s, 0.99)),
+            "max_ms": ms(s[-1] if s else None), "mean_ms": ms(statistics.fmean(s) if s else None)}
+
+async def drive(client: httpx.AsyncClient, bodies: List[bytes], devices: int, rate: float,
+                concurrency: int) -> Dict[str, Any]:
+    """Send every body once. With a rate, latency counts from each request's scheduled start,
+    so a stalled server is not hidden by the client slowing down."""
+    lat: List[float] = [0.0] * len(bodies); status: Dict[str, int] = {}
+    sem = asyncio.Semaphore(concurrency); t0 = time.perf_counter()
+
+    async def one(i: int, body: bytes) -> None:
+        sched = t0 + i / rate if rate > 0 else None
+        if sched is not None:
+            delay = sched - time.perf_counter()
+            if delay > 0: await asyncio.sleep(delay)
+        async with sem:
+            start = time.perf_counter() if sched is None else sched
+            try:
+                r = await client.post("/ingest", content=body, headers={
+                    "content-type": "application/json", "x-device-id": f"bench-{i % devices:03d}"})
+                key = str(r.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            lat[i] = time.perf_counter() - start
+            status[key] = status.get(key, 0) + 1
+
+    step = max(concurrency * 4, 1)
+    for j in range(0, len(bodies), step):   # bounded number of pending tasks
+        await asyncio.gather(*(one(i, bodies[i]) for i in range(j, min(j + step, len(bodies)))))
+    secs = time.perf_counter() - t0
+    n = len(bodies); k = max(1, n // SLICES)
+    return {"samples": n, "seconds": round(secs, 3), "throughput_per_s": round(n / secs, 1) if secs else None,
+            "status": status, "latency": lat_summary(lat),
+            "latency_by_slice": [lat_summary(lat[i:i + k]) for i in range(0, n, k)]}
+
+async def time_get(client: httpx.AsyncClient, path: str) -> Dict[str, Any]:
+    t = time.perf_counter(); size = 0
+    async with client.stream("GET", path) as r:
+        async for chunk in r.aiter_bytes(): size += len(chunk)
+        code = r.status_code
+    secs = time.perf_counter() - t
+    return {"status": code, "bytes": size, "seconds": round(secs, 3),
+            "mb_per_s": round(size / secs / 1e6, 2) if secs else None}
+
+async def export_paths(client: httpx.AsyncClient) -> Dict[str, Any]:
+    out = {}
+    for path in ("/export.csv", "/export.ndjson", "/events.csv", "/events?limit=200", "/episodes?limit=200",
+                 "/query?points=1200"):
+        out[path] = await time_get(client, path)
+    return out
+
+def alert_paths(main: Any, payloads: List[Dict[str, Any]], n: int) -> Dict[str, Any]:
+    """Dedup key + embed building on their own, the work _post_discord does per notable sample."""
+    st = main.DeviceState("bench-embed")
+    rows = [dict(p, ts=time.time(), alert=True) for p in payloads[:n]]
+    for p in rows: main.coerce(p); st.observe(p)
+    t = time.perf_counter()
+    sent = sum(main._should_send(p, st) is not None for p in rows)
+    dedup_s = time.perf_counter() - t
+    t = time.perf_counter()
+    for p in rows: main._build_embed(p, st)
+    embed_s = time.perf_counter() - t
+    return {"samples": len(rows), "dedup_us": round(dedup_s / len(rows) * 1e6, 2), "dedup_sent": sent,
+            "embed_us": round(embed_s / len(rows) * 1e6, 2)}
+
+async def run_inproc(args, bodies: List[bytes], payloads: List[Dict[str, Any]], data_dir: Path) -> Dict[str, Any]:
+    os.environ["UBI_DATA_DIR"] = str(data_dir); os.environ["DISCORD_WEBHOOK_URL"] = ""
+    sys.path.insert(0, str(HERE)); os.chdir(HERE)
+    import main
+    rss0 = rss_bytes()
+    async with main._lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            res = await drive(client, bodies, args.devices, args.rate, args.concurrency)
+            main._store.flush()
+            res["rss_growth_bytes"] = rss_bytes() - rss0
+            res["disk_bytes_per_sample"] = round(dir_bytes(data_dir) / len(bodies), 1)
+            res["exports"] = await export_paths(client)
+            res["health"] = (await client.get("/health")).json()
+        res["alert_paths"] = alert_paths(main, payloads, min(len(payloads), 5000))
+    return res
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+async def run_http(args, bodies: List[bytes], data_dir: Path) -> Dict[str, Any]:
+    proc = None; url = args.url
+    if url is None:
+        port = _free_port(); url = f"http://127.0.0.1:{port}"
+        env = dict(os.environ, UBI_DATA_DIR=str(data_dir), DISCORD_WEBHOOK_URL="")
+        cmd = ["-m", "uvicorn", "main:app", "--log-level", "warning"] if args.workers <= 1 else \
+              ["serve.py", "--workers", str(args.workers), "--host", "127.0.0.1"]
+        proc = subprocess.Popen([sys.executable, *cmd, "--port", str(port)], cwd=HERE, env=env)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+            for _ in range(200):
+                try:
+                    await client.get("/health"); break
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.05)
+            pid = proc.pid if proc and args.workers <= 1 else None   # RSS of one process only
+            rss0 = rss_bytes(pid) if pid else None
+            disk0 = dir_bytes(data_dir) if proc else None
+            res = await drive(client, bodies, args.devices, args.rate, args.concurrency)
+            res["exports"] = await export_paths(client)   # exports flush the writer first
+            res["health"] = (await client.get("/health")).json()
+            if pid: res["rss_growth_bytes"] = rss_bytes(pid) - rss0
+            if proc:
+                res["disk_bytes_per_sample"] = round((dir_bytes(data_dir) - disk0) / len(bodies), 1)
+    finally:
+        if proc:
+            proc.terminate(); proc.wait(10)
+    return res
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark /ingest by replaying recorded telemetry.")
+    ap.add_argument("--mode", choices=("inproc", "http"), default="inproc")
+    ap.add_argument("--replay", type=Path, default=DEFAULT_REPLAY)
+    ap.add_argument("--samples", type=int, default=5000, help="rows to send (the replay file is looped)")
+    ap.add_argument("--devices", type=int, default=1)
+    ap.add_argument("--rate", type=float, default=0.0, help="target samples/s over all devices, 0 = unpaced")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--workers", type=int, default=1, help="http mode: worker processes of the spawned collector")
+    ap.add_argument("--url", default=None, help="http mode: existing collector instead of a spawned one")
+    ap.add_argument("--out", type=Path, default=None, help="write results JSON here")
+    args = ap.parse_args(argv)
+
+    payloads = load_payloads(args.replay)
+    bodies = [json.dumps(payloads[i % len(payloads)]).encode() for i in range(args.samples)]
+    with tempfile.TemporaryDirectory(prefix="ubi-bench-") as tmp:
+        data_dir = Path(tmp)
+        if args.mode == "inproc":
+            res = asyncio.run(run_inproc(args, bodies, payloads, data_dir))
+        else:
+            res = asyncio.run(run_http(args, bodies, data_dir))
+    out = {"meta": {"git": _git_rev(), "python": platform.python_version(), "platform": platform.platform(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "args": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}},
+           "result": res}
+    text = json.dumps(out, indent=2, sort_keys=True)
+    if args.out: args.out.write_text(text + "\n", encoding="utf-8")
+    r = res; lat = r["latency"]
+    print(f"{args.mode}: {r['samples']} samples in {r['seconds']}s = {r['throughput_per_s']}/s  "
+          f"p50={lat['p50_ms']}ms p99={lat['p99_ms']}ms max={lat['max_ms']}ms  status={r['status']}")
+    if "rss_growth_bytes" in r:
+        print(f"rss growth {r['rss_growth_bytes'] / 1e6:.1f} MB, disk {r['disk_bytes_per_sample']} B/sample")
+    for path, e in r["exports"].items():
+        print(f"  GET {path}: {e['bytes']} B in {e['seconds']}s")
+    if "alert_paths" in r:
+        a = r["alert_paths"]; print(f"  dedup {a['dedup_us']}us/sample, embed {a['embed_us']}us/sample")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
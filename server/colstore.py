@@ -0,0 +1,474 @@
+import os, json, time, shutil, calendar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend import TelemetryBackend
+
+BOOL_FIELDS = ("pump", "manual_override", "alert", "tds_sat", "ml_on", "ml_used")
+STR_FIELDS = ("reason", "context", "ml_pred", "device", "srv_label", "srv_pred")
+INT_FIELDS = {"ms": np.int64, "rec_ms": np.int32}
+TS_FIELD = "ts"
+FLAGS_FILE = "flags.u16"          # bits 0..5: value of BOOL_FIELDS[i], bits 8..13: present
+INT_NULL = {np.int64: np.iinfo(np.int64).min, np.int32: np.iinfo(np.int32).min}
+SEG_PREFIX = "seg-"
+UNSORTED = "unsorted"             # marker: rows older than ones already in the segment were appended
+LATE_SECS = 86400                 # how far behind the newest segment late rows are still filed by time
+MAX_LATE_OPEN = 4                 # older segments kept open for late rows besides the newest
+
+def _column_file(field: str) -> Tuple[str, Any]:
+    if field == TS_FIELD: return f"{field}.f64", np.float64
+    if field in INT_FIELDS:
+        dt = INT_FIELDS[field]; return f"{field}.{np.dtype(dt).str[1:]}", dt
+    if field in STR_FIELDS: return f"{field}.u16", np.uint16
+    return f"{field}.f32", np.float32
+
+def _segment_file(path: Path, field: str) -> Tuple[str, Any]:
+    """`field`'s file in segment `path`: string codes move to uint32 once a dictionary outgrows uint16."""
+    if field == FLAGS_FILE: return FLAGS_FILE, np.uint16
+    if field in STR_FIELDS and (path / f"{field}.u32").exists(): return f"{field}.u32", np.uint32
+    return _column_file(field)
+
+TRUE_STRINGS = ("1", "true", "t", "yes", "y")
+_ITEM_BYTES = {".f64": 8, ".f32": 4, ".i8": 8, ".i4": 4, ".u16": 2, ".u32": 4}
+U16_CODES = 1 << 16
+
+def _null_value(field: str, dt: Any) -> Any:
+    if field in INT_FIELDS: return INT_NULL[dt]
+    if field in STR_FIELDS or field == FLAGS_FILE: return 0
+    return np.nan
+
+def _as_float(v: Any) -> float:
+    if v is None or v == "": return float("nan")
+    try: return float(v)
+    except (TypeError, ValueError): return float("nan")
+
+def _as_int(v: Any, null: int) -> int:
+    if v is None or v == "": return null
+    try: return int(v)
+    except (TypeError, ValueError):
+        try: return int(float(v))
+        except (TypeError, ValueError, OverflowError): return null
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try: os.fsync(fd)
+    finally: os.close(fd)
+
+def _encode_str(vals: Sequence[Any], strings: List[str], codes: Dict[str, int]) -> Tuple[np.ndarray, bool]:
+    out = np.empty(len(vals), dtype=np.uint32); grew = False
+    for i, v in enumerate(vals):
+        s = "" if v is None else str(v)
+        c = codes.get(s)
+        if c is None:
+            c = codes[s] = len(strings); strings.append(s); grew = True
+        out[i] = c
+    return out, grew
+
+def encode_rows(objs: List[Any], fields: Sequence[str], dicts: Dict[str, List[str]],
+                codes: Dict[str, Dict[str, int]]) -> Tuple[Dict[str, np.ndarray], bool]:
+    """Rows as the store's column arrays (FLAGS_FILE for the booleans), and whether a dictionary grew."""
+    cols: Dict[str, np.ndarray] = {}; grew = False
+    # schema.TelemetryRecord rows transpose in one pass instead of a .get per field and row
+    by_field = dict(zip(objs[0]._fields, zip(*objs))) if objs and hasattr(objs[0], "_fields") else {}
+    for f in fields:
+        if f in BOOL_FIELDS: continue
+        vals = by_field[f] if f in by_field else [o.get(f) for o in objs]
+        if f in STR_FIELDS:
+            cols[f], g = _encode_str(vals, dicts[f], codes[f]); grew |= g
+        elif f in INT_FIELDS:
+            dt = INT_FIELDS[f]; null = INT_NULL[dt]
+            cols[f] = np.fromiter((_as_int(v, null) for v in vals), dtype=dt, count=len(vals))
+        else:
+            cols[f] = np.fromiter((_as_float(v) for v in vals), dtype=_column_file(f)[1], count=len(vals))
+    flags = np.zeros(len(objs), dtype=np.uint16)
+    for bit, f in enumerate(BOOL_FIELDS):
+        if f not in fields: continue
+        for i, v in enumerate(by_field[f] if f in by_field else [o.get(f) for o in objs]):
+            if v is None or v == "": continue
+            on = v if isinstance(v, bool) else str(v).strip().lower() in TRUE_STRINGS
+            flags[i] |= (1 << (bit + 8)) | ((1 << bit) if on else 0)
+    cols[FLAGS_FILE] = flags
+    return cols, grew
+
+class _Segment:
+    def __init__(self, path: Path, fields: Sequence[str]):
+        self.path = path; self.path.mkdir(parents=True, exist_ok=True)
+        self.fields = fields
+        self.dict_path = path / "dict.json"
+        for f in STR_FIELDS:   # a widening that stopped before dropping the uint16 file
+            if (path / f"{f}.u32").exists(): (path / f"{f}.u16").unlink(missing_ok=True)
+        self.dicts: Dict[str, List[str]] = {f: [""] for f in STR_FIELDS if f in fields}
+        if self.dict_path.exists():
+            self.dicts.update(json.loads(self.dict_path.read_text(encoding="utf-8")))
+        self.codes = {f: {s: i for i, s in enumerate(vals)} for f, vals in self.dicts.items()}
+        self.rows = self._align()
+        self.sorted = not (path / UNSORTED).exists()
+        self.t_max = float("-inf")
+        if self.rows and self.sorted:
+            with (path / _column_file(TS_FIELD)[0]).open("rb") as f:
+                f.seek((self.rows - 1) * 8); self.t_max = float(np.frombuffer(f.read(8), dtype="<f8")[0])
+        self.fhs = {f: (path / _segment_file(path, f)[0]).open("ab") for f in list(fields) + [FLAGS_FILE]
+                    if f not in BOOL_FIELDS}
+
+    def _align(self) -> int:
+        """Make every column exactly as long as ts and return that row count.
+
+        ts is written last, so columns past it are a torn append and get cut; shorter ones
+        are fields added since this segment was started and get null-padded.
+        """
+        ts = self.path / _column_file(TS_FIELD)[0]
+        rows = ts.stat().st_size // 8 if ts.exists() else 0
+        if ts.exists() and ts.stat().st_size != rows * 8:
+            with ts.open("r+b") as fh: fh.truncate(rows * 8)
+        for f in [f for f in self.fields if f not in BOOL_FIELDS and f != TS_FIELD] + [FLAGS_FILE]:
+            name, dt = _segment_file(self.path, f)
+            fp = self.path / name; size = np.dtype(dt).itemsize
+            nbytes = fp.stat().st_size if fp.exists() else 0
+            have = min(nbytes // size, rows)
+            if nbytes != have * size:
+                with fp.open("r+b") as fh: fh.truncate(have * size)
+            if have < rows:
+                with fp.open("ab") as fh:
+                    fh.write(np.full(rows - have, _null_value(f, dt), dtype=dt).tobytes())
+        return rows
+
+    def append(self, objs: List[Dict[str, Any]]) -> int:
+        cols, grew = encode_rows(objs, self.fields, self.dicts, self.codes)
+        ts = cols[TS_FIELD]
+        if self.sorted and len(ts):
+            if ts[0] < self.t_max or (np.diff(ts) < 0).any():
+                # readers must know before the first out-of-order row is visible
+                (self.path / UNSORTED).touch(); _fsync_dir(self.path); self.sorted = False
+            else:
+                self.t_max = float(ts[-1])
+        if grew:   # dictionary must be durable before any column references a new code
+            tmp = self.dict_path.with_suffix(".tmp")
+            with tmp.open("w", encoding="utf-8") as fh:
+                json.dump(self.dicts, fh, ensure_ascii=False); fh.flush(); os.fsync(fh.fileno())
+            os.replace(tmp, self.dict_path); _fsync_dir(self.path)
+            for f, strings in self.dicts.items():
+                if len(strings) > U16_CODES and self.fhs[f].name.endswith(".u16"): self._widen(f)
+        for f, arr in cols.items():
+            if f in STR_FIELDS: arr = arr.astype(_segment_file(self.path, f)[1], copy=False)
+            if f != TS_FIELD: self.fhs[f].write(arr.tobytes())
+        self.fhs[TS_FIELD].write(cols[TS_FIELD].tobytes())   # last: a row exists once its ts does
+        self.rows += len(objs)
+        return sum(a.nbytes for a in cols.values())
+
+    def _widen(self, field: str) -> None:
+        """Rewrite a string column as uint32 codes; the uint16 file stays until the next open,
+        so a reader that already picked it keeps a valid file."""
+        fh = self.fhs[field]; fh.flush(); fh.close()
+        old = self.path / f"{field}.u16"; new = self.path / f"{field}.u32"; tmp = new.with_suffix(".tmp")
+        with tmp.open("wb") as out:
+            out.write(np.fromfile(old, dtype="<u2").astype("<u4").tobytes()); out.flush(); os.fsync(out.fileno())
+        os.replace(tmp, new); _fsync_dir(self.path)
+        self.fhs[field] = new.open("ab")
+
+    def flush(self, sync: bool) -> None:
+        for fh in self.fhs.values():
+            fh.flush()
+            if sync: os.fsync(fh.fileno())
+
+    def close(self) -> None:
+        self.flush(True)
+        for fh in self.fhs.values(): fh.close()
+        self.fhs = {}
+
+class ColumnStore(TelemetryBackend):
+    """Append-only columnar telemetry store, one directory per `segment_secs` time partition.
+
+    Each segment holds one fixed-width little-endian file per field (float64 ts, float32 sensors,
+    int ms/rec_ms with a min-int null), a uint16 bitmask packing the boolean fields with their
+    presence bits, and dictionary codes for the string fields (strings in dict.json), uint16
+    until a segment's dictionary outgrows them and uint32 from then on.
+    Used as a storage sink from the writer thread and as a memory-mapped reader from anywhere.
+
+    Rows go to the segment of their ts, so a device's buffered upload lands where it belongs
+    as long as it is within `late_secs` of the newest segment (older rows go to the oldest
+    segment of that window). A segment that got rows older than ones it already had is marked
+    UNSORTED and its reads sort what they select.
+    """
+    kind = "files"
+
+    def __init__(self, root: Path, fields: Sequence[str], segment_secs: int = 3600, late_secs: float = LATE_SECS):
+        self.root = Path(root); self.fields = list(fields); self.segment_secs = int(segment_secs)
+        self.late_secs = float(late_secs)
+        self._seg: Optional[_Segment] = None; self._seg_start: Optional[int] = None
+        self._late: Dict[int, _Segment] = {}   # open older segments, least recently written first
+        self._rows: Dict[str, int] = {}        # rows per segment in the late window, for position()
+        self.name = str(self.root); self.repaired_rows = 0; self.bytes_written = 0; self.late_rows = 0
+
+    def _seg_name(self, start: int) -> str:
+        return SEG_PREFIX + time.strftime("%Y%m%dT%H%M%S", time.gmtime(start))
+
+    def _window_start(self) -> int:
+        secs = self.segment_secs
+        return int((self._seg_start - self.late_secs) // secs * secs)
+
+    # --- writer side (storage sink interface) ---
+    def open(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        segs = self.segments()
+        if segs and self._seg is None:
+            self._seg_start = segs[-1][0]; self._rows = {}
+            for start, p in segs:
+                if start < self._window_start(): continue
+                ts = p / _column_file(TS_FIELD)[0]
+                self._rows[p.name] = ts.stat().st_size // 8 if ts.exists() else 0
+
+    def write(self, objs: List[Dict[str, Any]]) -> None:
+        start = 0; n = len(objs)
+        while start < n:
+            ts = _as_float(objs[start].get(TS_FIELD))
+            seg_start = int(ts // self.segment_secs * self.segment_secs) if ts == ts else (self._seg_start or 0)
+            # a checkpoint covers the segments of the late window only, so nothing older is reopened
+            if self._seg_start is not None: seg_start = max(seg_start, self._window_start())
+            end = start + 1; seg_end = seg_start + self.segment_secs
+            while end < n and seg_start <= _as_float(objs[end].get(TS_FIELD)) < seg_end: end += 1
+            seg = self._segment_for(seg_start)
+            self.bytes_written += seg.append(objs[start:end])
+            self._rows[seg.path.name] = seg.rows
+            if seg is not self._seg: self.late_rows += end - start
+            start = end
+
+    def _segment_for(self, seg_start: int) -> _Segment:
+        if self._seg_start is None or seg_start > self._seg_start or (self._seg is None and seg_start == self._seg_start):
+            if self._seg is not None: self._seg.close()
+            self._seg = _Segment(self.root / self._seg_name(seg_start), self.fields)
+            self._seg_start = seg_start
+            first = self._seg_name(self._window_start())
+            self._rows = {k: v for k, v in self._rows.items() if k >= first}
+            for s in [s for s in self._late if s < self._window_start()]: self._late.pop(s).close()
+            return self._seg
+        if seg_start == self._seg_start: return self._seg
+        seg = self._late.pop(seg_start, None) or _Segment(self.root / self._seg_name(seg_start), self.fields)
+        self._late[seg_start] = seg
+        while len(self._late) > MAX_LATE_OPEN: self._late.pop(next(iter(self._late))).close()
+        return seg
+
+    def flush(self, sync: bool) -> None:
+        for seg in [self._seg, *self._late.values()]:
+            if seg is not None: seg.flush(sync)
+
+    def close(self) -> None:
+        segs = [self._seg, *self._late.values()]
+        self._seg = None; self._seg_start = None; self._late = {}; self._rows = {}
+        for seg in segs:
+            if seg is not None: seg.close()
+
+    def position(self) -> Dict[str, Any]:
+        """The newest segment and its rows, plus the row counts of the older ones late rows may still reach."""
+        if self._seg_start is None: return {"seg": None, "rows": 0}
+        tail = self._seg_name(self._seg_start); first = self._seg_name(self._window_start())
+        return {"seg": tail, "rows": self._rows.get(tail, 0), "from": first,
+                "late": {k: v for k, v in self._rows.items() if first <= k < tail}}
+
+    def rewind(self, pos: Dict[str, Any]) -> None:
+        """Drop rows appended after a checkpointed position (before open)."""
+        keep = pos.get("seg"); first = pos.get("from", keep); late = pos.get("late", {})
+        for _, p in self.segments():
+            if first is not None and p.name < first: continue
+            rows = pos.get("rows", 0) if p.name == keep else late.get(p.name)
+            if rows is None:   # created after the checkpoint
+                ts = p / _column_file(TS_FIELD)[0]
+                self.repaired_rows += ts.stat().st_size // 8 if ts.exists() else 0
+                shutil.rmtree(p); continue
+            rows = int(rows)
+            for fp in p.iterdir():
+                size = _ITEM_BYTES.get(fp.suffix)
+                if size is None or fp.stat().st_size <= rows * size: continue
+                if fp.name == _column_file(TS_FIELD)[0]: self.repaired_rows += fp.stat().st_size // size - rows
+                with fp.open("r+b") as fh: fh.truncate(rows * size)
+
+    # --- reader side ---
+    def segments(self, t0: Optional[float] = None, t1: Optional[float] = None) -> List[Tuple[int, Path]]:
+        if not self.root.exists(): return []
+        out = []
+        for p in self.root.iterdir():
+            if not p.is_dir() or not p.name.startswith(SEG_PREFIX): continue
+            start = _seg_start_of(p.name)
+            if start is None: continue
+            if t1 is not None and start > t1: continue
+            if t0 is not None and start + self.segment_secs <= t0: continue
+            out.append((start, p))
+        out.sort()
+        return out
+
+    def _open_segment(self, path: Path, fields: Sequence[str]) -> Tuple[int, Dict[str, np.ndarray], Dict[str, List[str]]]:
+        maps: Dict[str, np.ndarray] = {}
+        need = set(fields) | {TS_FIELD}
+        files = [f for f in need if f not in BOOL_FIELDS]
+        if need & set(BOOL_FIELDS): files.append(FLAGS_FILE)
+        missing = []
+        for f in files:
+            name, dt = _segment_file(path, f)
+            fp = path / name
+            if not fp.exists(): missing.append((f, dt)); continue
+            n = fp.stat().st_size // np.dtype(dt).itemsize
+            maps[f] = np.memmap(fp, dtype=dt, mode="r", shape=(n,)) if n else np.empty(0, dtype=dt)
+        rows = min(len(a) for a in maps.values()) if maps else 0
+        for f, dt in missing:   # field added after this segment was written: all nulls
+            maps[f] = np.full(rows, _null_value(f, dt), dtype=dt)
+        dp = path / "dict.json"
+        dicts = json.loads(dp.read_text(encoding="utf-8")) if dp.exists() else {}
+        return rows, maps, dicts
+
+    def read(self, t0: Optional[float] = None, t1: Optional[float] = None,
+             fields: Optional[Sequence[str]] = None, device: Optional[str] = None,
+             decode: bool = True) -> Dict[str, np.ndarray]:
+        fields = [f for f in (fields or self.fields) if f in self.fields]
+        if TS_FIELD not in fields: fields = [TS_FIELD] + fields
+        parts = [self.read_segment(p, t0, t1, fields, device, decode) for _, p in self.segments(t0, t1)]
+        parts = [x for x in parts if x is not None and len(x[TS_FIELD])]
+        if not parts: return {f: np.empty(0, dtype=_read_dtype(f, decode)) for f in fields}
+        return {f: np.concatenate([x[f] for x in parts]) for f in fields}
+
+    def iter_chunks(self, t0: Optional[float] = None, t1: Optional[float] = None,
+                    fields: Optional[Sequence[str]] = None, device: Optional[str] = None,
+                    chunk_rows: int = 8192) -> Iterator[Dict[str, np.ndarray]]:
+        """Decoded rows in `chunk_rows` pieces; only one piece is ever copied out of the memmaps."""
+        fields = [f for f in (fields or self.fields) if f in self.fields]
+        for _, p in self.segments(t0, t1):
+            sel = self._select(p, t0, t1, fields, device)
+            if sel is None: continue
+            maps, dicts, rows, idx = sel
+            if isinstance(idx, slice):
+                for i in range(idx.start, idx.stop, chunk_rows):
+                    yield self._decode(maps, dicts, rows, slice(i, min(i + chunk_rows, idx.stop)), fields, True)
+            else:
+                for i in range(0, len(idx), chunk_rows):
+                    yield self._decode(maps, dicts, rows, idx[i:i + chunk_rows], fields, True)
+
+    def read_segment(self, path: Path, t0, t1, fields, device, decode) -> Optional[Dict[str, np.ndarray]]:
+        sel = self._select(path, t0, t1, fields, device)
+        return None if sel is None else self._decode(*sel, fields, decode)
+
+    def _select(self, path: Path, t0, t1, fields, device):
+        """(maps, dicts, rows, selector) for the rows of one segment in [t0, t1] and `device`, or None."""
+        need = list(fields) + ([TS_FIELD] if TS_FIELD not in fields else []) + \
+               (["device"] if device is not None and "device" not in fields else [])
+        rows, maps, dicts = self._open_segment(path, need)
+        if rows == 0: return None
+        ts = maps[TS_FIELD][:rows]
+        if not self._sorted(path): return self._select_unsorted(maps, dicts, rows, ts, t0, t1, device)
+        lo = int(np.searchsorted(ts, t0, "left")) if t0 is not None else 0
+        hi = int(np.searchsorted(ts, t1, "right")) if t1 is not None else rows
+        if hi <= lo: return None
+        idx: Any = slice(lo, hi)
+        if device is not None:
+            codes = dicts.get("device", [])
+            if device not in codes: return None
+            sel = np.nonzero(maps["device"][lo:hi] == codes.index(device))[0] + lo
+            if not len(sel): return None
+            idx = sel
+        return maps, dicts, rows, idx
+
+    def _sorted(self, path: Path) -> bool:
+        return not (path / UNSORTED).exists()
+
+    def _select_unsorted(self, maps, dicts, rows: int, ts: np.ndarray, t0, t1, device):
+        keep = np.ones(rows, dtype=bool)
+        if t0 is not None: keep &= ts >= t0
+        if t1 is not None: keep &= ts <= t1
+        if device is not None:
+            codes = dicts.get("device", [])
+            if device not in codes: return None
+            keep &= maps["device"][:rows] == codes.index(device)
+        idx = np.flatnonzero(keep)
+        if not len(idx): return None
+        return maps, dicts, rows, idx[np.argsort(ts[idx], kind="stable")]
+
+    def _decode(self, maps, dicts, rows: int, idx: Any, fields, decode: bool) -> Dict[str, np.ndarray]:
+        out: Dict[str, np.ndarray] = {}
+        for f in fields:
+            if f in BOOL_FIELDS:
+                bit = BOOL_FIELDS.index(f); flags = np.asarray(maps[FLAGS_FILE][:rows][idx])
+                if decode:
+                    v = np.where(flags & (1 << (bit + 8)), np.where(flags & (1 << bit), "True", "False"), "")
+                    out[f] = v.astype(object)
+                else:
+                    out[f] = (flags & (1 << bit)) != 0
+            elif f in STR_FIELDS:
+                codes = np.asarray(maps[f][:rows][idx])
+                if decode:
+                    lut = np.array(dicts.get(f, [""]), dtype=object)
+                    out[f] = lut[np.minimum(codes, len(lut) - 1)]
+                else:
+                    out[f] = codes
+            else:
+                out[f] = np.array(maps[f][:rows][idx])
+        return out
+
+    def recent_events(self, fields: Sequence[str], t0: Optional[float], t1: Optional[float],
+                      device: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """Newest-first scan for alert / pump-recommendation rows, decoding only segments with hits."""
+        out: List[Dict[str, Any]] = []
+        for _, seg in reversed(self.segments(t0, t1)):
+            raw = self.read_segment(seg, t0, t1, [TS_FIELD, "alert", "rec_ms"], device, decode=False)
+            if raw is None: continue
+            rec = raw["rec_ms"]
+            hit = np.flatnonzero(raw["alert"] | ((rec > 0) & (rec != INT_NULL[np.int32])))
+            if not len(hit): continue
+            full = self.read_segment(seg, t0, t1, fields, device, decode=True)
+            take = hit[-(limit - len(out)):]
+            out = to_records({f: full[f][take] for f in fields}, fields) + out
+            if len(out) >= limit: break
+        return out
+
+    def first_ts(self) -> Optional[float]:
+        """Start of the oldest segment."""
+        segs = self.segments()
+        return float(segs[0][0]) if segs else None
+
+    def last_ts(self) -> Optional[float]:
+        """Timestamp of the newest stored row, read from the tail of the newest segment."""
+        for _, p in reversed(self.segments()):
+            fp = p / _column_file(TS_FIELD)[0]
+            n = fp.stat().st_size // 8 if fp.exists() else 0
+            if n and not self._sorted(p): return float(np.nanmax(np.memmap(fp, dtype=np.float64, mode="r", shape=(n,))))
+            if n:
+                with fp.open("rb") as f:
+                    f.seek((n - 1) * 8); return float(np.frombuffer(f.read(8), dtype="<f8")[0])
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "segments": len(self.segments()), "late_rows": self.late_rows}
+
+def _read_dtype(field: str, decode: bool):
+    if field in BOOL_FIELDS: return object if decode else bool
+    if field in STR_FIELDS: return object if decode else np.uint16
+    return _column_file(field)[1]
+
+def _seg_start_of(name: str) -> Optional[int]:
+    try:
+        return calendar.timegm(time.strptime(name[len(SEG_PREFIX):], "%Y%m%dT%H%M%S"))
+    except ValueError:
+        return None
+
+def format_column(field: str, arr: np.ndarray) -> List[str]:
+    """Render a decoded column as CSV text: shortest round-trip floats, '' for nulls."""
+    if arr.dtype == object: return ["" if v is None else str(v) for v in arr]
+    if field in INT_FIELDS:
+        null = INT_NULL[INT_FIELDS[field]]
+        return ["" if v == null else str(v) for v in arr.tolist()]
+    s = arr.astype(str)
+    s[np.isnan(arr)] = ""
+    return s.tolist()
+
+def to_records(chunk: Dict[str, np.ndarray], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """Decode a chunk back into plain JSON-friendly dicts (None for nulls)."""
+    n = len(next(iter(chunk.values()))) if chunk else 0
+    cols: Dict[str, List[Any]] = {}
+    for f in fields:
+        a = chunk[f]
+        if f in BOOL_FIELDS: cols[f] = [None if v == "" else v == "True" for v in a]
+        elif a.dtype == object: cols[f] = list(a)
+        elif f in INT_FIELDS:
+            null = INT_NULL[INT_FIELDS[f]]; cols[f] = [None if v == null else v for v in a.tolist()]
+        else:
+            vals = [float(x) for x in a.astype(str)] if a.dtype == np.float32 else a.tolist()
+            cols[f] = [None if v != v else v for v in vals]
+    return [{f: cols[f][i] for f in fields} for i in range(n)]
@@ -0,0 +1,75 @@
+import sys, math, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_ML_DIR = Path(__file__).resolve().parent.parent / "ml"
+if str(_ML_DIR) not in sys.path: sys.path.insert(0, str(_ML_DIR))
+
+from signals import SignalParams, DEFAULT_PARAMS, SignalState, decide_label, map_reason_to_label
+
+SIGNAL_FLAGS = ("cold_shock", "stratified", "inversion", "glare", "heater_lamp", "ambient_fire",
+                "overheat_un", "tds_spike", "baro_drop", "flashlight_night", "abrupt_dark_day",
+                "human_tap", "disturbance", "cooling_hot")
+INPUT_FIELDS = ("micRMS", "lux", "tMid", "dT_tb", "irObj", "irAmb", "airT", "airRH",
+                "tds_mV", "pressure_hPa")
+QUIET_LABELS = ("calm", "other", "pump-self")
+MIC_WARMUP = 30   # samples before the micRMS baseline is trusted for ripple detection
+
+def _num(v: Any) -> float:
+    if v is None or isinstance(v, bool): return math.nan
+    try: return float(v)
+    except (TypeError, ValueError): return math.nan
+
+class OnlineDetector:
+    """Server-side copy of the training-label rules for one device, fed one sample at a time.
+
+    Wraps ml/signals.SignalState, so labels match data_preprocessing.py except for the micRMS
+    baseline: offline uses the whole file's median/stdev, online a running Welford mean/stdev.
+    """
+    def __init__(self, params: SignalParams = DEFAULT_PARAMS, warmup: int = MIC_WARMUP):
+        self.state = SignalState(params, 0.0, math.inf)
+        self.warmup = warmup
+        self.mic_n = 0; self.mic_mean = 0.0; self.mic_m2 = 0.0
+        self.label: Optional[str] = None
+        self.updates = 0; self.events = 0
+        self.total_ns = 0; self.max_ns = 0
+
+    def _mic_baseline(self) -> Tuple[float, float]:
+        if self.mic_n < max(2, self.warmup): return 0.0, math.inf   # z = 0 until warmed up
+        return self.mic_mean, math.sqrt(self.mic_m2 / self.mic_n) or 1.0
+
+    def _observe_mic(self, x: float) -> None:
+        if not math.isfinite(x): return
+        self.mic_n += 1
+        d = x - self.mic_mean
+        self.mic_mean += d / self.mic_n
+        self.mic_m2 += d * (x - self.mic_mean)
+
+    def update(self, payload: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Label one sample; returns (label, event) where event is set when the label turns notable."""
+        t0 = time.perf_counter_ns()
+        cur = {k: _num(payload.get(k)) for k in INPUT_FIELDS}
+        cur["ts"] = _num(payload.get("ts"))
+        cur["pump"] = bool(payload.get("pump")); cur["manual_override"] = bool(payload.get("manual_override"))
+        st = self.state
+        st.mic_mu, st.mic_sd = self._mic_baseline()   # baseline excludes the sample being scored
+        sig = st.step(cur)
+        self._observe_mic(cur["micRMS"])
+        label = decide_label(cur, sig, map_reason_to_label(str(payload.get("reason") or "")), st.params)
+        ev = None
+        if label != self.label and label not in QUIET_LABELS:
+            ev = {"ts": payload.get("ts"), "device": payload.get("device"), "label": label,
+                  "prev": self.label, "signals": [k for k in SIGNAL_FLAGS if sig[k]],
+                  "zr": round(sig["zr"], 3)}
+            self.events += 1
+        self.label = label
+        dt = time.perf_counter_ns() - t0
+        self.updates += 1; self.total_ns += dt
+        if dt > self.max_ns: self.max_ns = dt
+        return label, ev
+
+def detector_stats(detectors: List[OnlineDetector]) -> Dict[str, Any]:
+    n = sum(d.updates for d in detectors)
+    return {"updates": n, "events": sum(d.events for d in detectors),
+            "avg_us": round(sum(d.total_ns for d in detectors) / n / 1000, 2) if n else None,
+            "max_us": round(max((d.max_ns for d in detectors), default=0) / 1000, 2)}
@@ -0,0 +1,85 @@
+import time, collections
+from typing import Any, Deque, Dict, List, Optional
+
+from event_window import EventWindow
+from detector import OnlineDetector
+from inference import FeatureTracker
+from rolling import RollingSet
+
+DETECTIONS_LEN = 200
+RATE_ALPHA = 0.1   # EWMA weight of the latest sample interval
+MIN_INTERVAL = 1e-3   # closer samples came in one batch without age_ms: no rate information
+MAX_ID_LEN = 64
+
+def resolve_device_id(header: Optional[str], payload: Dict[str, Any], client_host: Optional[str]) -> str:
+    for cand in (header, payload.get("device"), payload.get("device_id"), client_host):
+        if cand is None: continue
+        s = str(cand).strip()[:MAX_ID_LEN]
+        if s: return s
+    return "unknown"
+
+class DeviceState:
+    def __init__(self, device: str):
+        self.device = device
+        self.last: Optional[Dict[str, Any]] = None
+        self.stats = RollingSet()
+        self.anomalies: List[str] = []
+        self.events = EventWindow()
+        self.detector = OnlineDetector()
+        self.ml_features = FeatureTracker()
+        self.detections: Deque[Dict[str, Any]] = collections.deque(maxlen=DETECTIONS_LEN)
+        self.samples = 0
+        self.first_seen = time.time()
+        self.last_seen = 0.0
+        self.interval: Optional[float] = None
+
+    def observe(self, payload: Dict[str, Any]) -> None:
+        self.anomalies = self.stats.push(payload)
+        self.events.push(payload)
+        self.last = payload
+        self.samples += 1
+        ts = payload.get("ts") or time.time()
+        self.first_seen = min(self.first_seen, ts)   # a buffered upload can predate the state
+        if self.last_seen and ts - self.last_seen >= MIN_INTERVAL:
+            dt = ts - self.last_seen
+            self.interval = dt if self.interval is None else self.interval + RATE_ALPHA * (dt - self.interval)
+        self.last_seen = max(self.last_seen, ts)
+
+    def rate_hz(self) -> Optional[float]:
+        return 1.0 / self.interval if self.interval else None
+
+    def summary(self) -> Dict[str, Any]:
+        return {"device": self.device, "samples": self.samples,
+                "first_seen": self.first_seen, "last_seen": self.last_seen, "label": self.detector.label,
+                "anomalies": self.anomalies, "rate_hz": round(1.0 / self.interval, 3) if self.interval else None,
+                "age_s": round(time.time() - self.last_seen, 3) if self.last_seen else None}
+
+class DeviceRegistry:
+    """Per-device state partitions keyed by device id; each ingest touches only its own entry."""
+    def __init__(self):
+        self._devices: Dict[str, DeviceState] = {}
+        self._newest: Optional[DeviceState] = None
+
+    def get(self, device: str) -> DeviceState:
+        st = self._devices.get(device)
+        if st is None:
+            st = self._devices[device] = DeviceState(device)
+        return st
+
+    def find(self, device: str) -> Optional[DeviceState]:
+        return self._devices.get(device)
+
+    def observe(self, device: str, payload: Dict[str, Any]) -> DeviceState:
+        st = self.get(device)
+        st.observe(payload)
+        self._newest = st
+        return st
+
+    def newest(self) -> Optional[DeviceState]:
+        return self._newest
+
+    def all(self) -> List[DeviceState]:
+        return list(self._devices.values())
+
+    def __len__(self) -> int:
+        return len(self._devices)
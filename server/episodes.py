@@ -0,0 +1,228 @@
+import io, os, csv, zlib, threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from colstore import INT_NULL
+
+# ml_pred labels that make a sample notable on their own (as the phase-1 collector's events.csv)
+ML_EVENT_LABELS = frozenset({"human-tap", "disturbance", "flashlight-night", "pump-self", "glare",
+                             "cold-shock", "tds-spike", "uniform-overheat", "cooling-hot"})
+NOTABLE_FIELDS = ("alert", "pump", "rec_ms", "reason", "ml_pred", "ml_used")
+PEAKS: Tuple[Tuple[str, str], ...] = (("DOproxy", "min"), ("tMid", "max"), ("dT_tb", "max"), ("micRMS", "max"),
+                                      ("lux", "max"), ("tds_mV", "max"), ("ml_conf", "max"))
+
+EPISODE_SCHEMA: Tuple[Tuple[str, str], ...] = (
+    ("device", "str"), ("start", "float"), ("end", "float"), ("duration_s", "float"), ("samples", "int"),
+    ("alert", "bool"), ("reason", "str"), ("context", "str"), ("ml_pred", "str"), ("pump", "bool"),
+    ("rec_ms", "int"),
+) + tuple((f"{f}_{agg}", "float") for f, agg in PEAKS)
+EPISODE_FIELDS = [n for n, _ in EPISODE_SCHEMA]
+
+INDEX_DTYPE = np.dtype([("start", "<f8"), ("end", "<f8"), ("off", "<u8"), ("len", "<u4"), ("dev", "<u4")])
+
+def _rec_ms(v: Any) -> int:
+    try: return int(v or 0)
+    except (TypeError, ValueError): return 0
+
+def notable(r: Any) -> bool:
+    """Whether a sample (payload dict or TelemetryRecord) belongs in an event episode."""
+    return bool(r.get("alert") or r.get("pump") or r.get("ml_used") or _rec_ms(r.get("rec_ms")) > 0 or
+                str(r.get("reason") or "none") != "none" or str(r.get("ml_pred") or "").strip().lower() in ML_EVENT_LABELS)
+
+def notable_mask(cols: Dict[str, np.ndarray]) -> np.ndarray:
+    """`notable` over a decoded backend chunk holding NOTABLE_FIELDS."""
+    rec = cols["rec_ms"]
+    reason = cols["reason"]
+    return ((cols["alert"] == "True") | (cols["pump"] == "True") | (cols["ml_used"] == "True") |
+            ((rec > 0) & (rec != INT_NULL[np.int32])) | ((reason != "") & (reason != "none")) |
+            np.isin(cols["ml_pred"], list(ML_EVENT_LABELS)))
+
+def _device_code(device: str) -> int:
+    return zlib.crc32(device.encode("utf-8"))
+
+def _peak(v: Any) -> Optional[float]:
+    return None if v is None or v != v else float(v)
+
+def _cell(v: Any) -> Any:
+    if v is None: return ""
+    return round(v, 4) if isinstance(v, float) else v
+
+def _parse(row: List[str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for (name, kind), v in zip(EPISODE_SCHEMA, row):
+        if kind == "str": out[name] = v
+        elif kind == "bool": out[name] = v == "True"
+        elif v == "": out[name] = None
+        else: out[name] = int(v) if kind == "int" else float(v)
+    return out
+
+class EpisodeSink:
+    """Storage sink merging consecutive notable samples into episodes.
+
+    Per device, samples with the same alert / reason / ml_pred / pump state, less than
+    `gap_secs` apart, are one episode with start, end, duration, sample count, summed pump
+    recommendation and peak values. A non-notable sample, a state change or a gap closes it.
+    Closed episodes are appended to `path` (CSV, EPISODE_FIELDS) and to an index beside it
+    (`.idx`, INDEX_DTYPE: time span, byte offset and device hash per row), so `query` touches
+    O(episodes) bytes however many samples went in. Open episodes are part of `position()`,
+    so a write-ahead-log rewind restores them and an episode continues across restarts.
+    """
+    kind = "episodes"
+
+    def __init__(self, path: Path, gap_secs: float = 30.0):
+        self.path = Path(path); self.idx_path = self.path.with_suffix(".idx")
+        self.name = str(self.path); self.gap_secs = gap_secs
+        self.fh = None; self.idx = None
+        self._open: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.repaired_bytes = 0; self.bytes_written = 0; self.closed = 0
+
+    # --- writer side (storage sink interface) ---
+    def open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # the index is written after the CSV: cut both back to the last indexed row
+        n = self.idx_path.stat().st_size // INDEX_DTYPE.itemsize if self.idx_path.exists() else 0
+        end = 0
+        if n:
+            last = np.fromfile(self.idx_path, dtype=INDEX_DTYPE, offset=(n - 1) * INDEX_DTYPE.itemsize, count=1)[0]
+            end = int(last["off"]) + int(last["len"])
+        self._truncate(self.idx_path, n * INDEX_DTYPE.itemsize)
+        if n: self._truncate(self.path, end)
+        elif self.path.exists() and self.path.stat().st_size > self._header_bytes():
+            self._truncate(self.path, self._header_bytes())
+        self.fh = self.path.open("ab"); self.idx = self.idx_path.open("ab")
+        if self.fh.tell() == 0: self.fh.write(self._line(EPISODE_FIELDS))
+
+    def _truncate(self, path: Path, size: int) -> None:
+        if path.exists() and path.stat().st_size > size:
+            self.repaired_bytes += path.stat().st_size - size
+            with path.open("r+b") as f: f.truncate(size)
+
+    @staticmethod
+    def _line(cells: List[Any]) -> bytes:
+        buf = io.StringIO(); csv.writer(buf).writerow(cells)
+        return buf.getvalue().encode("utf-8")
+
+    def _header_bytes(self) -> int:
+        return len(self._line(EPISODE_FIELDS))
+
+    def write(self, objs: List[Any]) -> None:
+        done: List[Dict[str, Any]] = []
+        with self._lock:
+            ts = None
+            for r in objs:
+                ts = r.get("ts"); dev = r.get("device")
+                if ts is None: continue
+                dev = dev or ""
+                ep = self._open.get(dev)
+                hit = notable(r)
+                # a change in any of these starts a new episode
+                key = [bool(r.get("alert")), str(r.get("reason") or "none"), str(r.get("ml_pred") or ""),
+                       bool(r.get("pump"))]
+                # a buffered upload arrives after newer samples: that is a gap too
+                if ep is not None and (not hit or ep["key"] != key or abs(ts - ep["end"]) > self.gap_secs):
+                    done.append(self._open.pop(dev)); ep = None
+                if not hit: continue
+                if ep is None:
+                    ep = self._open[dev] = {"device": dev, "key": key, "start": ts, "end": ts, "samples": 0,
+                                            "context": str(r.get("context") or ""), "rec_ms": 0,
+                                            "peaks": [None] * len(PEAKS)}
+                ep["start"] = min(ep["start"], ts); ep["end"] = max(ep["end"], ts); ep["samples"] += 1; ep["rec_ms"] += max(0, _rec_ms(r.get("rec_ms")))
+                pk = ep["peaks"]
+                for i, (f, agg) in enumerate(PEAKS):
+                    v = _peak(r.get(f))
+                    if v is None: continue
+                    if pk[i] is None or (v < pk[i] if agg == "min" else v > pk[i]): pk[i] = v
+            if ts is not None:   # devices that went quiet
+                for dev in [d for d, ep in self._open.items() if ts - ep["end"] > self.gap_secs]:
+                    done.append(self._open.pop(dev))
+            self._append(done)
+
+    def _append(self, eps: List[Dict[str, Any]]) -> None:
+        if not eps: return
+        eps.sort(key=lambda e: e["end"])
+        lines = []; rows = np.empty(len(eps), dtype=INDEX_DTYPE); off = self.fh.tell()
+        for i, ep in enumerate(eps):
+            line = self._line([_cell(v) for v in self.record(ep).values()])
+            rows[i] = (ep["start"], ep["end"], off, len(line), _device_code(ep["device"]))
+            lines.append(line); off += len(line)
+        data = b"".join(lines)
+        self.fh.write(data); self.idx.write(rows.tobytes())
+        self.bytes_written += len(data) + rows.nbytes; self.closed += len(eps)
+
+    @staticmethod
+    def record(ep: Dict[str, Any]) -> Dict[str, Any]:
+        alert, reason, ml_pred, pump = ep["key"]
+        out = {"device": ep["device"], "start": ep["start"], "end": ep["end"],
+               "duration_s": round(ep["end"] - ep["start"], 3), "samples": ep["samples"],
+               "alert": alert, "reason": reason, "context": ep["context"], "ml_pred": ml_pred, "pump": pump,
+               "rec_ms": ep["rec_ms"]}
+        out.update({f"{f}_{agg}": v for (f, agg), v in zip(PEAKS, ep["peaks"])})
+        return out
+
+    def flush(self, sync: bool) -> None:
+        with self._lock:
+            self.fh.flush()
+            if sync: os.fsync(self.fh.fileno())
+            self.idx.flush()   # after the CSV, so every indexed row is readable
+            if sync: os.fsync(self.idx.fileno())
+
+    def close(self) -> None:
+        if self.fh is None: return
+        with self._lock:
+            self._append(list(self._open.values())); self._open.clear()
+        self.flush(True); self.fh.close(); self.idx.close(); self.fh = None; self.idx = None
+
+    def position(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": self.fh.tell(), "count": self.idx.tell() // INDEX_DTYPE.itemsize,
+                    "open": [dict(ep, peaks=list(ep["peaks"])) for ep in self._open.values()]}
+
+    def rewind(self, pos: Dict[str, Any]) -> None:
+        """Cut back to a checkpointed position and reopen its episodes (before open)."""
+        self._truncate(self.idx_path, int(pos.get("count", 0)) * INDEX_DTYPE.itemsize)
+        self._truncate(self.path, int(pos.get("size", 0)))
+        self._open = {ep["device"]: ep for ep in pos.get("open", [])}
+
+    # --- reader side ---
+    def query(self, t0: Optional[float] = None, t1: Optional[float] = None, device: Optional[str] = None,
+              limit: int = 200, include_open: bool = True) -> List[Dict[str, Any]]:
+        """The newest `limit` (0: all) episodes overlapping [t0, t1], oldest first; open ones have `open: true`."""
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            live = [self.record(ep) for ep in self._open.values()] if include_open else []
+            if self.fh is not None: self.fh.flush(); self.idx.flush()   # rows closed by the last batch
+        for ep in live:
+            if (device is None or ep["device"] == device) and (t0 is None or ep["end"] >= t0) and \
+               (t1 is None or ep["start"] <= t1):
+                ep["open"] = True; out.append(ep)
+        n = self.idx_path.stat().st_size // INDEX_DTYPE.itemsize if self.idx_path.exists() else 0
+        if n and (not limit or len(out) < limit):
+            idx = np.memmap(self.idx_path, dtype=INDEX_DTYPE, mode="r", shape=(n,))
+            lo = int(np.searchsorted(np.maximum.accumulate(idx["end"]), t0, "left")) if t0 is not None else 0
+            part = idx[lo:]
+            ok = np.ones(len(part), dtype=bool)
+            if t0 is not None: ok &= part["end"] >= t0
+            if t1 is not None: ok &= part["start"] <= t1
+            if device is not None: ok &= part["dev"] == _device_code(device)
+            hits = np.flatnonzero(ok)[::-1]
+            with self.path.open("rb") as f:
+                for i in hits:
+                    f.seek(int(part["off"][i])); ep = _parse(next(csv.reader([f.read(int(part["len"][i])).decode("utf-8")])))
+                    if device is not None and ep["device"] != device: continue   # hash collision
+                    out.append(ep)
+                    if limit and len(out) >= limit: break
+        out.sort(key=lambda e: (e["start"], e["end"]))
+        return out[-limit:] if limit else out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"closed": self.closed, "open": len(self._open), "bytes_written": self.bytes_written,
+                "repaired_bytes": self.repaired_bytes}
+
+def to_csv(eps: List[Dict[str, Any]]) -> bytes:
+    buf = io.StringIO(); w = csv.writer(buf)
+    w.writerow(EPISODE_FIELDS + ["open"])
+    w.writerows([_cell(ep.get(f)) for f in EPISODE_FIELDS] + [bool(ep.get("open"))] for ep in eps)
+    return buf.getvalue().encode("utf-8")
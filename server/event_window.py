@@ -0,0 +1,90 @@
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Sequence
+
+DUTY_WINDOW_S = 3600.0
+BURST_DT_S = 60.0
+
+def burst_effect(ts: Sequence[float], vals: Sequence[float], dt: float = BURST_DT_S,
+                 min_drop: float = 0.1, lo: int = 0) -> bool:
+    """Whether dT_tb moved by `min_drop` over the last `dt`: the latest sample against the last one at
+    or before latest - dt.  `ts` is sorted and `vals` has no NaN; True while there is too little history.
+
+    The one efficacy definition, shared by the alert embed and `/events`.
+    """
+    if len(ts) - lo < 2: return True
+    i = bisect_right(ts, ts[-1] - dt, lo) - 1
+    if i < lo: return True
+    return abs(float(vals[-1]) - float(vals[i])) >= min_drop
+
+class _Ring:
+    """Append-only time-ordered columns with O(1) amortized eviction from the front."""
+    def __init__(self):
+        self.ts: List[float] = []
+        self.vals: List[Any] = []
+        self.head = 0
+
+    def __len__(self) -> int:
+        return len(self.ts) - self.head
+
+    def append(self, ts: float, val: Any) -> None:
+        if self.ts and ts < self.ts[-1]: ts = self.ts[-1]   # keep the index sorted under clock skew
+        self.ts.append(ts); self.vals.append(val)
+
+    def evict_before(self, cutoff: float) -> None:
+        if self.head < len(self.ts) and self.ts[self.head] <= cutoff:
+            self.head = bisect_right(self.ts, cutoff, self.head)
+        if self.head > 1024 and self.head * 2 > len(self.ts):
+            del self.ts[:self.head]; del self.vals[:self.head]; self.head = 0
+
+    def last_at_or_before(self, t: float) -> Optional[int]:
+        i = bisect_right(self.ts, t, self.head) - 1
+        return i if i >= self.head else None
+
+    def first_at_or_after(self, t: float) -> Optional[int]:
+        i = bisect_left(self.ts, t, self.head)
+        return i if i < len(self.ts) else None
+
+class EventWindow:
+    """Bounded per-device event history keeping only what the alert aggregates need.
+
+    Pump recommendations are held with a running prefix sum so duty over any window up to
+    `horizon_s` is one bisect; dT_tb samples are indexed by time for the t-minus-dt lookup.
+    """
+    def __init__(self, horizon_s: float = max(DUTY_WINDOW_S, BURST_DT_S)):
+        self.horizon_s = horizon_s
+        self._rec = _Ring()     # vals: (cumulative rec_ms before, cumulative rec_ms after) this entry
+        self._dt = _Ring()      # vals: dT_tb
+        self._rec_total = 0
+
+    def __len__(self) -> int:
+        return len(self._rec) + len(self._dt)
+
+    def push(self, ev: Dict[str, Any]) -> None:
+        ts = ev.get("ts")
+        if not isinstance(ts, (int, float)): return
+        rec = ev.get("rec_ms", 0)
+        try: rec = int(rec or 0)
+        except (TypeError, ValueError): rec = 0
+        if rec > 0:
+            self._rec.append(ts, (self._rec_total, self._rec_total + rec))
+            self._rec_total += rec
+        d = ev.get("dT_tb")
+        if isinstance(d, (int, float)) and not isinstance(d, bool):
+            self._dt.append(ts, float(d))
+        self._evict(ts)
+
+    def _evict(self, now: float) -> None:
+        cutoff = now - self.horizon_s
+        self._rec.evict_before(cutoff); self._dt.evict_before(cutoff)
+
+    def pump_duty_s(self, window_s: float = DUTY_WINDOW_S, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        r = self._rec
+        first = r.first_at_or_after(now - window_s)
+        last = r.last_at_or_before(now)
+        if first is None or last is None or last < first: return 0.0
+        return (r.vals[last][1] - r.vals[first][0]) / 1000.0
+
+    def burst_effect(self, dt: float = BURST_DT_S, min_drop: float = 0.1) -> bool:
+        return burst_effect(self._dt.ts, self._dt.vals, dt, min_drop, self._dt.head)
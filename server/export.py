@@ -0,0 +1,86 @@
+import io, re, csv, json, zlib, hashlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend import TelemetryBackend
+from colstore import format_column, to_records
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+class ExportError(ValueError):
+    pass
+
+def select_fields(spec: Optional[str], fields: Sequence[str]) -> List[str]:
+    """`fields=a,b` from a query string, in the caller's order; all fields when empty."""
+    if not spec: return list(fields)
+    out = list(dict.fromkeys(f.strip() for f in spec.split(",") if f.strip()))
+    bad = [f for f in out if f not in fields]
+    if bad: raise ExportError(f"unknown fields: {', '.join(bad)}")
+    return out or list(fields)
+
+def iter_csv(store: TelemetryBackend, fields: Sequence[str], t0: Optional[float], t1: Optional[float],
+             device: Optional[str], extra: Sequence[str] = (),
+             where: Optional[Tuple[Sequence[str], Callable[[Dict[str, np.ndarray]], np.ndarray]]] = None) -> Iterator[bytes]:
+    """CSV text for the selected rows, one encoded piece per store chunk; the header is `fields + extra`.
+
+    `where` is (columns it needs, chunk -> row mask) to export only some rows.
+    """
+    buf = io.StringIO(); w = csv.writer(buf)
+    w.writerow(list(fields) + list(extra))
+    read = list(fields) + ([f for f in where[0] if f not in fields] if where else [])
+    for chunk in store.iter_chunks(t0, t1, read, device):
+        if where is not None:
+            keep = where[1](chunk)
+            if not keep.any(): continue
+            chunk = {f: chunk[f][keep] for f in fields}
+        cols = [format_column(f, chunk[f]) for f in fields]
+        n = len(cols[0]) if cols else 0
+        cols += [[""] * n for _ in extra]
+        w.writerows(zip(*cols))
+        yield buf.getvalue().encode("utf-8"); buf.seek(0); buf.truncate()
+    if buf.tell(): yield buf.getvalue().encode("utf-8")
+
+def iter_ndjson(store: TelemetryBackend, fields: Sequence[str], t0: Optional[float], t1: Optional[float],
+                device: Optional[str]) -> Iterator[bytes]:
+    for chunk in store.iter_chunks(t0, t1, fields, device):
+        yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in to_records(chunk, fields)).encode("utf-8")
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)   # wbits 31: gzip framing
+    for c in chunks:
+        out = z.compress(c)
+        if out: yield out
+    yield z.flush()
+
+def parse_range(header: Optional[str]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """(first, last) of a single `bytes=` range; None for no, malformed or multi-part ranges (served whole)."""
+    if not header: return None
+    m = _RANGE.fullmatch(header.replace(" ", ""))
+    if m is None or not (m.group(1) or m.group(2)): return None
+    a = int(m.group(1)) if m.group(1) else None; b = int(m.group(2)) if m.group(2) else None
+    if a is not None and b is not None and b < a: return None
+    return a, b
+
+def resolve_range(rng: Tuple[Optional[int], Optional[int]], total: int) -> Optional[Tuple[int, int]]:
+    """Inclusive byte bounds within `total`, or None when the range is not satisfiable (416)."""
+    a, b = rng
+    if a is None:   # suffix: the last b bytes
+        if not b or not total: return None
+        return max(0, total - b), total - 1
+    if a >= total: return None
+    return a, total - 1 if b is None else min(b, total - 1)
+
+def slice_bytes(chunks: Iterable[bytes], first: int, last: int) -> Iterator[bytes]:
+    pos = 0
+    for c in chunks:
+        end = pos + len(c)
+        if end > first: yield c[max(0, first - pos):last + 1 - pos]
+        pos = end
+        if pos > last: return
+
+def total_bytes(chunks: Iterable[bytes]) -> int:
+    return sum(len(c) for c in chunks)
+
+def etag(*parts: object) -> str:
+    return '"' + hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:20] + '"'
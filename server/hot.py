@@ -0,0 +1,285 @@
+import zlib, threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from colstore import (BOOL_FIELDS, STR_FIELDS, TS_FIELD, FLAGS_FILE, INT_NULL, ColumnStore,
+                      encode_rows, to_records, _column_file, _read_dtype)
+
+BLOCK_ROWS = 4096
+ZLIB_LEVEL = 6
+
+def _dod(v: np.ndarray) -> np.ndarray:
+    """int64 values as first value, first delta, then deltas of deltas (wrapping, so lossless)."""
+    out = v.copy()
+    if len(v) > 1:
+        d = np.diff(v); out[1] = d[0]; out[2:] = np.diff(d)
+    return out
+
+def _undod(e: np.ndarray) -> np.ndarray:
+    if len(e) < 2: return e.copy()
+    out = np.empty_like(e); out[0] = e[0]
+    out[1:] = e[0] + np.cumsum(np.cumsum(e[1:]))
+    return out
+
+def _pack(a: np.ndarray) -> Tuple[str, Any, bytes]:
+    """One column of a sealed block as (transform, dtype, zlib payload)."""
+    if a.dtype in (np.float64, np.int64):
+        # timestamps (their int64 bit patterns grow linearly for a steady rate) and ms
+        e = _dod(a.view(np.int64)); body = e[2:]
+        if not len(body) or (body.min() >= np.iinfo(np.int32).min and body.max() <= np.iinfo(np.int32).max):
+            return "dod32", a.dtype, zlib.compress(e[:2].tobytes() + body.astype(np.int32).tobytes(), ZLIB_LEVEL)
+        return "dod", a.dtype, zlib.compress(e.tobytes(), ZLIB_LEVEL)
+    if a.dtype == np.float32:
+        # Gorilla: a slowly moving sensor shares sign, exponent and high mantissa bits with its last value
+        bits = a.view(np.uint32); e = bits.copy(); e[1:] ^= bits[:-1]
+        return "xor", a.dtype, zlib.compress(e.tobytes(), ZLIB_LEVEL)
+    return "raw", a.dtype, zlib.compress(a.tobytes(), ZLIB_LEVEL)
+
+def _unpack(kind: str, dt: Any, data: bytes) -> np.ndarray:
+    raw = zlib.decompress(data)
+    if kind == "dod32":
+        head = np.frombuffer(raw[:16], dtype=np.int64)
+        e = np.concatenate([head, np.frombuffer(raw[16:], dtype=np.int32).astype(np.int64)])
+        return _undod(e).view(dt)
+    if kind == "dod": return _undod(np.frombuffer(raw, dtype=np.int64)).view(dt)
+    if kind == "xor": return np.bitwise_xor.accumulate(np.frombuffer(raw, dtype=np.uint32)).view(dt)
+    return np.frombuffer(raw, dtype=dt)
+
+def _dict_bytes(dicts: Dict[str, List[str]]) -> int:
+    return sum(len(s) + 8 for strings in dicts.values() for s in strings)
+
+class _Block:
+    """Sealed rows: every column compressed on its own, decompressed per read and field."""
+    __slots__ = ("rows", "t0", "t1", "sorted", "cols", "dicts", "nbytes")
+
+    def __init__(self, rows: int, arrays: Dict[str, np.ndarray], dicts: Dict[str, List[str]], sorted: bool):
+        self.rows = rows; ts = arrays[TS_FIELD][:rows]
+        self.t0 = float(ts.min()); self.t1 = float(ts.max()); self.sorted = sorted
+        self.cols = {f: _pack(np.ascontiguousarray(a[:rows])) for f, a in arrays.items()}
+        self.dicts = dicts
+        self.nbytes = sum(len(c[2]) for c in self.cols.values()) + _dict_bytes(dicts)
+
+    def open(self, files: Sequence[str]) -> Dict[str, np.ndarray]:
+        return {f: _unpack(*self.cols[f]) for f in files}
+
+class _Head:
+    """The block being filled: preallocated columns readers slice up to a snapshot's row count."""
+    __slots__ = ("rows", "arrays", "dicts", "codes", "t0", "t1", "sorted")
+
+    def __init__(self, fields: Sequence[str]):
+        self.rows = 0; self.t0 = float("inf"); self.t1 = float("-inf"); self.sorted = True
+        self.arrays: Dict[str, np.ndarray] = {FLAGS_FILE: np.zeros(BLOCK_ROWS, dtype=np.uint16)}
+        for f in fields:
+            if f in BOOL_FIELDS: continue
+            self.arrays[f] = np.empty(BLOCK_ROWS, dtype=np.uint16 if f in STR_FIELDS else _column_file(f)[1])
+        self.dicts: Dict[str, List[str]] = {f: [] for f in STR_FIELDS if f in fields}
+        self.codes: Dict[str, Dict[str, int]] = {f: {} for f in self.dicts}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays.values()) + _dict_bytes(self.dicts)
+
+class _DeviceTier:
+    """One device's sealed blocks and the block it is filling, and how far eviction has cut it."""
+    __slots__ = ("blocks", "head", "floor", "sealed_bytes")
+
+    def __init__(self, fields: Sequence[str], floor: float):
+        self.blocks: List[_Block] = []; self.head = _Head(fields)
+        self.floor = floor; self.sealed_bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.sealed_bytes + self.head.nbytes
+
+    @property
+    def newest(self) -> Optional[float]:
+        return self.head.t1 if self.head.rows else (self.blocks[-1].t1 if self.blocks else None)
+
+class HotTier(ColumnStore):
+    """The newest telemetry in memory, compressed, per device, for reads of recent windows.
+
+    A storage sink (after the backend, so it holds what the backend holds) laid out like
+    column-store segments of BLOCK_ROWS rows, kept apart per device: the block being filled
+    keeps plain typed arrays, sealed blocks keep each column zlib-compressed after a transform
+    that leaves mostly zero bytes: delta-of-delta for timestamps and ms, XOR with the previous
+    value (Gorilla) for float32 sensors. Blocks older than `secs` behind the newest row are
+    dropped, and while the tier is over `max_bytes` the oldest block of the device holding the
+    most goes, so a chatty device cannot push a quiet one's window out. Reads are ColumnStore's,
+    merged by ts across devices and late blocks, so results are the same arrays the backend
+    returns; `covers(t0, device)` says whether a read from t0 on is complete here: rows stored
+    before the tier started (`stored_until()` at open) or evicted from that device are not.
+    """
+    kind = "hot"
+
+    def __init__(self, fields: Sequence[str], secs: float = 21600.0, max_bytes: int = 64 << 20,
+                 stored_until: Callable[[], Optional[float]] = lambda: None):
+        self.fields = list(fields); self.secs = float(secs); self.max_bytes = int(max_bytes)
+        self.stored_until = stored_until
+        self.name = "hot"; self.segment_secs = 0
+        self._tiers: Dict[str, _DeviceTier] = {}
+        self._lock = threading.Lock()
+        self.floor = float("inf")   # nothing is covered until open
+        self.evicted_rows = 0; self.evicted_blocks = 0; self.hits = 0; self.misses = 0
+
+    # --- writer side (storage sink interface) ---
+    def open(self) -> None:
+        last = self.stored_until()
+        self.floor = float("-inf") if last is None else last
+        with self._lock:
+            for t in self._tiers.values(): t.floor = max(t.floor, self.floor)
+
+    def write(self, objs: List[Any]) -> None:
+        by_dev: Dict[str, List[Any]] = {}
+        for o in objs: by_dev.setdefault(o.get("device") or "", []).append(o)
+        for dev, rows in by_dev.items():
+            tier = self._tiers.get(dev)
+            if tier is None:
+                with self._lock: tier = self._tiers[dev] = _DeviceTier(self.fields, self.floor)
+            self._fill(tier, rows)
+        self._evict()
+
+    def _fill(self, tier: _DeviceTier, objs: List[Any]) -> None:
+        start = 0
+        while start < len(objs):
+            head = tier.head
+            part = objs[start:start + BLOCK_ROWS - head.rows]
+            cols, _ = encode_rows(part, self.fields, head.dicts, head.codes)
+            n = len(part); r = head.rows
+            for f, a in cols.items(): head.arrays[f][r:r + n] = a
+            ts = cols[TS_FIELD]
+            if len(ts):
+                if ts[0] < head.t1 or (np.diff(ts) < 0).any(): head.sorted = False
+                head.t0 = min(head.t0, float(ts.min())); head.t1 = max(head.t1, float(ts.max()))
+            head.rows = r + n   # publish after the arrays are filled
+            start += n
+            if head.rows >= BLOCK_ROWS: self._seal(tier)
+
+    def _seal(self, tier: _DeviceTier) -> None:
+        head = tier.head
+        blk = _Block(head.rows, head.arrays, head.dicts, head.sorted)
+        with self._lock:
+            tier.blocks.append(blk); tier.head = _Head(self.fields); tier.sealed_bytes += blk.nbytes
+
+    def _evict(self) -> None:
+        with self._lock:
+            tiers = list(self._tiers.values())
+            newest = max((t.newest for t in tiers if t.newest is not None), default=None)
+            if newest is None: return
+            for t in tiers:
+                while t.blocks and t.blocks[0].t1 < newest - self.secs: self._drop(t)
+            total = sum(t.nbytes for t in tiers)
+            while total > self.max_bytes:   # the block being filled stays: only sealed ones go
+                t = max((t for t in tiers if t.blocks), key=lambda t: t.nbytes, default=None)
+                if t is None: break
+                total -= self._drop(t)
+
+    def _drop(self, tier: _DeviceTier) -> int:
+        blk = tier.blocks.pop(0)
+        tier.floor = max(tier.floor, blk.t1); tier.sealed_bytes -= blk.nbytes
+        self.evicted_rows += blk.rows; self.evicted_blocks += 1
+        return blk.nbytes
+
+    def _bytes(self) -> int:
+        return sum(t.nbytes for t in self._tiers.values())
+
+    def flush(self, sync: bool) -> None: pass
+    def close(self) -> None: pass
+    def position(self) -> Dict[str, Any]: return {}
+    def rewind(self, pos: Dict[str, Any]) -> None:
+        """Start over empty (before open): the writer replays the log after a failed write, and
+        `open` moves the floor up to what the backend holds by then."""
+        with self._lock:
+            self._tiers = {}; self.floor = float("inf")
+
+    # --- reader side ---
+    def covers(self, t0: Optional[float], device: Optional[str] = None) -> bool:
+        """Whether every stored row from `t0` on (of `device`, or of all) is in the tier (counted as a hit or a miss)."""
+        with self._lock:
+            tiers = list(self._tiers.values()) if device is None else [self._tiers.get(device)]
+        floor = max([self.floor] + [t.floor for t in tiers if t is not None])
+        ok = t0 is not None and t0 > floor
+        if ok: self.hits += 1
+        else: self.misses += 1
+        return ok
+
+    def segments(self, t0: Optional[float] = None, t1: Optional[float] = None,
+                 device: Optional[str] = None) -> List[Tuple[float, Any]]:
+        with self._lock:
+            tiers = list(self._tiers.values()) if device is None else [self._tiers[device]] if device in self._tiers else []
+            parts: List[Any] = [p for t in tiers for p in t.blocks + ([(t.head.rows, t.head)] if t.head.rows else [])]
+        out = []
+        for p in parts:
+            lo, hi = (p[1].t0, p[1].t1) if isinstance(p, tuple) else (p.t0, p.t1)
+            if (t1 is not None and lo > t1) or (t0 is not None and hi < t0): continue
+            out.append((lo, p))
+        return out
+
+    def _open_segment(self, part: Any, fields: Sequence[str]) -> Tuple[int, Dict[str, np.ndarray], Dict[str, List[str]]]:
+        need = set(fields) | {TS_FIELD}
+        files = [f for f in need if f not in BOOL_FIELDS]
+        if need & set(BOOL_FIELDS): files.append(FLAGS_FILE)
+        if isinstance(part, tuple):
+            rows, head = part
+            return rows, {f: head.arrays[f] for f in files}, head.dicts
+        return part.rows, part.open(files), part.dicts
+
+    def _sorted(self, part: Any) -> bool:
+        return (part[1] if isinstance(part, tuple) else part).sorted
+
+    def read(self, t0: Optional[float] = None, t1: Optional[float] = None,
+             fields: Optional[Sequence[str]] = None, device: Optional[str] = None,
+             decode: bool = True) -> Dict[str, np.ndarray]:
+        fields = [f for f in (fields or self.fields) if f in self.fields]
+        if TS_FIELD not in fields: fields = [TS_FIELD] + fields
+        parts = [self.read_segment(p, t0, t1, fields, device, decode) for _, p in self.segments(t0, t1, device)]
+        parts = [x for x in parts if x is not None and len(x[TS_FIELD])]
+        if not parts: return {f: np.empty(0, dtype=_read_dtype(f, decode)) for f in fields}
+        out = {f: np.concatenate([x[f] for x in parts]) for f in fields}
+        ts = out[TS_FIELD]
+        if len(ts) > 1 and (np.diff(ts) < 0).any():   # devices and late rows: blocks overlap in time
+            order = np.argsort(ts, kind="stable")
+            out = {f: a[order] for f, a in out.items()}
+        return out
+
+    def iter_chunks(self, t0: Optional[float] = None, t1: Optional[float] = None,
+                    fields: Optional[Sequence[str]] = None, device: Optional[str] = None,
+                    chunk_rows: int = 8192) -> Iterator[Dict[str, np.ndarray]]:
+        """Like ColumnStore.iter_chunks, from one ordered read: the tier only holds a recent window."""
+        fields = [f for f in (fields or self.fields) if f in self.fields]
+        data = self.read(t0, t1, fields, device, decode=True)
+        for i in range(0, len(data[TS_FIELD]), chunk_rows):
+            yield {f: data[f][i:i + chunk_rows] for f in fields}
+
+    def recent_events(self, fields: Sequence[str], t0: Optional[float], t1: Optional[float],
+                      device: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        full = self.read(t0, t1, list(fields) + ["alert", "rec_ms"], device, decode=True)
+        rec = full["rec_ms"]
+        hit = np.flatnonzero((full["alert"] == "True") | ((rec > 0) & (rec != INT_NULL[np.int32])))[-limit:]
+        return to_records({f: full[f][hit] for f in fields}, fields)
+
+    def first_ts(self) -> Optional[float]:
+        segs = self.segments()
+        return min(lo for lo, _ in segs) if segs else None
+
+    def last_ts(self) -> Optional[float]:
+        segs = self.segments()
+        return max(p[1].t1 if isinstance(p, tuple) else p.t1 for _, p in segs) if segs else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {d: (list(t.blocks), t.head, t.head.rows, t.floor) for d, t in self._tiers.items()}
+        blocks = [b for bs, _, _, _ in tiers.values() for b in bs]
+        sealed = sum(b.rows for b in blocks); packed = sum(b.nbytes for b in blocks)
+        width = sum(np.dtype(_column_file(f)[1]).itemsize for f in self.fields if f not in BOOL_FIELDS) + 2
+        fin = lambda x: x if abs(x) != float("inf") else None
+        return {"rows": sealed + sum(r for _, _, r, _ in tiers.values()), "blocks": len(blocks),
+                "bytes": packed + sum(h.nbytes for _, h, _, _ in tiers.values()),
+                "max_bytes": self.max_bytes, "secs": self.secs,
+                "bytes_per_row": round(packed / sealed, 2) if sealed else None,
+                "ratio": round(sealed * width / packed, 2) if packed else None,
+                "floor": fin(self.floor),
+                "devices": {d: {"rows": sum(b.rows for b in bs) + r, "bytes": sum(b.nbytes for b in bs) + h.nbytes,
+                                "floor": fin(f)} for d, (bs, h, r, f) in tiers.items()},
+                "evicted_rows": self.evicted_rows, "evicted_blocks": self.evicted_blocks,
+                "hits": self.hits, "misses": self.misses}
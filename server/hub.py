@@ -0,0 +1,42 @@
+"""The single-writer process of multi-worker mode (started by serve.py).
+
+It owns what the collector keeps per process: device state and rolling windows, the
+detectors and ML model, storage and the alert pipeline. Ingest workers hand it coerced
+samples over a Unix socket and ask it for reads; it relays stream messages back to them.
+"""
+import os, sys, signal, asyncio
+from pathlib import Path
+
+async def _serve(path: Path) -> None:
+    import main
+    from ipc import HubServer
+
+    def view(name, **kw):
+        out = main.VIEWS[name](**kw)
+        if name == "health": out["hub"] = server.stats()
+        return out
+
+    server = HubServer(path, {
+        "process": main._process,
+        "flush": lambda: asyncio.to_thread(main._store.flush),
+        "view": view,
+        "alert_test": main._send_test_alert,
+    }, families=main._metrics.families)
+    await main._start()
+    main._hub.forward = server.push
+    await server.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT): loop.add_signal_handler(sig, stop.set)
+    try: await stop.wait()
+    finally:
+        await server.close()
+        await main._stop()
+
+def run(path: str) -> None:
+    os.environ["UBI_ROLE"] = "hub"
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    asyncio.run(_serve(Path(path)))
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("UBI_HUB_SOCKET", "data/hub.sock"))
@@ -0,0 +1,251 @@
+import sys, csv, json, math, time, asyncio, argparse, contextlib, collections
+from itertools import islice
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FIRMWARE_DIR = Path(__file__).resolve().parent.parent / "firmware"
+MODEL_PATH = FIRMWARE_DIR / "esp32s3_ripple_classifier.tflite"
+META_PATH = FIRMWARE_DIR / "preprocess.json"
+DTDT_ROWS = 60          # dTdt_mid = tMid - tMid 60 samples earlier (train_model.ipynb: diff(60) at 1 Hz)
+TDS_ALPHA = 0.01        # tds_delta = tds_mV - EMA(tds_mV), as in train_model.ipynb
+SCORE_BATCH = 8192
+
+def load_interpreter(path: Path):
+    """First available TFLite runtime: ai-edge-litert, tflite-runtime, then full TensorFlow."""
+    for mod, attr in (("ai_edge_litert.interpreter", "Interpreter"),
+                      ("tflite_runtime.interpreter", "Interpreter"),
+                      ("tensorflow.lite", "Interpreter")):
+        try:
+            m = __import__(mod, fromlist=[attr])
+        except ImportError:
+            continue
+        return getattr(m, attr)(model_path=str(path))
+    return None
+
+class TFLiteModel:
+    """The firmware classifier with its input quantization, run on (n, features) float batches."""
+    def __init__(self, model_path: Path = MODEL_PATH, meta_path: Path = META_PATH, max_batch: int = 256):
+        meta = json.loads(Path(meta_path).read_text(encoding="utf-8"))
+        self.features: List[str] = meta["input_features"]
+        self.classes: List[str] = meta["classes"]
+        ss = meta.get("scale_shift") or {}
+        self.scale = np.asarray(ss.get("scale", [1.0] * len(self.features)), dtype=np.float32)
+        self.shift = np.asarray(ss.get("shift", [0.0] * len(self.features)), dtype=np.float32)
+        self.interp = load_interpreter(Path(model_path))
+        if self.interp is None:
+            raise RuntimeError("no TFLite runtime installed (pip install ai-edge-litert or tflite-runtime)")
+        self.inp = self.interp.get_input_details()[0]; self.max_batch = max_batch
+        self.interp.resize_tensor_input(self.inp["index"], [max_batch, len(self.features)])
+        self.interp.allocate_tensors()
+        self.inp = self.interp.get_input_details()[0]; self.out = self.interp.get_output_details()[0]
+
+    def _quant(self, x: np.ndarray, detail: Dict[str, Any]) -> np.ndarray:
+        sc, zp = detail["quantization"]
+        if detail["dtype"] == np.float32 or not sc: return x.astype(detail["dtype"])
+        info = np.iinfo(detail["dtype"])
+        return np.clip(np.rint(x / sc + zp), info.min, info.max).astype(detail["dtype"])
+
+    def _dequant(self, y: np.ndarray, detail: Dict[str, Any]) -> np.ndarray:
+        sc, zp = detail["quantization"]
+        return y.astype(np.float32) if detail["dtype"] == np.float32 or not sc else (y.astype(np.float32) - zp) * sc
+
+    def predict(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Class index and score per row; NaN inputs become 0 as in the firmware's nz()."""
+        X = (np.nan_to_num(np.asarray(X, dtype=np.float32), nan=0.0) - self.shift) * self.scale
+        n = len(X); idx = np.empty(n, dtype=np.int64); conf = np.empty(n, dtype=np.float32)
+        buf = np.zeros((self.max_batch, X.shape[1]), dtype=np.float32)
+        for i in range(0, n, self.max_batch):
+            part = X[i:i + self.max_batch]; k = len(part)
+            buf[:k] = part; buf[k:] = 0.0
+            self.interp.set_tensor(self.inp["index"], self._quant(buf, self.inp))
+            self.interp.invoke()
+            y = self._dequant(self.interp.get_tensor(self.out["index"])[:k], self.out)
+            idx[i:i + k] = y.argmax(axis=1); conf[i:i + k] = y.max(axis=1)
+        return idx, conf
+
+class FeatureTracker:
+    """Per-device history for the model's derived inputs (dTdt_mid, tds_delta)."""
+    def __init__(self):
+        self.tmid: Deque[float] = collections.deque(maxlen=DTDT_ROWS + 1)
+        self.tds_base: Optional[float] = None
+
+    def push(self, payload: Dict[str, Any]) -> Dict[str, float]:
+        t = _num(payload.get("tMid")); self.tmid.append(t)
+        old = self.tmid[0]
+        dtdt = t - old if len(self.tmid) == self.tmid.maxlen and math.isfinite(t) and math.isfinite(old) else 0.0
+        tds = _num(payload.get("tds_mV")); delta = 0.0
+        if math.isfinite(tds):
+            self.tds_base = tds if self.tds_base is None else (1 - TDS_ALPHA) * self.tds_base + TDS_ALPHA * tds
+            delta = tds - self.tds_base
+        return {"dTdt_mid": dtdt, "tds_delta": delta}
+
+def _num(v: Any) -> float:
+    if v is None or isinstance(v, bool): return math.nan
+    try: return float(v)
+    except (TypeError, ValueError): return math.nan
+
+class MicroBatcher:
+    """Collects predictions from concurrent ingests into one interpreter call, off the event loop.
+
+    A batch runs when `max_batch` rows are waiting or `max_wait_ms` after the first one
+    arrived, so an idle server adds at most `max_wait_ms` to an ingest.  Every interpreter
+    call goes through here, one at a time, in a worker thread.
+    """
+    def __init__(self, model: Optional[TFLiteModel], max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.model = model; self.max_batch = max_batch; self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []; self._queued = 0
+        self._wake: Optional[asyncio.Event] = None; self._task: Optional[asyncio.Task] = None
+        self.batches = 0; self.samples = 0; self.infer_ns = 0; self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.model is not None
+
+    def vector(self, payload: Dict[str, Any], derived: Dict[str, float]) -> np.ndarray:
+        return np.array([derived[f] if f in derived else _num(payload.get(f)) for f in self.model.features],
+                        dtype=np.float32)
+
+    async def start(self) -> None:
+        if self.model is None or self._task is not None: return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None: return
+        self._task.cancel()
+        try: await self._task
+        except asyncio.CancelledError: pass
+        self._task = None
+        for _, fut in self._pending:
+            if not fut.done(): fut.cancel()
+        self._pending = []; self._queued = 0
+
+    async def predict(self, x: np.ndarray) -> Tuple[Optional[str], Optional[float]]:
+        return (await self.predict_many(x[None, :]))[0]
+
+    async def predict_many(self, X: np.ndarray) -> List[Tuple[Optional[str], Optional[float]]]:
+        """(class, score) per row of X, batched with whatever else is waiting."""
+        if self._task is None: return [(None, None)] * len(X)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((X, fut)); self._queued += len(X); self._wake.set()
+        return await fut
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            if self._queued < self.max_batch:
+                await asyncio.sleep(self.max_wait)
+            self._wake.clear()
+            k = rows = 0
+            while k < len(self._pending) and (k == 0 or rows + len(self._pending[k][0]) <= self.max_batch):
+                rows += len(self._pending[k][0]); k += 1
+            batch, self._pending = self._pending[:k], self._pending[k:]
+            self._queued -= rows
+            if self._pending: self._wake.set()
+            if not batch: continue
+            t0 = time.perf_counter_ns()
+            try:
+                idx, conf = await asyncio.to_thread(self.model.predict, np.concatenate([x for x, _ in batch]))
+            except Exception as e:
+                self.errors += 1
+                for _, fut in batch:
+                    if not fut.done(): fut.set_exception(e)
+                continue
+            self.infer_ns += time.perf_counter_ns() - t0
+            self.batches += 1; self.samples += rows
+            labels = [self.model.classes[i] for i in idx.tolist()]; conf = [round(c, 4) for c in conf.tolist()]
+            i = 0
+            for x, fut in batch:
+                if not fut.done(): fut.set_result(list(zip(labels[i:i + len(x)], conf[i:i + len(x)])))
+                i += len(x)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "batches": self.batches, "samples": self.samples, "errors": self.errors,
+                "pending": self._queued, "avg_batch": round(self.samples / self.batches, 2) if self.batches else None,
+                "avg_infer_us": round(self.infer_ns / self.batches / 1000, 1) if self.batches else None}
+
+# --- offline scoring of a stored telemetry file ---
+
+def derive_features(cols: Dict[str, np.ndarray], device: np.ndarray,
+                    state: Optional[Dict[str, Tuple[np.ndarray, Optional[float]]]] = None) -> Dict[str, np.ndarray]:
+    """dTdt_mid / tds_delta for whole columns, each device's rows in file order.
+
+    `state` carries each device's last DTDT_ROWS tMid and its TDS baseline from one chunk to the next.
+    """
+    state = {} if state is None else state
+    n = len(device); dtdt = np.zeros(n); delta = np.zeros(n)
+    tmid = cols["tMid"]; tds = cols["tds_mV"]
+    for dev in dict.fromkeys(device.tolist()):
+        rows = np.flatnonzero(device == dev)
+        tail, base = state.get(dev, (np.empty(0), None))
+        t = np.concatenate([tail, tmid[rows]])
+        d = np.zeros(len(t))
+        if len(t) > DTDT_ROWS: d[DTDT_ROWS:] = t[DTDT_ROWS:] - t[:-DTDT_ROWS]
+        dtdt[rows] = np.nan_to_num(d[len(tail):], nan=0.0)
+        out = np.zeros(len(rows))
+        for i, x in enumerate(tds[rows].tolist()):
+            if x == x:
+                base = x if base is None else (1 - TDS_ALPHA) * base + TDS_ALPHA * x
+                out[i] = x - base
+        delta[rows] = out
+        state[dev] = (t[-DTDT_ROWS:], base)
+    return {"dTdt_mid": dtdt, "tds_delta": delta}
+
+def score_file(csv_in: Path, csv_out: Optional[Path], model: TFLiteModel, batch: int = SCORE_BATCH) -> Dict[str, Any]:
+    """Score every row of a telemetry CSV with the model and compare with the device's own ml_pred.
+
+    The file is read, scored and written `batch` rows at a time, so memory stays flat on any size.
+    """
+    need = list(set(model.features) | {"tMid", "tds_mV"})
+    state: Dict[str, Tuple[np.ndarray, Optional[float]]] = {}
+    counts: collections.Counter = collections.Counter()
+    rows = compared = agree = 0; secs = 0.0
+    with contextlib.ExitStack() as stack:
+        rdr = csv.reader(stack.enter_context(Path(csv_in).open(newline="")))
+        header = next(rdr, None) or []
+        pos = {k: i for i, k in enumerate(header)}          # last duplicate wins, as in DictReader
+        w = None
+        if csv_out is not None:
+            w = csv.writer(stack.enter_context(Path(csv_out).open("w", newline="")))
+            w.writerow(["ts", "device", "ml_pred", "ml_conf", "srv_pred", "srv_conf"])
+        def col(block, k):
+            j = pos.get(k)
+            return ["" if j is None or j >= len(r) else r[j] for r in block]
+        while True:
+            block = [r for r in islice(rdr, batch) if r]
+            if not block: break
+            cols = {k: np.array([_num(v or None) for v in col(block, k)], dtype=np.float64) for k in need}
+            device = np.array(col(block, "device"), dtype=object)
+            cols.update(derive_features(cols, device, state))
+            X = np.column_stack([cols[f] for f in model.features]).astype(np.float32)
+            t0 = time.perf_counter()
+            idx, conf = model.predict(X)
+            secs += time.perf_counter() - t0
+            labels = [model.classes[i] for i in idx.tolist()]
+            dev_pred = col(block, "ml_pred")
+            counts.update(labels); rows += len(block)
+            both = [(a, b) for a, b in zip(dev_pred, labels) if a]
+            compared += len(both); agree += sum(a == b for a, b in both)
+            if w is not None:
+                w.writerows([t, d, p, c, lbl, round(x, 4)] for t, d, p, c, lbl, x in
+                            zip(col(block, "ts"), device.tolist(), dev_pred, col(block, "ml_conf"), labels, conf.tolist()))
+    return {"rows": rows, "seconds": round(secs, 3),
+            "rows_per_s": round(rows / secs) if secs > 0 else None,
+            "counts": dict(counts), "compared": compared, "agree": agree / compared if compared else None}
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Score a stored telemetry CSV with the firmware TFLite model.")
+    ap.add_argument("csv_in", type=Path)
+    ap.add_argument("-o", "--out", type=Path, default=None, help="write per-row predictions here")
+    ap.add_argument("--model", type=Path, default=MODEL_PATH)
+    ap.add_argument("--meta", type=Path, default=META_PATH)
+    ap.add_argument("--batch", type=int, default=SCORE_BATCH)
+    a = ap.parse_args(argv)
+    model = TFLiteModel(a.model, a.meta, max_batch=a.batch)
+    print(json.dumps(score_file(a.csv_in, a.out, model, a.batch), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import os, pickle, struct, asyncio, itertools
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from metrics import Family
+
+HEADER = struct.Struct("<I")
+MAX_FRAME = 256 << 20
+MAX_INFLIGHT = 1024        # calls a worker may have outstanding before new ones wait
+CALL_TIMEOUT = 30.0
+PUSH_BUFFER = 4 << 20      # a worker further behind than this loses stream pushes, never replies
+CONNECT_SECS = 10.0
+
+class HubError(Exception):
+    """The hub process could not be reached or its handler failed."""
+
+def frame(obj: Any) -> bytes:
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data)) + data
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    (n,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if n > MAX_FRAME: raise HubError(f"frame of {n} bytes")
+    return pickle.loads(await reader.readexactly(n))
+
+class _Peer:
+    __slots__ = ("writer", "watch", "families", "calls", "dropped")
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer; self.watch = False; self.families: List[Family] = []
+        self.calls = 0; self.dropped = 0
+
+    def send(self, data: bytes, droppable: bool = False) -> None:
+        if self.writer.is_closing(): return
+        if droppable and self.writer.transport.get_write_buffer_size() > PUSH_BUFFER:
+            self.dropped += 1; return
+        self.writer.write(data)
+
+class HubServer:
+    """The single-writer side of multi-worker mode: ingest workers call into it over a Unix socket.
+
+    Frames are length-prefixed pickles: ("call", id, op, kwargs) from a worker,
+    ("reply", id, ok, value) back, and ("push", kind, data) for stream messages, sent only to
+    workers that have /stream clients. Each call runs as its own task in arrival order, so a
+    handler's synchronous part (device state updates) sees samples in the order they were sent.
+    The socket is created user-only: pickle is for this host's own processes, not a network.
+    """
+    def __init__(self, path: Path, handlers: Dict[str, Callable[..., Any]],
+                 families: Callable[[], List[Family]] = lambda: []):
+        self.path = Path(path); self.handlers = dict(handlers); self.local_families = families
+        self.handlers.update({"watch": self._watch, "beat": self._beat, "metrics": self._metrics})
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[_Peer] = set(); self._tasks: Set[asyncio.Task] = set()
+        self._current: Optional[_Peer] = None
+        self.connections = 0; self.calls = 0; self.errors = 0; self.pushed = 0
+
+    async def start(self) -> None:
+        if self.path.exists(): self.path.unlink()   # stale socket of a previous run
+        old = os.umask(0o177)
+        try: self._server = await asyncio.start_unix_server(self._serve, path=str(self.path))
+        finally: os.umask(old)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for p in list(self._peers): p.writer.close()
+            await self._server.wait_closed(); self._server = None
+        if self._tasks: await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.path.exists(): self.path.unlink()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = _Peer(writer); self._peers.add(peer); self.connections += 1
+        try:
+            while True:
+                _, cid, op, kw = await read_frame(reader)
+                t = asyncio.create_task(self._call(peer, cid, op, kw))
+                self._tasks.add(t); t.add_done_callback(self._tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, HubError):
+            pass
+        finally:
+            self._peers.discard(peer); writer.close()
+
+    async def _call(self, peer: _Peer, cid: int, op: str, kw: Dict[str, Any]) -> None:
+        peer.calls += 1; self.calls += 1
+        try:
+            fn = self.handlers[op]
+            self._current = peer
+            res = fn(**kw)
+            if isinstance(res, Awaitable): res = await res
+            out = ("reply", cid, True, res)
+        except Exception as e:
+            self.errors += 1; out = ("reply", cid, False, f"{op}: {type(e).__name__}: {e}")
+        peer.send(frame(out))
+
+    def push(self, kind: str, data: Dict[str, Any]) -> None:
+        """Hand a stream message to every watching worker; slow ones drop it rather than block."""
+        data_b = None
+        for p in self._peers:
+            if not p.watch: continue
+            if data_b is None: data_b = frame(("push", kind, data))
+            p.send(data_b, droppable=True); self.pushed += 1
+
+    # built-in ops: the peer is the one whose call is running (set just before the handler)
+    def _watch(self, on: bool) -> None:
+        self._current.watch = bool(on)
+
+    def _beat(self, families: List[Family], watch: bool) -> None:
+        self._current.families = families; self._current.watch = bool(watch)
+
+    def _metrics(self, families: List[Family]) -> List[Family]:
+        """Hub families, then every worker's (the caller's fresh, the others' from their last beat)."""
+        self._current.families = families
+        out = list(self.local_families())
+        for p in self._peers: out += p.families
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": len(self._peers), "connections": self.connections, "calls": self.calls,
+                "errors": self.errors, "pushed": self.pushed, "push_dropped": sum(p.dropped for p in self._peers),
+                "watching": sum(p.watch for p in self._peers)}
+
+class HubClient:
+    """A worker's connection to the hub: pipelined calls matched to replies by id, plus pushes.
+
+    Connects lazily and again after the hub goes away; calls made while it is unreachable
+    raise HubError. `call_sync` is for sync endpoints running in the threadpool.
+    """
+    def __init__(self, path: Path, on_push: Callable[[str, Dict[str, Any]], None],
+                 max_inflight: int = MAX_INFLIGHT, timeout: float = CALL_TIMEOUT):
+        self.path = Path(path); self.on_push = on_push; self.timeout = timeout
+        self.max_inflight = max_inflight
+        self._reader: Optional[asyncio.StreamReader] = None; self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: Dict[int, asyncio.Future] = {}; self._ids = itertools.count(1)
+        self._slots: Optional[asyncio.Semaphore] = None; self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None; self._task: Optional[asyncio.Task] = None
+        self.watching = False
+        self.calls = 0; self.failed = 0; self.connects = 0; self.pushes = 0
+
+    async def connect(self, wait: float = CONNECT_SECS) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self._slots is None: self._slots = asyncio.Semaphore(self.max_inflight); self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._writer is not None: return
+            deadline = self._loop.time() + wait
+            while True:
+                try:
+                    self._reader, self._writer = await asyncio.open_unix_connection(str(self.path)); break
+                except (FileNotFoundError, ConnectionError) as e:
+                    if self._loop.time() >= deadline: raise HubError(f"hub not reachable at {self.path}: {e}")
+                    await asyncio.sleep(0.05)
+            self.connects += 1
+            self._task = asyncio.create_task(self._read(self._reader), name="ubi-hub-client")
+            if self.watching: self._writer.write(frame(("call", 0, "watch", {"on": True})))
+
+    async def close(self) -> None:
+        if self._task is not None: self._task.cancel()
+        if self._writer is not None: self._writer.close()
+        self._writer = None; self._task = None
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                msg = await read_frame(reader)
+                if msg[0] == "push":
+                    self.pushes += 1; self.on_push(msg[1], msg[2]); continue
+                _, cid, ok, val = msg
+                fut = self._pending.pop(cid, None)
+                if fut is None or fut.done(): continue
+                if ok: fut.set_result(val)
+                else: fut.set_exception(HubError(val))
+        except (asyncio.IncompleteReadError, ConnectionError, HubError):
+            pass
+        finally:
+            self._writer = None
+            for fut in self._pending.values():
+                if not fut.done(): fut.set_exception(HubError("hub connection lost"))
+            self._pending.clear()
+
+    async def call(self, op: str, **kw: Any) -> Any:
+        if self._writer is None: await self.connect(wait=0.5)
+        async with self._slots:
+            cid = next(self._ids); fut = self._loop.create_future(); self._pending[cid] = fut
+            self.calls += 1
+            try:
+                w = self._writer
+                if w is None: raise HubError("hub connection lost")
+                w.write(frame(("call", cid, op, kw)))
+                if w.transport.get_write_buffer_size() > PUSH_BUFFER: await w.drain()
+                return await asyncio.wait_for(fut, self.timeout)
+            except (HubError, asyncio.TimeoutError, ConnectionError) as e:
+                self.failed += 1
+                raise e if isinstance(e, HubError) else HubError(f"{op}: {type(e).__name__}")
+            finally:
+                self._pending.pop(cid, None)
+
+    def call_sync(self, op: str, **kw: Any) -> Any:
+        """`call` from a thread other than the event loop's."""
+        return asyncio.run_coroutine_threadsafe(self.call(op, **kw), self._loop).result(self.timeout + 1)
+
+    async def watch(self) -> None:
+        """Start receiving stream pushes (the periodic beat turns them off again when idle)."""
+        if not self.watching:
+            self.watching = True; await self.call("watch", on=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"connected": self._writer is not None, "inflight": len(self._pending), "calls": self.calls,
+                "failed": self.failed, "connects": self.connects, "pushes": self.pushes, "watching": self.watching}
@@ -1,120 +1,184 @@
-import requests
 from pathlib import Path
+from contextlib import asynccontextmanager
 from typing import Any, Dict, Optional, Deque, List
-from fastapi import FastAPI, Request, BackgroundTasks
-import csv, time, json, hashlib, statistics, collections
-from fastapi.responses import PlainTextResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, Request, Query
+import os, json, math, time, asyncio, collections
+import numpy as np
+from fastapi.responses import PlainTextResponse, JSONResponse, FileResponse, StreamingResponse
 
-DATA_DIR = Path("data"); DATA_DIR.mkdir(exist_ok=True)
+from storage import StorageWriter, text_sinks
+from wal import WriteAheadLog
+from colstore import ColumnStore, to_records
+from hot import HotTier
+from sqlstore import SqliteStore
+from export import (ExportError, select_fields, iter_csv, iter_ndjson, gzip_chunks, parse_range,
+                    resolve_range, slice_bytes, total_bytes, etag)
+from query import MODES, pick_bucket, downsample, from_rollup, pump_summary, pump_summaries
+from stream import StreamHub
+from episodes import EpisodeSink, NOTABLE_FIELDS, notable, notable_mask, to_csv as episodes_csv
+from devices import DeviceRegistry, DeviceState, resolve_device_id
+from alerts import DiscordDispatcher
+from suppress import Suppressor
+from detector import detector_stats
+from schema import FIELD_NAMES, TelemetryRecord, coerce
+from batch import (MAX_BATCH, BatchError, parse_json_array, parse_ndjson, decode_frames,
+                   coerce_batch, sample_times, split_records)
+from inference import TFLiteModel, MicroBatcher, MODEL_PATH, META_PATH
+from metrics import Registry, LoopLag, CONTENT_TYPE, render_families
+from ipc import HubClient, HubError
+
+DATA_DIR = Path(os.environ.get("UBI_DATA_DIR", "data")); DATA_DIR.mkdir(exist_ok=True)
 NDJSON_PATH = DATA_DIR / "telemetry.ndjson"
 CSV_PATH = DATA_DIR / "telemetry.csv"
 EVENTS_CSV_PATH = DATA_DIR / "events.csv"
+EPISODES_PATH = DATA_DIR / "episodes.csv"
+COLUMNS_DIR = DATA_DIR / "columns"
+SQLITE_PATH = DATA_DIR / "telemetry.sqlite"
+WAL_PATH = DATA_DIR / "storage.wal"
+
+BACKEND = os.environ.get("UBI_BACKEND", "files")   # files | sqlite
+FLUSH_ROWS = int(os.environ.get("UBI_FLUSH_ROWS", "64"))
+FLUSH_SECS = float(os.environ.get("UBI_FLUSH_SECS", "1.0"))
+FSYNC_POLICY = os.environ.get("UBI_FSYNC", "interval")   # never | batch | interval
+FSYNC_SECS = float(os.environ.get("UBI_FSYNC_SECS", "5.0"))
+SEGMENT_SECS = int(os.environ.get("UBI_SEGMENT_SECS", "3600"))
+LATE_SECS = float(os.environ.get("UBI_LATE_SECS", "86400"))   # how old a buffered sample may be stored as
+TEXT_MIRROR = os.environ.get("UBI_TEXT_MIRROR", "1") not in ("0", "false", "no")
+WAL_ENABLED = os.environ.get("UBI_WAL", "1") not in ("0", "false", "no")
+ROTATE_BYTES = int(os.environ.get("UBI_ROTATE_BYTES", str(64 << 20)))
+ROTATE_SECS = float(os.environ.get("UBI_ROTATE_SECS", "86400"))
+ROTATE_COMPRESS = os.environ.get("UBI_ROTATE_COMPRESS", "gzip")   # none | gzip | zstd
+EPISODE_GAP_SECS = float(os.environ.get("UBI_EPISODE_GAP_SECS", "30"))
+STREAM_BACKFILL_SECS = float(os.environ.get("UBI_STREAM_BACKFILL_SECS", "3600"))
+HOT_SECS = float(os.environ.get("UBI_HOT_SECS", "86400"))   # 0 = no in-memory tier
+HOT_MAX_BYTES = int(os.environ.get("UBI_HOT_MAX_BYTES", str(64 << 20)))
+ML_ENABLED = os.environ.get("UBI_ML", "1") not in ("0", "false", "no")
+ML_MODEL_PATH = Path(os.environ.get("UBI_ML_MODEL", str(MODEL_PATH)))
+ML_META_PATH = Path(os.environ.get("UBI_ML_META", str(META_PATH)))
+ML_BATCH = int(os.environ.get("UBI_ML_BATCH", "64"))
+ML_WAIT_MS = float(os.environ.get("UBI_ML_WAIT_MS", "5"))
+ALERT_DEDUP_SECS = float(os.environ.get("UBI_ALERT_DEDUP_SECS", "60"))
+ALERT_CLEAR_SECS = float(os.environ.get("UBI_ALERT_CLEAR_SECS", "120"))
+ALERT_TTL_SECS = float(os.environ.get("UBI_ALERT_TTL_SECS", "3600"))
+ALERT_MAX_KEYS = int(os.environ.get("UBI_ALERT_MAX_KEYS", "4096"))
+ALERT_DIGEST_SECS = float(os.environ.get("UBI_ALERT_DIGEST_SECS", "300"))   # 0 = no digests
+ROLE = os.environ.get("UBI_ROLE", "single")   # single | hub | worker, see serve.py
+HUB_SOCKET = Path(os.environ.get("UBI_HUB_SOCKET", str(DATA_DIR / "hub.sock")))
+HUB_BEAT_SECS = float(os.environ.get("UBI_HUB_BEAT_SECS", "2"))
+if ROLE not in ("single", "hub", "worker"): raise ValueError("UBI_ROLE must be single, hub or worker")
+WORKER = ROLE == "worker"   # parses requests and serves reads; the hub owns device state, storage and alerts
 
 DEFAULT_WEBHOOK = "https://discord.com/api/webhooks/1419184883426918423/ByE0LHg0Ew45EkqyVI2NgCsQHBlQ15MiZ3toEHC8DHJ_AkVejZQveJhf_VTymFYfapMv"
 
-CSV_FIELDS = [
-    "ts","ms","pump","manual_override","alert","reason","context","rec_ms",
-    "tTop","tMid","tBot","dT_tb","pressure_hPa","lux","irObj","irAmb",
-    "airT","airRH","tds_mV","tds_sat","micRMS","DOproxy",
-    "ml_on","ml_pred","ml_conf","ml_used"
-]
+CSV_FIELDS = FIELD_NAMES
+DEVICE_HEADER = "x-device-id"
+
+_metrics = Registry(None if ROLE == "single" else {"proc": "hub" if ROLE == "hub" else f"worker-{os.getpid()}"})
+INGEST_STAGES = ("parse", "coerce", "prepare", "ml", "store", "observe", "publish", "alert")
+_stage_hist = _metrics.histogram("ubi_ingest_stage_seconds", "Time spent per sample in each ingest stage.", ("stage",))
+_stage = {s: _stage_hist.labels(s) for s in INGEST_STAGES}
+_request_hist = _metrics.histogram("ubi_ingest_request_seconds", "Ingest handler time per request.", ("route",))
+_requests = _metrics.counter("ubi_ingest_requests_total", "Ingest requests by route and status code.", ("route", "status"))
+_write_hist = _metrics.histogram("ubi_storage_write_seconds", "Writer thread time per batch and sink.", ("sink",))
+_loop_lag = LoopLag(_metrics.histogram("ubi_event_loop_lag_seconds", "How late a periodic event-loop timer fires."))
+
+def _time_write(sink: str, secs: float) -> None:
+    _write_hist.labels(Path(sink).name).observe(secs)
+
+def _open_backend():
+    if BACKEND == "files": return ColumnStore(COLUMNS_DIR, CSV_FIELDS, segment_secs=SEGMENT_SECS, late_secs=LATE_SECS)
+    if BACKEND == "sqlite": return SqliteStore(SQLITE_PATH, CSV_FIELDS)
+    raise ValueError("UBI_BACKEND must be files or sqlite")
 
-app = FastAPI(title="UBi-Guardian Collector")
-_last: Optional[Dict[str, Any]] = None
-_last_sent: Dict[str, float] = {}
-DEDUP_SECS = 60.0
+_backend = _open_backend()
+_episodes = EpisodeSink(EPISODES_PATH, gap_secs=EPISODE_GAP_SECS)
+# recent rows in memory for charts, events and stream backfill; a worker has no writer feeding one
+_hot = HotTier(CSV_FIELDS, HOT_SECS, HOT_MAX_BYTES, stored_until=_backend.last_ts) if HOT_SECS > 0 and not WORKER else None
+_sinks = [_backend] + ([_hot] if _hot is not None else []) + [_episodes]
+_store = StorageWriter(_sinks + (text_sinks(NDJSON_PATH, CSV_PATH, EVENTS_CSV_PATH, CSV_FIELDS,
+                                            ROTATE_BYTES, ROTATE_SECS, events_keep=notable)
+                                 if TEXT_MIRROR else []),
+                       batch_rows=FLUSH_ROWS, flush_secs=FLUSH_SECS,
+                       fsync=FSYNC_POLICY, fsync_secs=FSYNC_SECS,
+                       wal=WriteAheadLog(WAL_PATH) if WAL_ENABLED else None,
+                       record=TelemetryRecord, compress=ROTATE_COMPRESS, timer=_time_write)
 
-_hist: Dict[str, Deque[float]] = {k: collections.deque(maxlen=20) for k in ("micRMS","lux","tds_mV","dT_tb")}
-_events: List[Dict[str, Any]] = []
+def _reader(t0: Optional[float], device: Optional[str] = None):
+    """The hot tier when it holds every stored row from t0 on (of `device`, or of all), else the backend."""
+    return _hot if _hot is not None and _hot.covers(t0, device) else _backend
 
-def _median_mad(values: List[float]) -> Optional[float]:
-    vals = [v for v in values if v is not None]
-    if not vals: return None
-    med = statistics.median(vals)
-    mad = statistics.median([abs(v - med) for v in vals])
-    return med if mad == 0 else med
+def _get_webhook_url() -> str:
+    return os.environ.get("DISCORD_WEBHOOK_URL", DEFAULT_WEBHOOK)
+
+_discord = DiscordDispatcher(_get_webhook_url)
+_suppress = Suppressor(ALERT_DEDUP_SECS, clear_secs=ALERT_CLEAR_SECS, ttl_secs=ALERT_TTL_SECS,
+                       max_keys=ALERT_MAX_KEYS, digest_secs=ALERT_DIGEST_SECS)
+
+_ml_error: Optional[str] = None
+
+def _load_model() -> Optional[TFLiteModel]:
+    global _ml_error
+    if not ML_ENABLED: return None
+    try:
+        return TFLiteModel(ML_MODEL_PATH, ML_META_PATH, max_batch=ML_BATCH)
+    except Exception as e:
+        _ml_error = str(e); return None
+
+_ml = MicroBatcher(None if WORKER else _load_model(), max_batch=ML_BATCH, max_wait_ms=ML_WAIT_MS)
+_hub = StreamHub()
+_remote = HubClient(HUB_SOCKET, on_push=_hub.publish) if WORKER else None
+_tasks: List[asyncio.Task] = []
+
+async def _start() -> None:
+    if WORKER:
+        await _remote.connect()
+        _tasks.append(asyncio.create_task(_beat_loop()))
+    else:
+        _store.start()
+        await _discord.start()
+        await _ml.start()
+        if ALERT_DIGEST_SECS > 0: _tasks.append(asyncio.create_task(_digest_loop()))
+    _loop_lag.start()
+
+async def _stop() -> None:
+    await _loop_lag.stop()
+    for t in _tasks: t.cancel()
+    _tasks.clear()
+    if WORKER:
+        await _remote.close(); return
+    await _ml.stop()
+    await _discord.stop()
+    _store.close()
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    await _start()
+    try: yield
+    finally: await _stop()
+
+app = FastAPI(title="UBi-Guardian Collector", lifespan=_lifespan)
+
+_devices = DeviceRegistry()
 
 def _debounced(flag: bool, history: Deque[bool], hold: int = 3) -> bool:
     history.append(flag)
     return sum(history) >= hold
 
-def _pump_duty(events: List[Dict[str, Any]], window_s: int = 3600) -> float:
-    now = time.time()
-    recs = [e for e in events if (now - e["ts"]) <= window_s and int(e.get("rec_ms",0) or 0) > 0]
-    return sum(int(e.get("rec_ms",0) or 0) for e in recs) / 1000.0
-
-def _burst_effect(events: List[Dict[str, Any]], dt: float = 60.0, min_drop: float = 0.1) -> bool:
-    recent = [e for e in events if e.get("dT_tb") is not None]
-    if len(recent) < 2: return True
-    recent.sort(key=lambda x: x["ts"])
-    end = recent[-1]; start = [e for e in recent if end["ts"] - e["ts"] >= dt]
-    if not start: return True
-    return abs(end["dT_tb"] - start[0]["dT_tb"]) >= min_drop
-
 def _risk_band(do_val: Optional[float]) -> str:
     if do_val is None: return "n/a"
     if do_val < 5: return "low"
     if do_val < 7: return "medium"
     return "safe"
 
-def _get_webhook_url() -> str:
-    return DEFAULT_WEBHOOK
-
-def _append_ndjson(obj: Dict[str, Any]) -> None:
-    with NDJSON_PATH.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-
-def _append_csv(obj: Dict[str, Any]) -> None:
-    newfile = not CSV_PATH.exists()
-    with CSV_PATH.open("a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        if newfile: w.writeheader()
-        w.writerow({k: obj.get(k, "") for k in CSV_FIELDS})
-
-def _append_events_csv(obj: Dict[str, Any]) -> None:
-    newfile = not EVENTS_CSV_PATH.exists()
-    with EVENTS_CSV_PATH.open("a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=CSV_FIELDS + ["extra"])
-        if newfile: w.writeheader()
-        w.writerow({**{k: obj.get(k, "") for k in CSV_FIELDS}, "extra": obj.get("extra","")})
-
-def _coerce_types(p: Dict[str, Any]) -> Dict[str, Any]:
-    def to_float(x): 
-        try: return float(x)
-        except Exception: return None
-    def to_int(x): 
-        try: return int(x)
-        except Exception:
-            fx = to_float(x); return int(fx) if fx is not None else None
-    for b in ("pump","manual_override","alert","tds_sat","ml_on","ml_used"):
-        if b in p and not isinstance(p[b], bool):
-            s = str(p[b]).strip().lower()
-            p[b] = s in ("1","true","t","yes","y")
-    for i in ("ms","rec_ms"):
-        if i in p and not isinstance(p[i], int):
-            iv = to_int(p[i]); p[i] = iv if iv is not None else p[i]
-    for f in ("tTop","tMid","tBot","dT_tb","pressure_hPa","lux","irObj","irAmb",
-              "airT","airRH","tds_mV","micRMS","DOproxy","ml_conf"):
-        if f in p and not isinstance(p[f], (int,float)):
-            fv = to_float(p[f]); p[f] = fv if fv is not None else p[f]
-    for s in ("reason","context","ml_pred"):
-        if s in p and p[s] is None: p[s] = ""
-    return p
-
-def _key_for(payload: Dict[str, Any]) -> str:
-    kind = "alert" if payload.get("alert") else ("rec" if int(payload.get("rec_ms",0) or 0)>0 else "info")
-    reason = str(payload.get("reason","none"))
-    ctx = str(payload.get("context",""))
-    return hashlib.sha1(f"{kind}|{reason}|{ctx}".encode("utf-8")).hexdigest()
-
-def _should_send(payload: Dict[str, Any]) -> bool:
-    now = time.time()
-    k = _key_for(payload)
-    last = _last_sent.get(k, 0.0)
-    if now - last >= DEDUP_SECS:
-        _last_sent[k] = now
-        return True
-    return False
+_SEVERITY = {"low": 2, "medium": 1}
+
+def _alert_kind(payload: Dict[str, Any]) -> str:
+    return "alert" if payload.get("alert") else ("rec" if int(payload.get("rec_ms",0) or 0)>0 else "info")
+
+def _should_send(payload: Dict[str, Any], state: DeviceState) -> Optional[str]:
+    """"new" / "escalated" / "repeat" when the sample should alert, None when suppressed."""
+    key = (state.device, _alert_kind(payload), str(payload.get("reason","none")), str(payload.get("context","")))
+    return _suppress.check(key, _SEVERITY.get(_risk_band(payload.get("DOproxy")), 0))
 
 def _fmt(v, digits=None):
     if v is None: return "n/a"
@@ -135,7 +199,7 @@ def _ascii_table(rows):
     r.append(h)
     return "```\n" + "\n".join(r) + "\n```"
 
-def _build_embed(payload: Dict[str, Any]) -> Dict[str, Any]:
+def _build_embed(payload: Dict[str, Any], state: DeviceState, escalated: bool = False) -> Dict[str, Any]:
     alert = bool(payload.get("alert", False))
     rec_ms = int(payload.get("rec_ms", 0) or 0)
     reason = str(payload.get("reason", "none"))
@@ -145,14 +209,16 @@ def _build_embed(payload: Dict[str, Any]) -> Dict[str, Any]:
     ml_conf= payload.get("ml_conf", None)
     ml_used= bool(payload.get("ml_used", False))
     title = "UBi-Guardian ALERT" if alert else ("Pump Recommendation" if rec_ms>0 else "Event")
+    if escalated: title += " (escalated)"
     color = 0xE74C3C if alert else (0x2ECC71 if rec_ms>0 else 0x95A5A6)
-    duty = _pump_duty(_events)
-    eff_ok = _burst_effect(_events)
+    duty = state.events.pump_duty_s()
+    eff_ok = state.events.burst_effect()
     band = _risk_band(payload.get("DOproxy"))
     extra = []
     if duty > 1800: extra.append("high_duty")
     if not eff_ok: extra.append("ineffective_burst")
     rows = [
+        ("device", state.device),
         ("context", ctx or "n/a"),
         ("reason", reason or "none"),
         ("action", f"pump ON {rec_ms} ms" if rec_ms>0 else "-"),
@@ -180,64 +246,424 @@ def _build_embed(payload: Dict[str, Any]) -> Dict[str, Any]:
         "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
     }
 
-def _post_discord(payload: Dict[str, Any]) -> None:
-    url = _get_webhook_url()
-    if not url: return
+def _post_discord(payload: Dict[str, Any], state: DeviceState) -> None:
+    if not _get_webhook_url(): return
     if not payload.get("alert") and int(payload.get("rec_ms",0) or 0) <= 0 and str(payload.get("reason","none")) in ("","none"): return
-    if not _should_send(payload): return
-    body = {"content": None, "embeds": [_build_embed(payload)], "username": "UBi-Guardian"}
-    try: requests.post(url, json=body, timeout=6)
-    except Exception: pass
+    why = _should_send(payload, state)
+    if why is None: return
+    _discord.enqueue(_build_embed(payload, state, escalated=why == "escalated"))
+
+def _build_digest(d: Dict[str, Any]) -> Dict[str, Any]:
+    rows = [("suppressed alerts", d["suppressed"])]
+    for e in d["top"]:
+        dev, kind, reason, ctx = e["key"]
+        rows.append((f"{dev}/{kind}/{reason}" + (f"@{ctx}" if ctx else ""), e["count"]))
+    if d["more"]: rows.append((f"+{d['more']} more keys", ""))
+    if d["overflow"]: rows.append(("new keys over the cap", d["overflow"]))
+    return {
+        "title": "UBi-Guardian alert digest",
+        "description": _ascii_table(rows),
+        "color": 0xF1C40F,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+async def _beat_loop() -> None:
+    """Worker: hand the hub this process's metrics and whether it has /stream clients."""
+    while True:
+        await asyncio.sleep(HUB_BEAT_SECS)
+        watch = _hub.subscribers() > 0
+        if _remote.watching and not watch:
+            _remote.watching = False; _hub.forget()   # pushes stop, so the ring would get a gap
+        try: await _remote.call("beat", families=_metrics.families(), watch=watch)
+        except HubError: pass
+
+async def _digest_loop() -> None:
+    while True:
+        await asyncio.sleep(max(1.0, min(ALERT_DIGEST_SECS, 30.0)))
+        d = _suppress.digest()
+        if d is not None and _get_webhook_url(): _discord.enqueue(_build_digest(d))
+
+def _prepare(payload: Dict[str, Any], header_device: Optional[str], client_host: Optional[str]):
+    payload["device"] = resolve_device_id(header_device, payload, client_host)
+    payload.pop("device_id", None)
+    state = _devices.get(payload["device"])
+    payload["srv_label"], detection = state.detector.update(payload)
+    return state, detection, state.ml_features.push(payload)
+
+def _commit(payload: Dict[str, Any], state: DeviceState, detection: Optional[Dict[str, Any]]) -> bool:
+    t0 = time.perf_counter()
+    if not _store.submit(TelemetryRecord.from_payload(payload)): return False
+    t1 = time.perf_counter(); _stage["store"].observe(t1 - t0)
+    _devices.observe(payload["device"], payload)
+    t2 = time.perf_counter(); _stage["observe"].observe(t2 - t1)
+    _hub.publish("sample", payload)
+    if payload.get("alert") or int(payload.get("rec_ms", 0) or 0) > 0:
+        _hub.publish("event", payload)
+    if detection:
+        state.detections.append(detection)
+        _hub.publish("detection", detection)
+    t3 = time.perf_counter(); _stage["publish"].observe(t3 - t2)
+    _post_discord(payload, state)
+    _stage["alert"].observe(time.perf_counter() - t3)
+    return True
+
+async def _process(recs: List[Dict[str, Any]], ages: List[float], header_dev: Optional[str],
+                   host: Optional[str], invalid: List[Dict[str, str]]) -> List[bool]:
+    """Timestamp, detect, classify and store coerced samples; False where storage refused one.
+
+    Runs where device state lives: in this process, or in the hub for a worker's requests.
+    """
+    t0 = time.perf_counter(); n = max(1, len(recs))
+    now = time.time()
+    for r, ts in zip(recs, sample_times(ages, now, now - LATE_SECS)): r["ts"] = ts
+    prepared = [_prepare(r, header_dev, host) for r in recs]
+    t1 = time.perf_counter(); _stage["prepare"].observe((t1 - t0) / n, n)
+    if _ml.enabled and len(recs) == 1:
+        r, (_, _, derived) = recs[0], prepared[0]
+        r["srv_pred"], r["srv_conf"] = await _ml.predict(_ml.vector(r, derived))
+        _stage["ml"].observe(time.perf_counter() - t1)
+    elif _ml.enabled and recs:
+        X = np.stack([_ml.vector(r, derived) for r, (_, _, derived) in zip(recs, prepared)])
+        for r, pred in zip(recs, await _ml.predict_many(X)):
+            r["srv_pred"], r["srv_conf"] = pred
+        _stage["ml"].observe((time.perf_counter() - t1) / n, n)
+    ok = [_commit(r, state, detection) for r, (state, detection, _) in zip(recs, prepared)]
+    for bad in invalid:
+        if bad: _note_invalid(bad)
+    return ok
+
+async def _submit(recs: List[Dict[str, Any]], ages: List[float], header_dev: Optional[str],
+                  host: Optional[str], invalid: List[Dict[str, str]]) -> List[bool]:
+    if WORKER:
+        return await _remote.call("process", recs=recs, ages=ages, header_dev=header_dev, host=host, invalid=invalid)
+    return await _process(recs, ages, header_dev, host, invalid)
+
+_invalid_fields: Dict[str, int] = {}
+
+def _note_invalid(errors: Dict[str, str]) -> None:
+    for k in errors: _invalid_fields[k] = _invalid_fields.get(k, 0) + 1
+
+def _observed(route: str, t0: float, status: int) -> None:
+    _request_hist.labels(route).observe(time.perf_counter() - t0)
+    _requests.labels(route, status).inc()
 
 @app.post("/ingest", response_class=PlainTextResponse)
-async def ingest(req: Request, bg: BackgroundTasks) -> PlainTextResponse:
+async def ingest(req: Request) -> PlainTextResponse:
+    t0 = time.perf_counter()
+    resp = await _ingest(req)
+    _observed("/ingest", t0, resp.status_code)
+    return resp
+
+async def _ingest(req: Request) -> PlainTextResponse:
     try:
+        t0 = time.perf_counter()
         payload = await req.json()
-        payload["ts"] = time.time()
-        payload = _coerce_types(payload)
-        for k in _hist: _hist[k].append(payload.get(k))
-        _events.append(payload)
-        _append_ndjson(payload)
-        _append_csv(payload)
-        _append_events_csv(payload)
-        global _last; _last = payload
-        bg.add_task(_post_discord, payload)
+        if not isinstance(payload, dict):
+            return PlainTextResponse("ERR: expected a JSON object", status_code=400)
+        t1 = time.perf_counter(); _stage["parse"].observe(t1 - t0)
+        invalid = coerce(payload)
+        _stage["coerce"].observe(time.perf_counter() - t1)
+        ok, = await _submit([payload], [0.0], req.headers.get(DEVICE_HEADER),
+                            req.client.host if req.client else None, [invalid])
+        if not ok:
+            return PlainTextResponse("ERR: storage backlog full", status_code=503)
+        if invalid:
+            return PlainTextResponse("OK; invalid fields stored as null: " +
+                                     "; ".join(f"{k}: {v}" for k, v in invalid.items()), status_code=200)
         return PlainTextResponse("OK", status_code=200)
+    except HubError as e:
+        return PlainTextResponse(f"ERR: {e}", status_code=503)
     except Exception as e:
         return PlainTextResponse(f"ERR: {e}", status_code=400)
 
-@app.get("/health")
-def health() -> Dict[str, Any]:
+@app.post("/ingest/batch")
+async def ingest_batch(req: Request) -> JSONResponse:
+    """Many samples per request: a JSON array, NDJSON, or binary frames (see batch.FRAME_DTYPE).
+
+    Optional per-sample `age_ms` says how long ago it was taken, for uploads buffered on the device.
+    """
+    t0 = time.perf_counter()
+    resp = await _ingest_batch(req)
+    _observed("/ingest/batch", t0, resp.status_code)
+    return resp
+
+async def _ingest_batch(req: Request) -> JSONResponse:
+    t0 = time.perf_counter()
+    ctype = req.headers.get("content-type", "").split(";")[0].strip().lower()
+    body = await req.body()
+    try:
+        if ctype == "application/octet-stream": items: List[Any] = decode_frames(body)
+        elif ctype in ("application/x-ndjson", "application/jsonl"): items = parse_ndjson(body)
+        else: items = parse_json_array(body)
+    except BatchError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if len(items) > MAX_BATCH:
+        return JSONResponse({"error": f"at most {MAX_BATCH} samples per batch"}, status_code=413)
+    idx, recs, status = split_records(items)
+    n = max(1, len(recs))   # stage histograms are per sample: a batch adds its mean n times
+    t1 = time.perf_counter(); _stage["parse"].observe((t1 - t0) / n, n)
+    invalid = coerce_batch(recs, typed=ctype == "application/octet-stream")
+    ages = [_to_age(r.pop("age_ms", None)) for r in recs]
+    _stage["coerce"].observe((time.perf_counter() - t1) / n, n)
+    try: ok = await _submit(recs, ages, req.headers.get(DEVICE_HEADER), req.client.host if req.client else None, invalid)
+    except HubError as e: return JSONResponse({"error": str(e)}, status_code=503)
+    errors: Dict[str, Dict[str, str]] = {}
+    for i, good, bad in zip(idx, ok, invalid):
+        status[i] = "ok" if good else "storage backlog full"
+        if bad: errors[str(i)] = bad
+    accepted = sum(s == "ok" for s in status)
+    return JSONResponse({"accepted": accepted, "rejected": len(status) - accepted,
+                         "status": [s or "ok" for s in status], "invalid_fields": errors})
+
+def _to_age(v: Any) -> float:
+    try: return max(0.0, float(v))
+    except (TypeError, ValueError): return 0.0
+
+def _scraped():
+    st = _store.stats(); dc = _discord.stats(); al = _suppress.stats(); hub = _hub.stats(); ml = _ml.stats()
+    states = _devices.all(); now = time.time()
+    yield ("ubi_queue_depth", "gauge", "Items waiting in each internal queue.",
+           [({"queue": "storage"}, st["queued"]), ({"queue": "discord"}, dc["queued"]),
+            ({"queue": "stream"}, hub["queued"]), ({"queue": "ml"}, ml["pending"])])
+    yield ("ubi_storage_bytes_written_total", "counter", "Bytes appended per storage sink.",
+           [({"sink": Path(k).name}, v) for k, v in st["bytes_written"].items()])
+    yield ("ubi_storage_rows_total", "counter", "Rows by storage outcome.",
+           [({"outcome": "written"}, st["rows_written"]), ({"outcome": "rejected"}, st["rejected"])])
+    yield ("ubi_storage_errors_total", "counter", "Failed storage batches or checkpoints.", [({}, st["errors"])])
+    yield ("ubi_storage_held_rows", "gauge", "Rows held for retry while storage writes fail.", [({}, st["held_rows"])])
+    yield ("ubi_alerts_total", "counter", "Notable samples by suppression decision.",
+           [({"outcome": "sent"}, al["sent"] - al["escalated"]), ({"outcome": "escalated"}, al["escalated"]),
+            ({"outcome": "suppressed"}, al["suppressed"]), ({"outcome": "digests"}, al["digests"])])
+    yield ("ubi_discord_embeds_total", "counter", "Discord embeds by delivery result.",
+           [({"result": k}, dc[k]) for k in ("sent", "retried", "dropped", "failed")])
+    yield ("ubi_stream_messages_total", "counter", "SSE messages published and dropped on full client queues.",
+           [({"result": "published"}, hub["published"]), ({"result": "dropped"}, hub["dropped"])])
+    yield ("ubi_stream_subscribers", "gauge", "Connected /stream clients.", [({}, hub["subscribers"])])
+    yield ("ubi_invalid_fields_total", "counter", "Ingested fields stored as null because they failed to parse.",
+           [({"field": k}, v) for k, v in _invalid_fields.items()])
+    yield ("ubi_device_samples_total", "counter", "Samples ingested per device.",
+           [({"device": d.device}, d.samples) for d in states])
+    yield ("ubi_device_rate_hz", "gauge", "Smoothed sample rate per device.",
+           [({"device": d.device}, d.rate_hz()) for d in states])
+    yield ("ubi_device_last_seen_age_seconds", "gauge", "Seconds since each device's newest sample.",
+           [({"device": d.device}, now - d.last_seen if d.last_seen else None) for d in states])
+    yield ("ubi_event_loop_lag_max_seconds", "gauge", "Largest event-loop lag seen since start.", [({}, _loop_lag.max)])
+
+if not WORKER: _metrics.collector(_scraped)
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    families = _metrics.families()
+    if WORKER: families = await _remote.call("metrics", families=families)   # hub and every worker
+    return PlainTextResponse(render_families(families), media_type=CONTENT_TYPE)
+
+def _health() -> Dict[str, Any]:
     return {
-        "ok": True,
+        "ok": _store.failing is None,   # storage["failing"] says why
+        "role": ROLE,
+        "backend": _backend.stats(),
         "csv": CSV_PATH.exists(),
         "ndjson": NDJSON_PATH.exists(),
         "events_csv": EVENTS_CSV_PATH.exists(),
         "discord_webhook_set": bool(_get_webhook_url()),
+        "discord": _discord.stats(),
+        "alerts": _suppress.stats(),
+        "stream": _hub.stats(),
+        "episodes": _episodes.stats(),
+        "hot": _hot.stats() if _hot is not None else None,
+        "devices": len(_devices),
+        "detector": detector_stats([st.detector for st in _devices.all()]),
+        "ml": {**_ml.stats(), "error": _ml_error},
+        "invalid_fields": _invalid_fields,
+        "loop_lag_ms": {"last": round(_loop_lag.last * 1000, 3), "max": round(_loop_lag.max * 1000, 3)},
+        "storage": {**_store.stats(), "repaired_rows": _backend.repaired_rows},
     }
 
+def _states(device: Optional[str]) -> List[DeviceState]:
+    return [st for st in ([_devices.find(device)] if device else _devices.all()) if st is not None]
+
+def _stats(device: Optional[str] = None, fields: Optional[str] = None) -> Dict[str, Any]:
+    keys = [f.strip() for f in fields.split(",")] if fields else None
+    return {st.device: {"anomalies": st.anomalies, "fields": st.stats.snapshot(keys)} for st in _states(device)}
+
+def _detections(device: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    rows = sorted((d for st in _states(device) for d in st.detections), key=lambda d: d["ts"] or 0.0)
+    return rows[-max(1, min(limit, 1000)):]
+
+def _latest(device: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    st = _devices.find(device) if device else _devices.newest()
+    return None if st is None else st.last
+
+# reads of device state and counters; a worker asks the hub, which owns them
+VIEWS = {"health": _health, "devices": lambda: [st.summary() for st in _devices.all()],
+         "stats": _stats, "detections": _detections, "latest": _latest, "episodes": _episodes.query}
+
+async def _view(name: str, **kw: Any) -> Any:
+    return await _remote.call("view", name=name, **kw) if WORKER else VIEWS[name](**kw)
+
+def _flush() -> None:
+    """Make everything ingested so far visible to backend readers (runs in the threadpool)."""
+    if WORKER: _remote.call_sync("flush")
+    else: _store.flush()
+
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    out = await _view("health")
+    if WORKER: out["worker"] = {"pid": os.getpid(), "stream": _hub.stats(), "hub": _remote.stats(),
+                                "loop_lag_ms": {"last": round(_loop_lag.last * 1000, 3), "max": round(_loop_lag.max * 1000, 3)}}
+    return out
+
+@app.get("/devices")
+async def devices() -> JSONResponse:
+    return JSONResponse(await _view("devices"), status_code=200)
+
+@app.get("/stats")
+async def stats(device: Optional[str] = None, fields: Optional[str] = None) -> JSONResponse:
+    """Rolling window statistics and robust z / anomaly flags of the latest sample, per device."""
+    return JSONResponse(await _view("stats", device=device, fields=fields))
+
+@app.get("/detections")
+async def detections(device: Optional[str] = None, limit: int = 100) -> JSONResponse:
+    return JSONResponse(await _view("detections", device=device, limit=limit))
+
 @app.get("/latest")
-def latest() -> JSONResponse:
-    if _last is None:
+async def latest(device: Optional[str] = None) -> JSONResponse:
+    last = await _view("latest", device=device)
+    if last is None:
         return JSONResponse({"error": "no data yet"}, status_code=404)
-    return JSONResponse(_last, status_code=200)
+    return JSONResponse(last, status_code=200)
+
+_export_sizes: "collections.OrderedDict[str, int]" = collections.OrderedDict()   # etag -> bytes, for Range
+
+def _export(req: Request, kind: str, filename: str, from_: Optional[float], to: Optional[float],
+            device: Optional[str], fields: Optional[str]):
+    """Stream an export from the storage backend, honouring Range (identity only) and gzip.
+
+    `to` defaults to the newest stored row, so a resumed download sees the same bytes.
+    """
+    _flush()
+    try: cols = select_fields(fields, CSV_FIELDS)
+    except ExportError as e: return PlainTextResponse(f"ERR: {e}", status_code=400)
+    if to is None: to = _backend.last_ts()
+    extra = ["extra"] if kind == "events" else []
+    where = (NOTABLE_FIELDS, notable_mask) if kind == "events" else None
+    media = "application/x-ndjson" if kind == "ndjson" else "text/csv"
+    src = _backend   # not the hot tier: an export can be any size, and the backend streams it
+    gen = (lambda: iter_ndjson(src, cols, from_, to, device)) if kind == "ndjson" else \
+          (lambda: iter_csv(src, cols, from_, to, device, extra, where))
+    tag = etag(kind, from_, to, device, ",".join(cols), _backend.kind)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Accept-Ranges": "bytes",
+               "ETag": tag, "Vary": "Accept-Encoding"}
+    rng = parse_range(req.headers.get("range"))
+    if rng is not None and req.headers.get("if-range", tag) == tag:
+        total = _export_sizes.get(tag)
+        if total is None:
+            total = _export_sizes[tag] = total_bytes(gen())
+            while len(_export_sizes) > 64: _export_sizes.popitem(last=False)
+        span = resolve_range(rng, total)
+        if span is None:
+            return PlainTextResponse("", status_code=416, headers={"Content-Range": f"bytes */{total}"})
+        first, last = span
+        headers.update({"Content-Range": f"bytes {first}-{last}/{total}", "Content-Length": str(last - first + 1)})
+        return StreamingResponse(slice_bytes(gen(), first, last), status_code=206, media_type=media, headers=headers)
+    if "gzip" in req.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(gzip_chunks(gen()), media_type=media, headers=headers)
+    return StreamingResponse(gen(), media_type=media, headers=headers)
 
 @app.get("/export.csv")
-def export_csv() -> FileResponse:
-    if not CSV_PATH.exists():
-        with CSV_PATH.open("w", newline="", encoding="utf-8") as f:
-            csv.DictWriter(f, fieldnames=CSV_FIELDS).writeheader()
-    return FileResponse(CSV_PATH, media_type="text/csv", filename="telemetry.csv")
+def export_csv(req: Request, from_: Optional[float] = Query(None, alias="from"), to: Optional[float] = None,
+               device: Optional[str] = None, fields: Optional[str] = None):
+    return _export(req, "csv", "telemetry.csv", from_, to, device, fields)
+
+@app.get("/export.ndjson")
+def export_ndjson(req: Request, from_: Optional[float] = Query(None, alias="from"), to: Optional[float] = None,
+                  device: Optional[str] = None, fields: Optional[str] = None):
+    return _export(req, "ndjson", "telemetry.ndjson", from_, to, device, fields)
 
 @app.get("/events.csv")
-def export_events_csv() -> FileResponse:
-    if not EVENTS_CSV_PATH.exists():
-        with EVENTS_CSV_PATH.open("w", newline="", encoding="utf-8") as f:
-            csv.DictWriter(f, fieldnames=CSV_FIELDS).writeheader()
-    return FileResponse(EVENTS_CSV_PATH, media_type="text/csv", filename="events.csv")
+def export_events_csv(req: Request, from_: Optional[float] = Query(None, alias="from"), to: Optional[float] = None,
+                      device: Optional[str] = None, fields: Optional[str] = None):
+    return _export(req, "events", "events.csv", from_, to, device, fields)
+
+@app.get("/query")
+def query(from_: Optional[float] = Query(None, alias="from"), to: Optional[float] = None,
+          fields: str = "DOproxy,micRMS,lux,tds_mV", bucket: Optional[float] = None,
+          points: int = 1200, mode: str = "minmax", device: Optional[str] = None) -> JSONResponse:
+    flist = [f for f in fields.split(",") if f in CSV_FIELDS and f not in ("ts", "device")]
+    if not flist or mode not in MODES:
+        return JSONResponse({"error": f"fields must name numeric telemetry columns and mode one of {MODES}"}, status_code=400)
+    _flush()
+    t1 = time.time() if to is None else to
+    t0 = from_ if from_ is not None else _backend.first_ts()
+    if t0 is None: t0 = t1
+    step = _backend.rollup_secs
+    if bucket is None:
+        bucket = pick_bucket(t0, t1, points)
+        if step and bucket > step: bucket = math.ceil(bucket / step) * step   # whole minutes hit the rollups
+    r = _backend.rollup(t0, t1, flist, device, bucket) if mode != "lttb" else None
+    if r is not None:
+        out = from_rollup(r, flist, bucket, mode)
+        out.update({"from": r["start"], "to": t1, "bucket": bucket, "mode": mode, "count": r["count"],
+                    "first": r["first"], "last": r["last"], "rollup": True})
+        return JSONResponse(out)
+    data = _reader(t0, device).read(t0, t1, flist, device, decode=False)
+    out = downsample(data, flist, t0, bucket, mode, points)
+    out.update({"from": t0, "to": t1, "bucket": bucket, "mode": mode, "count": int(len(data["ts"])),
+                "first": float(data["ts"][0]) if len(data["ts"]) else None,
+                "last": float(data["ts"][-1]) if len(data["ts"]) else None})
+    return JSONResponse(out)
+
+@app.get("/events")
+def events(from_: Optional[float] = Query(None, alias="from"), to: Optional[float] = None,
+           device: Optional[str] = None, limit: int = 200) -> JSONResponse:
+    _flush()
+    rows = _reader(from_, device).recent_events(CSV_FIELDS, from_, to, device, max(1, min(limit, 5000)))
+    now = time.time(); src = _reader(now - 3600.0, device)
+    # pump duty and efficacy only make sense per device: without one, a map of them
+    pump = pump_summary(src, device, now) if device else {"pump": pump_summaries(src, now)}
+    return JSONResponse({"rows": rows, **pump})
+
+@app.get("/episodes")
+async def episodes(from_: Optional[float] = Query(None, alias="from"), to: Optional[float] = None,
+                   device: Optional[str] = None, limit: int = 200) -> JSONResponse:
+    """Alert / pump / ML event episodes overlapping the range, newest `limit`, including still-open ones."""
+    rows = await _view("episodes", t0=from_, t1=to, device=device, limit=max(1, min(limit, 5000)))
+    return JSONResponse({"episodes": rows})
+
+@app.get("/episodes.csv")
+async def export_episodes_csv(from_: Optional[float] = Query(None, alias="from"), to: Optional[float] = None,
+                              device: Optional[str] = None) -> PlainTextResponse:
+    rows = await _view("episodes", t0=from_, t1=to, device=device, limit=0)
+    return PlainTextResponse(episodes_csv(rows), media_type="text/csv",
+                             headers={"Content-Disposition": 'attachment; filename="episodes.csv"'})
+
+def _stream_backfill(device: Optional[str]):
+    def rows(since: float, upto: float):
+        since = max(since, time.time() - STREAM_BACKFILL_SECS)
+        for chunk in _reader(since, device).iter_chunks(since, None if upto == float("inf") else upto, CSV_FIELDS, device):
+            yield from to_records(chunk, CSV_FIELDS)
+    return rows
+
+@app.get("/stream")
+async def stream(req: Request, device: Optional[str] = None, since: Optional[float] = None) -> StreamingResponse:
+    if since is None:
+        try: since = float(req.headers["last-event-id"])
+        except (KeyError, ValueError): since = None
+    if WORKER:
+        await _remote.watch()
+        if since is not None: await _remote.call("flush")
+    gen = _hub.events(device, since, _stream_backfill(device), req.is_disconnected)
+    return StreamingResponse(gen, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/alert/test")
-def alert_test() -> JSONResponse:
+async def alert_test() -> JSONResponse:
+    if WORKER: await _remote.call("alert_test")
+    else: _send_test_alert()
+    return JSONResponse({"ok": True})
+
+def _send_test_alert() -> None:
     demo = {
         "alert": True,
         "reason": "demo_alert",
@@ -249,8 +675,7 @@ def alert_test() -> JSONResponse:
         "lux": 120.0, "micRMS": 3.2, "tds_mV": 420, "DOproxy": 6.9,
         "ml_on": True, "ml_pred": "disturbance", "ml_conf": 0.91, "ml_used": True,
     }
-    _post_discord(demo)
-    return JSONResponse({"ok": True})
+    _post_discord(demo, DeviceState("alert-test"))
 
 @app.get("/dashboard")
 def dashboard():
@@ -0,0 +1,165 @@
+import math, time, asyncio, bisect
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# latency buckets in seconds, 10 µs .. 2.5 s
+TIME_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LAG_INTERVAL = 0.25
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[str]]   # name, type, help, sample lines
+
+def _num(v: float) -> str:
+    if v == math.inf: return "+Inf"
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15: return str(int(v))
+    return repr(v)
+
+def _labels(d: Dict[str, str]) -> str:
+    if not d: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in d.items()) + "}"
+
+class _HistChild:
+    __slots__ = ("bounds", "counts", "sum")
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds; self.counts = [0] * (len(bounds) + 1); self.sum = 0.0
+
+    def observe(self, v: float, n: int = 1) -> None:
+        """`n` observations of `v` (e.g. a batch's per-sample mean)."""
+        self.counts[bisect.bisect_left(self.bounds, v)] += n; self.sum += v * n
+
+class _CounterChild:
+    __slots__ = ("value",)
+    def __init__(self): self.value = 0.0
+    def inc(self, n: float = 1.0) -> None: self.value += n
+    def set(self, v: float) -> None: self.value = v
+
+class _Metric:
+    kind = ""
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name; self.help = help; self.labelnames = tuple(labels)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        if not self.labelnames: self._default = self.labels()
+
+    def _new(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *vals: str) -> Any:
+        """The child for one label combination; bind it once outside hot loops."""
+        key = tuple(str(v) for v in vals)
+        c = self._children.get(key)
+        if c is None:
+            if len(key) != len(self.labelnames): raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            c = self._children[key] = self._new()
+        return c
+
+    def family(self, const: Dict[str, str]) -> Family:
+        out: List[str] = []
+        for key, c in list(self._children.items()):
+            out += self._lines({**const, **dict(zip(self.labelnames, key))}, c)
+        return (self.name, self.kind, self.help, out)
+
+class Counter(_Metric):
+    kind = "counter"
+    def _new(self) -> _CounterChild: return _CounterChild()
+    def inc(self, n: float = 1.0) -> None: self._default.value += n
+    def _lines(self, lab: Dict[str, str], c: _CounterChild) -> List[str]:
+        return [f"{self.name}{_labels(lab)} {_num(c.value)}"]
+
+class Gauge(Counter):
+    kind = "gauge"
+    def set(self, v: float) -> None: self._default.value = v
+
+class Histogram(_Metric):
+    kind = "histogram"
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = TIME_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new(self) -> _HistChild: return _HistChild(self.bounds)
+    def observe(self, v: float, n: int = 1) -> None: self._default.observe(v, n)
+
+    def _lines(self, lab: Dict[str, str], c: _HistChild) -> List[str]:
+        out = []; acc = 0
+        counts = list(c.counts)   # copy: another thread may be observing
+        for b, n in zip(self.bounds + (math.inf,), counts):
+            acc += n; out.append(f"{self.name}_bucket{_labels({**lab, 'le': _num(b)})} {acc}")
+        out += [f"{self.name}_sum{_labels(lab)} {_num(c.sum)}", f"{self.name}_count{_labels(lab)} {acc}"]
+        return out
+
+class Registry:
+    """Metrics in the Prometheus text exposition format.
+
+    Hot-path metrics are updated in place (a list increment per histogram observation);
+    values that already live elsewhere (queue depths, counters in the components' `stats()`)
+    are read by collector callbacks only when `/metrics` is scraped. `const_labels` go on every
+    sample, so several processes' registries can be merged into one scrape.
+    """
+    def __init__(self, const_labels: Optional[Dict[str, str]] = None):
+        self.const = dict(const_labels or {})
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = TIME_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, m: Any) -> Any:
+        self._metrics.append(m); return m
+
+    def collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        """`fn()` yields (name, type, help, [(labels, value), ...]) at scrape time."""
+        self._collectors.append(fn)
+
+    def families(self) -> List[Family]:
+        out = [m.family(self.const) for m in self._metrics]
+        for fn in self._collectors:
+            for name, kind, help, samples in fn():
+                out.append((name, kind, help, [f"{name}{_labels({**self.const, **lab})} {_num(float(v))}"
+                                               for lab, v in samples if v is not None]))
+        return out
+
+    def render(self) -> str:
+        return render_families(self.families())
+
+def render_families(families: Iterable[Family]) -> str:
+    """Text exposition of families, those sharing a name (from different processes) under one header."""
+    merged: Dict[str, Family] = {}
+    for name, kind, help, lines in families:
+        f = merged.get(name)
+        if f is None: merged[name] = (name, kind, help, list(lines))
+        else: f[3].extend(lines)
+    out: List[str] = []
+    for name, kind, help, lines in merged.values():
+        out += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"] + lines
+    return "\n".join(out) + "\n"
+
+class LoopLag:
+    """Event-loop lag: how late a periodic `asyncio.sleep` wakes up."""
+    def __init__(self, hist: Histogram, interval: float = LAG_INTERVAL):
+        self.hist = hist; self.interval = interval
+        self.last = 0.0; self.max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - t - self.interval)
+            self.last = lag; self.max = max(self.max, lag); self.hist.observe(lag)
+
+    def start(self) -> None:
+        if self._task is None: self._task = asyncio.create_task(self._run(), name="ubi-loop-lag")
+
+    async def stop(self) -> None:
+        if self._task is None: return
+        self._task.cancel()
+        try: await self._task
+        except asyncio.CancelledError: pass
+        self._task = None
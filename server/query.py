@@ -0,0 +1,99 @@
+import math, time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from backend import TelemetryBackend
+from colstore import INT_NULL
+from event_window import burst_effect
+
+MODES = ("minmax", "mean", "lttb")
+MAX_POINTS = 5000
+
+def _r(a: np.ndarray, digits: int = 4) -> List[Optional[float]]:
+    return [None if v != v else v for v in np.round(a.astype(np.float64), digits).tolist()]
+
+def pick_bucket(t0: float, t1: float, points: int) -> float:
+    return max(1.0, math.ceil((t1 - t0) / max(1, min(points, MAX_POINTS))))
+
+def bucketize(ts: np.ndarray, vals: Dict[str, np.ndarray], t0: float, bucket: float) -> Dict[str, Any]:
+    """Per-bucket min/max/mean/count of each series over sorted `ts`; empty buckets are omitted."""
+    if not len(ts): return {"t": [], "n": [], "fields": {f: {"min": [], "max": [], "mean": []} for f in vals}}
+    b = np.floor((ts - t0) / bucket).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    out: Dict[str, Any] = {"t": _r(t0 + b[starts] * bucket, 3),
+                           "n": np.diff(np.r_[starts, len(ts)]).tolist(), "fields": {}}
+    for f, v in vals.items():
+        v = v.astype(np.float64); ok = ~np.isnan(v)
+        cnt = np.add.reduceat(ok.astype(np.int64), starts)
+        tot = np.add.reduceat(np.where(ok, v, 0.0), starts)
+        out["fields"][f] = _bucket_series(cnt, tot, np.fmin.reduceat(v, starts), np.fmax.reduceat(v, starts))
+    return out
+
+def _bucket_series(cnt: np.ndarray, tot: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> Dict[str, Any]:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(cnt > 0, tot / np.maximum(cnt, 1), np.nan)
+    return {"min": _r(lo), "max": _r(hi), "mean": _r(mean)}
+
+def from_rollup(r: Dict[str, Any], fields: Sequence[str], bucket: float, mode: str) -> Dict[str, Any]:
+    """bucketize-shaped output from a backend's per-minute rollup (see TelemetryBackend.rollup)."""
+    agg = {"t": _r(r["start"] + r["b"] * bucket, 3), "n": r["n"].tolist(),
+           "fields": {f: _bucket_series(*r["fields"][f]) for f in fields}}
+    if mode == "mean":
+        for f in fields: agg["fields"][f] = {"mean": agg["fields"][f]["mean"]}
+    return agg
+
+def lttb(ts: np.ndarray, v: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `n_out` points preserving the visual shape."""
+    ok = np.flatnonzero(~np.isnan(v))
+    n = len(ok)
+    if n_out >= n or n_out < 3: return ok
+    x = ts[ok]; y = v[ok].astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64); keep[0] = 0; keep[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i] + 1, edges[i + 1])
+        nlo, nhi = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        cx = x[nlo:max(nlo + 1, nhi)].mean(); cy = y[nlo:max(nlo + 1, nhi)].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area)); keep[i + 1] = a
+    return ok[keep]
+
+def downsample(data: Dict[str, np.ndarray], fields: Sequence[str], t0: float, bucket: float,
+               mode: str, points: int) -> Dict[str, Any]:
+    ts = data["ts"]
+    if mode == "lttb":
+        series = {}
+        for f in fields:
+            idx = lttb(ts, data[f], points)
+            series[f] = {"t": _r(ts[idx], 3), "y": _r(data[f][idx])}
+        return {"fields": series}
+    agg = bucketize(ts, {f: data[f] for f in fields}, t0, bucket)
+    if mode == "mean":
+        for f in fields: agg["fields"][f] = {"mean": agg["fields"][f]["mean"]}
+    return agg
+
+def _pump(ts: np.ndarray, rec_ms: np.ndarray, dT: np.ndarray, dt: float, min_drop: float) -> Dict[str, Any]:
+    rec = rec_ms.astype(np.int64); on = (rec > 0) & (rec != INT_NULL[np.int32])
+    duty = float(rec[on].sum()) / 1000.0
+    m = dT == dT
+    return {"pump_duty_s": duty, "efficacy_ok": burst_effect(ts[m], dT[m], dt, min_drop)}
+
+def pump_summary(store: TelemetryBackend, device: str, now: Optional[float] = None,
+                 window_s: float = 3600.0, dt: float = 60.0, min_drop: float = 0.1) -> Dict[str, Any]:
+    """Pump seconds in the last `window_s` and whether dT_tb moved by `min_drop` over the last `dt` (`burst_effect`)."""
+    now = time.time() if now is None else now
+    d = store.read(now - window_s, now, ["ts", "rec_ms", "dT_tb"], device, decode=False)
+    return _pump(d["ts"], d["rec_ms"], d["dT_tb"], dt, min_drop)
+
+def pump_summaries(store: TelemetryBackend, now: Optional[float] = None, window_s: float = 3600.0,
+                   dt: float = 60.0, min_drop: float = 0.1) -> Dict[str, Dict[str, Any]]:
+    """`pump_summary` for every device seen in the window, from one read."""
+    now = time.time() if now is None else now
+    d = store.read(now - window_s, now, ["ts", "rec_ms", "dT_tb", "device"])
+    out: Dict[str, Dict[str, Any]] = {}
+    for dev in np.unique(d["device"]).tolist():
+        m = d["device"] == dev
+        out[dev] = _pump(d["ts"][m], d["rec_ms"][m], d["dT_tb"][m], dt, min_drop)
+    return out
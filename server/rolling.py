@@ -0,0 +1,191 @@
+import math, bisect, random, collections
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+STATS_FIELDS = ("micRMS", "lux", "tds_mV", "dT_tb", "tMid", "DOproxy", "pressure_hPa")
+WINDOW = 300          # samples (5 min at 1 Hz)
+EWMA_ALPHA = 0.05
+Z_FLAG = 3.5          # |modified z| above this is flagged (Iglewicz & Hoaglin)
+WARMUP = 30           # samples in the window before flags are raised
+MAD_SCALE = 1.4826    # MAD -> sigma for normal data
+# Largest window kept as a plain sorted list. Its O(n) insert / delete is a memmove, and a push
+# plus a z costs ~8 us at 300 samples against ~64 us in the skiplist, which only wins from
+# about half a million samples (1M: 387 us against 221 us).
+LIST_WINDOW_MAX = 1 << 19
+
+class _Node:
+    __slots__ = ("value", "next", "width")
+
+    def __init__(self, value: float, levels: int):
+        self.value = value; self.next: List[Any] = [None] * levels; self.width = [1] * levels
+
+class SortedWindow:
+    """Indexable skiplist: a sorted multiset with O(log n) insert, remove, rank and k-th lookup.
+
+    Each link stores how many items it skips, so walking down the levels to position i adds
+    up widths instead of counting items (Pugh's skiplist with Hettinger's width bookkeeping).
+    """
+    def __init__(self, expected: int = WINDOW):
+        self.levels = max(1, int(math.log2(max(2, expected))) + 1)
+        self.head = _Node(-math.inf, self.levels); self.size = 0
+        tail = _Node(math.inf, 0)
+        self.head.next = [tail] * self.levels
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, i: int) -> float:
+        if i < 0: i += self.size
+        if not 0 <= i < self.size: raise IndexError(i)
+        node = self.head; i += 1
+        for lvl in range(self.levels - 1, -1, -1):
+            while node.width[lvl] <= i:
+                i -= node.width[lvl]; node = node.next[lvl]
+        return node.value
+
+    def bisect_left(self, x: float) -> int:
+        """Number of items below x."""
+        node = self.head; rank = 0
+        for lvl in range(self.levels - 1, -1, -1):
+            while node.next[lvl].value < x:
+                rank += node.width[lvl]; node = node.next[lvl]
+        return rank
+
+    def add(self, x: float) -> None:
+        chain: List[Any] = [None] * self.levels; steps = [0] * self.levels; node = self.head
+        for lvl in range(self.levels - 1, -1, -1):
+            while node.next[lvl].value <= x:
+                steps[lvl] += node.width[lvl]; node = node.next[lvl]
+            chain[lvl] = node
+        d = 1
+        while d < self.levels and random.random() < 0.5: d += 1
+        new = _Node(x, d); skipped = 0
+        for lvl in range(d):
+            prev = chain[lvl]
+            new.next[lvl] = prev.next[lvl]; prev.next[lvl] = new
+            new.width[lvl] = prev.width[lvl] - skipped; prev.width[lvl] = skipped + 1
+            skipped += steps[lvl]
+        for lvl in range(d, self.levels): chain[lvl].width[lvl] += 1
+        self.size += 1
+
+    def discard(self, x: float) -> None:
+        chain: List[Any] = [None] * self.levels; node = self.head
+        for lvl in range(self.levels - 1, -1, -1):
+            while node.next[lvl].value < x: node = node.next[lvl]
+            chain[lvl] = node
+        gone = chain[0].next[0]
+        if gone.value != x: raise KeyError(x)
+        for lvl in range(len(gone.next)):
+            prev = chain[lvl]
+            prev.width[lvl] += gone.width[lvl] - 1; prev.next[lvl] = gone.next[lvl]
+        for lvl in range(len(gone.next), self.levels): chain[lvl].width[lvl] -= 1
+        self.size -= 1
+
+def _num(v: Any) -> Optional[float]:
+    if v is None or isinstance(v, bool): return None
+    try: x = float(v)
+    except (TypeError, ValueError): return None
+    return x if math.isfinite(x) else None
+
+class RollingStats:
+    """Sliding-window statistics of one series plus an EWMA over everything seen.
+
+    The window is kept sorted (a list up to LIST_WINDOW_MAX, a SortedWindow skiplist with
+    O(log n) updates beyond), so the median, min and max are rank lookups. The MAD is the
+    k-th smallest of two sorted deviation runs (below / above the median), found by binary
+    search without building the deviations.
+    """
+    def __init__(self, window: int = WINDOW, alpha: float = EWMA_ALPHA):
+        self.window = max(1, window); self.alpha = alpha
+        self.buf: Deque[float] = collections.deque()
+        self.skiplist = self.window > LIST_WINDOW_MAX
+        self.sorted: Any = SortedWindow(self.window) if self.skiplist else []
+        self.ewma: Optional[float] = None; self.ewvar = 0.0
+        self.last: Optional[float] = None; self.seen = 0
+
+    def push(self, v: Any) -> None:
+        x = _num(v)
+        if x is None: return
+        if self.skiplist:
+            if len(self.buf) == self.window: self.sorted.discard(self.buf.popleft())
+            self.sorted.add(x)
+        else:
+            if len(self.buf) == self.window:
+                old = self.buf.popleft(); del self.sorted[bisect.bisect_left(self.sorted, old)]
+            bisect.insort(self.sorted, x)
+        self.buf.append(x)
+        if self.ewma is None: self.ewma = x
+        else:
+            d = x - self.ewma; self.ewma += self.alpha * d
+            self.ewvar = (1 - self.alpha) * (self.ewvar + self.alpha * d * d)
+        self.last = x; self.seen += 1
+
+    def __len__(self) -> int:
+        return len(self.sorted)
+
+    def median(self) -> Optional[float]:
+        s = self.sorted; n = len(s)
+        if not n: return None
+        return s[n // 2] if n % 2 else (s[n // 2 - 1] + s[n // 2]) / 2
+
+    def _kth_devs(self, m: float, k: int) -> Tuple[float, float]:
+        """k-th and (k+1)-th smallest |x - m| (0-based) over the window."""
+        s = self.sorted; p = s.bisect_left(m) if self.skiplist else bisect.bisect_left(s, m)
+        nl, nr = p, len(s) - p          # left run m - s[p-1-i] and right run s[p+j] - m both ascend
+        need = k + 1; lo = max(0, need - nr); hi = min(need, nl)
+        while lo <= hi:                 # take i from the left run and need - i from the right
+            i = (lo + hi) // 2; j = need - i
+            if i > 0 and j < nr and m - s[p - i] > s[p + j] - m: hi = i - 1
+            elif j > 0 and i < nl and s[p + j - 1] - m > m - s[p - 1 - i]: lo = i + 1
+            else:
+                kth = max(m - s[p - i] if i > 0 else -math.inf, s[p + j - 1] - m if j > 0 else -math.inf)
+                nxt = min(m - s[p - 1 - i] if i < nl else math.inf, s[p + j] - m if j < nr else math.inf)
+                return kth, nxt
+        raise AssertionError("unreachable")
+
+    def mad(self, m: Optional[float] = None) -> Optional[float]:
+        n = len(self.sorted)
+        if not n: return None
+        if m is None: m = self.median()
+        if n % 2: return self._kth_devs(m, n // 2)[0]
+        a, b = self._kth_devs(m, n // 2 - 1)
+        return (a + b) / 2
+
+    def z(self, v: Any) -> Optional[float]:
+        """Robust z of `v` against the window: (v - median) / (1.4826 MAD), EWMA stdev if MAD is 0."""
+        x = _num(v)
+        if x is None or not self.sorted: return None
+        m = self.median(); sd = MAD_SCALE * self.mad(m)
+        if sd <= 0: sd = math.sqrt(self.ewvar)
+        return (x - m) / sd if sd > 0 else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        r = lambda v: None if v is None else round(v, 4)
+        s = self.sorted
+        return {"n": len(s), "seen": self.seen, "last": r(self.last), "median": r(self.median()), "mad": r(self.mad()),
+                "min": r(s[0]) if s else None, "max": r(s[-1]) if s else None,
+                "ewma": r(self.ewma), "ewstd": r(math.sqrt(self.ewvar)) if self.ewma is not None else None}
+
+class RollingSet:
+    """RollingStats for several fields of one device, with per-sample anomaly flags."""
+    def __init__(self, fields: Iterable[str] = STATS_FIELDS, window: int = WINDOW, alpha: float = EWMA_ALPHA,
+                 z_flag: float = Z_FLAG, warmup: int = WARMUP):
+        self.stats = {f: RollingStats(window, alpha) for f in fields}
+        self.z_flag = z_flag; self.warmup = warmup
+        self.zs: Dict[str, Optional[float]] = {}; self.flags: List[str] = []
+
+    def push(self, payload: Dict[str, Any]) -> List[str]:
+        """Score the sample against the window (which excludes it), then add it; returns flagged fields."""
+        zs = {}; flags = []
+        for f, st in self.stats.items():
+            v = payload.get(f)
+            if v is None: zs[f] = None; continue
+            z = st.z(v) if len(st.sorted) >= self.warmup else None
+            zs[f] = None if z is None else round(z, 3)
+            if z is not None and abs(z) > self.z_flag: flags.append(f)
+            st.push(v)
+        self.zs = zs; self.flags = flags
+        return flags
+
+    def snapshot(self, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        keys = [f for f in (fields or self.stats) if f in self.stats]
+        return {f: {**self.stats[f].snapshot(), "z": self.zs.get(f)} for f in keys}
@@ -0,0 +1,147 @@
+"""Telemetry schema: one declaration of every stored field, compiled into a fast coercer and
+a compact tuple record for the storage writers.
+
+    python schema.py      # microbenchmark against the previous per-key _coerce_types
+"""
+import sys, time, collections
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+TRUE_STRINGS = ("1", "true", "t", "yes", "y")
+
+TELEMETRY_SCHEMA: Tuple[Tuple[str, str], ...] = (
+    ("ts", "float"), ("ms", "int"),
+    ("pump", "bool"), ("manual_override", "bool"), ("alert", "bool"),
+    ("reason", "str"), ("context", "str"), ("rec_ms", "int"),
+    ("tTop", "float"), ("tMid", "float"), ("tBot", "float"), ("dT_tb", "float"),
+    ("pressure_hPa", "float"), ("lux", "float"), ("irObj", "float"), ("irAmb", "float"),
+    ("airT", "float"), ("airRH", "float"), ("tds_mV", "float"), ("tds_sat", "bool"),
+    ("micRMS", "float"), ("DOproxy", "float"),
+    ("ml_on", "bool"), ("ml_pred", "str"), ("ml_conf", "float"), ("ml_used", "bool"),
+    ("device", "str"),
+    ("srv_label", "str"), ("srv_pred", "str"), ("srv_conf", "float"),
+)
+FIELD_NAMES: List[str] = [n for n, _ in TELEMETRY_SCHEMA]
+KINDS = ("bool", "int", "float", "str")
+
+def fields_of(kind: str, schema=TELEMETRY_SCHEMA) -> Tuple[str, ...]:
+    return tuple(n for n, k in schema if k == kind)
+
+class TelemetryRecord(collections.namedtuple("_TelemetryRow", FIELD_NAMES, defaults=(None,) * len(FIELD_NAMES))):
+    """One stored sample as a plain tuple in FIELD_NAMES order (no per-row dict)."""
+    __slots__ = ()
+    _index = {n: i for i, n in enumerate(FIELD_NAMES)}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        i = self._index.get(key)
+        if i is None: return default
+        v = self[i]
+        return default if v is None else v
+
+    def present(self) -> Dict[str, Any]:
+        return {n: v for n, v in zip(self._fields, self) if v is not None}
+
+    @classmethod
+    def from_payload(cls, p: Dict[str, Any]) -> "TelemetryRecord":
+        return tuple.__new__(cls, map(p.get, FIELD_NAMES))
+
+def _parse_float(v: Any) -> float:
+    return float(v)
+
+def _parse_int(v: Any) -> int:
+    try: return int(v)
+    except (TypeError, ValueError): return int(float(v))
+
+def compile_coercer(schema=TELEMETRY_SCHEMA) -> Callable[[Dict[str, Any]], Dict[str, str]]:
+    """Build `coerce(payload) -> errors` for `schema`, converting the payload in place.
+
+    The generated function has one straight-line block per field with an exact-type fast
+    path, so well-typed firmware JSON costs a dict lookup and a type check per field.
+    Unparsable numbers become None and are reported as {field: message}.
+    """
+    lines = ["def coerce(p):", "    err = {}"]
+    for name, kind in schema:
+        if kind not in KINDS: raise ValueError(f"unknown kind {kind!r} for {name}")
+        lines.append(f"    v = p.get({name!r}, _MISSING)")
+        if kind == "bool":
+            lines.append("    if v is not _MISSING and v.__class__ is not bool:")
+            lines.append(f"        p[{name!r}] = str(v).strip().lower() in TRUE_STRINGS")
+        elif kind == "int":
+            lines += ["    if v is not _MISSING and v is not None and not isinstance(v, int):",
+                      "        try: p[%r] = _parse_int(v)" % name,
+                      "        except (TypeError, ValueError, OverflowError):",
+                      f"            p[{name!r}] = None; err[{name!r}] = 'not an integer: %.40r' % (v,)"]
+        elif kind == "float":
+            lines += ["    if v is not _MISSING and v is not None and v.__class__ is not float and not isinstance(v, int):",
+                      "        try: p[%r] = _parse_float(v)" % name,
+                      "        except (TypeError, ValueError):",
+                      f"            p[{name!r}] = None; err[{name!r}] = 'not a number: %.40r' % (v,)"]
+        else:
+            lines += ["    if v is None: p[%r] = ''" % name,
+                      "    elif v is not _MISSING and v.__class__ is not str: p[%r] = str(v)" % name]
+    lines.append("    return err")
+    ns: Dict[str, Any] = {"_MISSING": object(), "TRUE_STRINGS": TRUE_STRINGS,
+                          "_parse_int": _parse_int, "_parse_float": _parse_float}
+    exec(compile("\n".join(lines), f"<coerce:{len(schema)} fields>", "exec"), ns)
+    return ns["coerce"]
+
+coerce = compile_coercer()
+
+# --- microbenchmark ---
+
+def _legacy_coerce_types(p: Dict[str, Any]) -> Dict[str, Any]:
+    """main._coerce_types as it was before the schema, kept for the benchmark."""
+    def to_float(x):
+        try: return float(x)
+        except Exception: return None
+    def to_int(x):
+        try: return int(x)
+        except Exception:
+            fx = to_float(x); return int(fx) if fx is not None else None
+    for b in ("pump","manual_override","alert","tds_sat","ml_on","ml_used"):
+        if b in p and not isinstance(p[b], bool):
+            s = str(p[b]).strip().lower()
+            p[b] = s in ("1","true","t","yes","y")
+    for i in ("ms","rec_ms"):
+        if i in p and not isinstance(p[i], int):
+            iv = to_int(p[i]); p[i] = iv if iv is not None else p[i]
+    for f in ("tTop","tMid","tBot","dT_tb","pressure_hPa","lux","irObj","irAmb",
+              "airT","airRH","tds_mV","micRMS","DOproxy","ml_conf"):
+        if f in p and not isinstance(p[f], (int,float)):
+            fv = to_float(p[f]); p[f] = fv if fv is not None else p[f]
+    for s in ("reason","context","ml_pred"):
+        if s in p and p[s] is None: p[s] = ""
+    return p
+
+def _legacy_rows(p: Dict[str, Any]) -> Tuple[Any, ...]:
+    # what the three writers used to build per sample
+    a = {k: p.get(k, "") for k in FIELD_NAMES}; b = {k: p.get(k, "") for k in FIELD_NAMES}
+    c = {k: p.get(k, "") for k in FIELD_NAMES}; c["extra"] = ""
+    return a, b, c
+
+def _bench(payloads: Iterable[Dict[str, Any]], fn: Callable[[Dict[str, Any]], Any], reps: int) -> float:
+    data = [dict(p) for p in payloads] * reps
+    t = time.perf_counter()
+    for p in data: fn(p)
+    return (time.perf_counter() - t) / len(data) * 1e6
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import csv, argparse
+    from pathlib import Path
+    ap = argparse.ArgumentParser(description="Benchmark schema coercion against the legacy _coerce_types.")
+    ap.add_argument("--replay", type=Path, default=Path(__file__).resolve().parent / "data" / "old" / "telemetry_b_test.csv")
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--reps", type=int, default=20)
+    a = ap.parse_args(argv)
+    with a.replay.open(newline="") as f:
+        raw = [r for _, r in zip(range(a.rows), csv.DictReader(f))]
+    as_strings = [{k: v for k, v in r.items() if v != ""} for r in raw]
+    typed = [dict(p) for p in as_strings]
+    for p in typed: _legacy_coerce_types(p)
+    for label, rows in (("firmware JSON (typed)", typed), ("CSV strings", as_strings)):
+        old = _bench(rows, lambda p: _legacy_rows(_legacy_coerce_types(p)), a.reps)
+        new = _bench(rows, lambda p: (coerce(p), TelemetryRecord.from_payload(p)), a.reps)
+        print(f"{label:22s} legacy {old:6.2f} us/sample   schema {new:6.2f} us/sample   x{old / new:.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""Run the collector, optionally as several ingest worker processes around one hub.
+
+    python serve.py                      # same as uvicorn main:app --port 5001
+    python serve.py --workers 4          # 4 uvicorn workers + hub.py owning state and storage
+
+`uvicorn main:app --workers N` on its own would give each worker its own device state,
+storage writer and alert suppression, all appending to the same files. Here the workers only
+parse and coerce requests and hand the samples to the hub over a Unix socket (UBI_HUB_SOCKET,
+default <UBI_DATA_DIR>/hub.sock); latest state, rolling stats and /metrics come from the hub,
+exports and queries read the backend files directly after asking the hub to flush.
+"""
+import os, sys, time, argparse, subprocess
+from pathlib import Path
+from typing import List, Optional
+
+import uvicorn
+
+HERE = Path(__file__).resolve().parent
+HUB_START_SECS = 30.0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Run the UBi-Guardian collector.")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=5001)
+    ap.add_argument("--workers", type=int, default=1, help="ingest worker processes; >1 starts a hub")
+    args = ap.parse_args(argv)
+    os.chdir(HERE)
+    if args.workers <= 1:
+        uvicorn.run("main:app", host=args.host, port=args.port)
+        return 0
+    data_dir = Path(os.environ.get("UBI_DATA_DIR", "data")); data_dir.mkdir(exist_ok=True)
+    sock = Path(os.environ.get("UBI_HUB_SOCKET", str(data_dir / "hub.sock")))
+    if sock.exists(): sock.unlink()
+    hub = subprocess.Popen([sys.executable, str(HERE / "hub.py"), str(sock)])
+    try:
+        deadline = time.monotonic() + HUB_START_SECS
+        while not sock.exists():
+            if hub.poll() is not None: raise SystemExit(f"hub exited with status {hub.returncode}")
+            if time.monotonic() > deadline: raise SystemExit(f"hub did not open {sock}")
+            time.sleep(0.05)
+        os.environ.update({"UBI_ROLE": "worker", "UBI_HUB_SOCKET": str(sock)})
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        hub.terminate()
+        try: hub.wait(15)
+        except subprocess.TimeoutExpired: hub.kill()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
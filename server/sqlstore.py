@@ -0,0 +1,232 @@
+import math, sqlite3, threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend import TelemetryBackend
+from colstore import BOOL_FIELDS, STR_FIELDS, INT_FIELDS, INT_NULL, TS_FIELD, to_records
+
+ROLLUP_SECS = 60
+TABLE = "samples"
+ROLLUPS = "rollup_1m"
+
+def _sql_type(field: str) -> str:
+    if field in STR_FIELDS: return "TEXT"
+    if field in BOOL_FIELDS or field in INT_FIELDS: return "INTEGER"
+    return "REAL"
+
+def _quoted(fields: Sequence[str]) -> str:
+    return ", ".join(f'"{f}"' for f in fields)
+
+def _dtype(field: str) -> Any:
+    if field == TS_FIELD: return np.float64
+    return INT_FIELDS.get(field, np.float32)
+
+class SqliteStore(TelemetryBackend):
+    """Telemetry in one SQLite database: a `samples` row per sample plus per-minute rollups.
+
+    The writer runs in WAL mode with synchronous=NORMAL, so readers on their own
+    (thread-local, read-only) connections never block it. Each batch is one transaction,
+    committed at the writer's flush; a sync flush also checkpoints, which fsyncs the log.
+    Rows are indexed by (device, ts) and ts, and alert / pump-recommendation rows by a
+    partial index. The `rollup_1m` table keeps count, sum, min and max of every float field
+    per device and minute (plus pump-on samples, pump ms and alerts), updated in SQL from each
+    batch, so long-range /query buckets and ad-hoc questions never scan raw samples.
+    """
+    kind = "sqlite"
+    rollup_secs = ROLLUP_SECS
+
+    def __init__(self, path: Path, fields: Sequence[str]):
+        self.path = Path(path); self.fields = list(fields); self.name = str(self.path)
+        self.stats_fields = [f for f in self.fields if _sql_type(f) == "REAL" and f != TS_FIELD]
+        self.repaired_rows = 0; self.rows = 0; self.transactions = 0
+        self._db: Optional[sqlite3.Connection] = None; self._in_tx = False
+        self._local = threading.local()
+        self._insert = f"INSERT INTO {TABLE} ({_quoted(self.fields)}) VALUES ({', '.join('?' * len(self.fields))})"
+
+    # --- writer side ---
+    def _schema(self) -> List[str]:
+        cols = ", ".join(f'"{f}" {_sql_type(f)}' for f in self.fields)
+        agg = ", ".join(f'"{f}_n" INTEGER, "{f}_sum" REAL, "{f}_min" REAL, "{f}_max" REAL' for f in self.stats_fields)
+        return [f"CREATE TABLE IF NOT EXISTS {TABLE} ({cols})",
+                f"CREATE INDEX IF NOT EXISTS {TABLE}_device_ts ON {TABLE} (device, ts)",
+                f"CREATE INDEX IF NOT EXISTS {TABLE}_ts ON {TABLE} (ts)",
+                f"CREATE INDEX IF NOT EXISTS {TABLE}_events ON {TABLE} (ts) WHERE alert = 1 OR rec_ms > 0",
+                f"CREATE TABLE IF NOT EXISTS {ROLLUPS} (device TEXT NOT NULL, minute INTEGER NOT NULL, "
+                f"n INTEGER, ts_min REAL, ts_max REAL, pump_on INTEGER, pump_ms INTEGER, alerts INTEGER, "
+                f"{agg}, PRIMARY KEY (device, minute)) WITHOUT ROWID"]
+
+    def _rollup_sql(self, where: str) -> str:
+        """Upsert the minutes of the sample rows matching `where` into the rollup table."""
+        names = ["n", "ts_min", "ts_max", "pump_on", "pump_ms", "alerts"]
+        sel = ["count(*)", "min(ts)", "max(ts)", "total(pump)", "total(CASE WHEN rec_ms > 0 THEN rec_ms END)",
+               "total(alert)"]
+        upd = ["n = n + excluded.n", "ts_min = min(ts_min, excluded.ts_min)", "ts_max = max(ts_max, excluded.ts_max)",
+               "pump_on = pump_on + excluded.pump_on", "pump_ms = pump_ms + excluded.pump_ms",
+               "alerts = alerts + excluded.alerts"]
+        for f in self.stats_fields:
+            names += [f"{f}_n", f"{f}_sum", f"{f}_min", f"{f}_max"]
+            sel += [f'count("{f}")', f'total("{f}")', f'min("{f}")', f'max("{f}")']
+            upd += [f'"{f}_n" = "{f}_n" + excluded."{f}_n"', f'"{f}_sum" = "{f}_sum" + excluded."{f}_sum"',
+                    # two-argument min/max are NULL if either side is
+                    f'"{f}_min" = coalesce(min("{f}_min", excluded."{f}_min"), "{f}_min", excluded."{f}_min")',
+                    f'"{f}_max" = coalesce(max("{f}_max", excluded."{f}_max"), "{f}_max", excluded."{f}_max")']
+        return (f"INSERT INTO {ROLLUPS} (device, minute, {_quoted(names)}) "
+                f"SELECT coalesce(device, ''), CAST(ts / {ROLLUP_SECS} AS INTEGER) * {ROLLUP_SECS}, {', '.join(sel)} "
+                f"FROM {TABLE} WHERE ts IS NOT NULL AND {where} GROUP BY 1, 2 "
+                f"ON CONFLICT (device, minute) DO UPDATE SET {', '.join(upd)}")
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL"); db.execute("PRAGMA synchronous=NORMAL")
+        for stmt in self._schema(): db.execute(stmt)
+        return db
+
+    def open(self) -> None:
+        if self._db is not None: return
+        self._db = self._connect()
+        self.rows = self._db.execute(f"SELECT coalesce(max(rowid), 0) FROM {TABLE}").fetchone()[0]
+
+    def write(self, objs: List[Any]) -> None:
+        if not objs: return
+        if getattr(objs[0], "_fields", None) == tuple(self.fields): rows: List[Any] = objs
+        else: rows = [tuple(o.get(f) for f in self.fields) for o in objs]
+        db = self._db
+        if not self._in_tx: db.execute("BEGIN"); self._in_tx = True
+        before = self.rows
+        db.executemany(self._insert, rows)
+        self.rows = db.execute(f"SELECT max(rowid) FROM {TABLE}").fetchone()[0]
+        db.execute(self._rollup_sql("rowid > ?"), (before,))
+
+    def flush(self, sync: bool) -> None:
+        if self._db is None: return
+        if self._in_tx:
+            self._db.execute("COMMIT"); self._in_tx = False; self.transactions += 1
+        if sync: self._db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self) -> None:
+        if self._db is None: return
+        try: self.flush(True)
+        finally: self._db.close(); self._db = None; self._in_tx = False
+
+    def position(self) -> Dict[str, Any]:
+        return {"rows": self.rows}
+
+    def rewind(self, pos: Dict[str, Any]) -> None:
+        """Delete rows inserted after a checkpointed position and rebuild their minutes (before open)."""
+        if not self.path.exists(): return
+        keep = int(pos.get("rows", 0))
+        db = self._connect()
+        try:
+            n, t = db.execute(f"SELECT count(*), min(ts) FROM {TABLE} WHERE rowid > ?", (keep,)).fetchone()
+            if not n: return
+            minute = int(t // ROLLUP_SECS * ROLLUP_SECS) if t is not None else 0
+            db.execute("BEGIN")
+            db.execute(f"DELETE FROM {TABLE} WHERE rowid > ?", (keep,))
+            db.execute(f"DELETE FROM {ROLLUPS} WHERE minute >= ?", (minute,))
+            db.execute(self._rollup_sql("ts >= ?"), (minute,))
+            db.execute("COMMIT")
+            self.repaired_rows += n
+        finally:
+            db.close()
+
+    # --- reader side ---
+    def _reader(self) -> Optional[sqlite3.Connection]:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            if not self.path.exists(): return None
+            db = self._local.db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        return db
+
+    def _where(self, t0: Optional[float], t1: Optional[float], device: Optional[str]) -> Tuple[str, List[Any]]:
+        terms = ["ts IS NOT NULL"]; args: List[Any] = []
+        if device is not None: terms.append("device = ?"); args.append(device)
+        if t0 is not None: terms.append("ts >= ?"); args.append(t0)
+        if t1 is not None: terms.append("ts <= ?"); args.append(t1)
+        return " AND ".join(terms), args
+
+    def _fields(self, fields: Optional[Sequence[str]]) -> List[str]:
+        return [f for f in (fields or self.fields) if f in self.fields]
+
+    def _columns(self, rows: List[Tuple], fields: Sequence[str], decode: bool) -> Dict[str, np.ndarray]:
+        cols = list(zip(*rows)) if rows else [()] * len(fields)
+        out: Dict[str, np.ndarray] = {}
+        for f, c in zip(fields, cols):
+            if f in BOOL_FIELDS:
+                if decode: out[f] = np.array(["" if v is None else ("True" if v else "False") for v in c], dtype=object)
+                else: out[f] = np.array([bool(v) for v in c], dtype=bool)
+            elif f in STR_FIELDS:
+                out[f] = np.array(["" if v is None else v for v in c], dtype=object)
+            elif f in INT_FIELDS:
+                null = INT_NULL[INT_FIELDS[f]]
+                out[f] = np.array([null if v is None else v for v in c], dtype=INT_FIELDS[f])
+            else:
+                out[f] = np.array(c, dtype=np.float64).astype(_dtype(f), copy=False)
+        return out
+
+    def _select(self, t0, t1, fields, device, chunk_rows: int, decode: bool) -> Iterator[Dict[str, np.ndarray]]:
+        db = self._reader()
+        if db is None or not fields: return
+        where, args = self._where(t0, t1, device)
+        cur = db.execute(f"SELECT {_quoted(fields)} FROM {TABLE} "
+                         f"WHERE {where} ORDER BY ts", args)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows: return
+            yield self._columns(rows, fields, decode)
+
+    def read(self, t0: Optional[float] = None, t1: Optional[float] = None, fields: Optional[Sequence[str]] = None,
+             device: Optional[str] = None, decode: bool = True) -> Dict[str, np.ndarray]:
+        fields = self._fields(fields)
+        if TS_FIELD not in fields: fields = [TS_FIELD] + fields
+        parts = list(self._select(t0, t1, fields, device, 65536, decode))
+        if not parts: return self._columns([], fields, decode)
+        return {f: np.concatenate([p[f] for p in parts]) for f in fields}
+
+    def iter_chunks(self, t0: Optional[float] = None, t1: Optional[float] = None,
+                    fields: Optional[Sequence[str]] = None, device: Optional[str] = None,
+                    chunk_rows: int = 8192) -> Iterator[Dict[str, np.ndarray]]:
+        yield from self._select(t0, t1, self._fields(fields), device, chunk_rows, True)
+
+    def recent_events(self, fields: Sequence[str], t0: Optional[float], t1: Optional[float],
+                      device: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        db = self._reader(); fields = self._fields(fields)
+        if db is None or not fields: return []
+        where, args = self._where(t0, t1, device)
+        rows = db.execute(f"SELECT {_quoted(fields)} FROM {TABLE} "
+                          f"WHERE (alert = 1 OR rec_ms > 0) AND {where} ORDER BY ts DESC LIMIT ?",
+                          args + [limit]).fetchall()
+        return to_records(self._columns(rows[::-1], fields, True), fields)
+
+    def _scalar(self, sql: str) -> Optional[float]:
+        db = self._reader()
+        return None if db is None else db.execute(sql).fetchone()[0]
+
+    def first_ts(self) -> Optional[float]:
+        return self._scalar(f"SELECT min(ts) FROM {TABLE}")
+
+    def last_ts(self) -> Optional[float]:
+        return self._scalar(f"SELECT max(ts) FROM {TABLE}")
+
+    def rollup(self, t0: float, t1: float, fields: Sequence[str], device: Optional[str],
+               bucket: float) -> Optional[Dict[str, Any]]:
+        if bucket < ROLLUP_SECS or bucket % ROLLUP_SECS or any(f not in self.stats_fields for f in fields): return None
+        db = self._reader()
+        if db is None: return None
+        start = math.floor(t0 / ROLLUP_SECS) * ROLLUP_SECS
+        sel = "".join(f', sum("{f}_n"), total("{f}_sum"), min("{f}_min"), max("{f}_max")' for f in fields)
+        where = "minute >= ? AND minute <= ?" + (" AND device = ?" if device is not None else "")
+        rows = db.execute(f"SELECT CAST((minute - ?) / ? AS INTEGER) AS b, sum(n), min(ts_min), max(ts_max){sel} "
+                          f"FROM {ROLLUPS} WHERE {where} GROUP BY b ORDER BY b",
+                          [start, bucket, start, t1] + ([device] if device is not None else [])).fetchall()
+        cols = [np.array(c, dtype=np.float64) for c in zip(*rows)] if rows else [np.empty(0)] * (4 + 4 * len(fields))
+        return {"start": float(start), "b": cols[0].astype(np.int64), "n": cols[1].astype(np.int64),
+                "count": int(cols[1].sum()), "first": float(cols[2].min()) if rows else None,
+                "last": float(cols[3].max()) if rows else None,
+                "fields": {f: tuple(cols[4 + 4 * i:8 + 4 * i]) for i, f in enumerate(fields)}}
+
+    def stats(self) -> Dict[str, Any]:
+        size = sum(p.stat().st_size for p in (self.path, Path(f"{self.path}-wal")) if p.exists())
+        return {**super().stats(), "rows": self.rows, "transactions": self.transactions, "bytes": size}
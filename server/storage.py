@@ -0,0 +1,395 @@
+import io, os, re, csv, gzip, json, time, queue, shutil, threading
+from pathlib import Path
+from typing import Any, Callable, Dict, IO, List, Optional, Sequence, Tuple
+
+FSYNC_POLICIES = ("never", "batch", "interval")
+COMPRESSIONS = ("none", "gzip", "zstd")
+STAMP = "%Y%m%dT%H%M%S"
+RETRY_MAX_SECS = 60.0
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+def compression(method: str) -> str:
+    """The method actually used: zstd needs the optional `zstandard` package, else gzip."""
+    if method not in COMPRESSIONS: raise ValueError(f"compression must be one of {COMPRESSIONS}")
+    return "gzip" if method == "zstd" and _zstd() is None else method
+
+def _part_re(path: Path) -> "re.Pattern[str]":
+    return re.compile(re.escape(path.stem) + r"\.(\d{8}T\d{6})(?:-(\d+))?" + re.escape(path.suffix) + r"(\.gz|\.zst)?")
+
+def log_parts(path: Path) -> List[Path]:
+    """Closed (rotated, possibly compressed) parts of a log file oldest first, then the live file."""
+    path = Path(path); rx = _part_re(path); keyed = {}
+    if path.parent.exists():
+        for p in path.parent.iterdir():
+            m = rx.fullmatch(p.name)
+            if m: keyed.setdefault((m.group(1), int(m.group(2) or 0)), []).append(p)
+    # a part interrupted while being compressed exists both ways; the plain one is complete
+    parts = [min(ps, key=lambda p: p.suffix in (".gz", ".zst")) for _, ps in sorted(keyed.items())]
+    return parts + ([path] if path.exists() else [])
+
+def open_text(path: Path) -> IO[str]:
+    path = Path(path)
+    if path.suffix == ".gz": return gzip.open(path, "rt", newline="", encoding="utf-8")
+    if path.suffix == ".zst":
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(path.open("rb")), encoding="utf-8", newline="")
+    return path.open(newline="", encoding="utf-8")
+
+def compress_file(path: Path, method: str) -> Path:
+    """Compress a closed part next to itself, then remove the original."""
+    method = compression(method)
+    if method == "none": return path
+    dst = path.with_name(path.name + (".zst" if method == "zstd" else ".gz"))
+    tmp = dst.with_name(dst.name + ".tmp")
+    with path.open("rb") as src, tmp.open("wb") as raw:
+        if method == "zstd":
+            _zstd().ZstdCompressor(level=3).copy_stream(src, raw)
+        else:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, 1 << 20)
+        raw.flush(); os.fsync(raw.fileno())
+    os.replace(tmp, dst); path.unlink()
+    return dst
+
+def _trim_torn_tail(path: Path) -> int:
+    """Cut a half-written last line (no trailing newline) off a text log; returns bytes removed."""
+    if not path.exists(): return 0
+    size = path.stat().st_size
+    with path.open("r+b") as f:
+        end = size
+        while end > 0:
+            start = max(0, end - 65536); f.seek(start); block = f.read(end - start)
+            if end == size and block.endswith(b"\n"): return 0
+            i = block.rfind(b"\n")
+            if i >= 0: f.truncate(start + i + 1); return size - (start + i + 1)
+            end = start
+        f.truncate(0)
+    return size
+
+def _csv_line_bytes(fields: Sequence[str]) -> int:
+    buf = io.StringIO(); csv.writer(buf).writerow(fields)
+    return len(buf.getvalue().encode("utf-8"))
+
+class _Sink:
+    """Append-only text log (NDJSON or CSV), rotated by size or age into `<stem>.<UTC stamp><suffix>`.
+
+    With `keep`, only rows for which it returns true are written.
+    """
+    def __init__(self, path: Path, kind: str, fields: Optional[Sequence[str]] = None,
+                 rotate_bytes: int = 0, rotate_secs: float = 0.0, keep: Optional[Callable[[Any], bool]] = None):
+        self.path = path; self.kind = kind; self.fields = list(fields or []); self.keep = keep
+        self.name = str(path); self.rotate_bytes = rotate_bytes; self.rotate_secs = rotate_secs
+        self.fh = None; self.csv = None; self.opened = 0.0
+        self.header_bytes = _csv_line_bytes(self.fields) if kind == "csv" else 0
+        self.repaired_bytes = 0; self.bytes_written = 0
+
+    def open(self) -> None:
+        self.repaired_bytes += _trim_torn_tail(self.path)
+        if self.kind == "csv": self._set_aside_mismatched()
+        self.fh = self.path.open("a", newline="", encoding="utf-8")
+        self.opened = time.time()
+        if self.kind == "csv":
+            self.csv = csv.writer(self.fh)
+            if self.fh.tell() == 0: self.csv.writerow(self.fields)
+
+    def _rotated_name(self, t: float) -> Path:
+        stamp = time.strftime(STAMP, time.gmtime(t)); i = 0
+        while True:
+            p = self.path.with_name(f"{self.path.stem}.{stamp}{f'-{i}' if i else ''}{self.path.suffix}")
+            if not any(p.with_name(p.name + ext).exists() for ext in ("", ".gz", ".zst")): return p
+            i += 1
+
+    def _set_aside_mismatched(self) -> None:
+        # appending rows under a header with different columns would corrupt the file for readers
+        if not self.path.exists() or self.path.stat().st_size == 0: return
+        with self.path.open(newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), None)
+        if header == self.fields: return
+        self.path.rename(self._rotated_name(self.path.stat().st_mtime))
+
+    def write(self, objs: List[Dict[str, Any]]) -> None:
+        if self.keep is not None: objs = [o for o in objs if self.keep(o)]
+        start = self.fh.tell()
+        self._write(objs)
+        self.bytes_written += self.fh.tell() - start
+
+    def _write(self, objs: List[Dict[str, Any]]) -> None:
+        if self.kind == "ndjson":
+            self.fh.write("".join(json.dumps(o.present() if hasattr(o, "present") else o, ensure_ascii=False) + "\n"
+                                  for o in objs))
+        elif objs and getattr(objs[0], "_fields", None) == tuple(self.fields[:len(objs[0])]):
+            pad = ("",) * (len(self.fields) - len(objs[0]))   # schema records already are rows in field order
+            self.csv.writerows([o + pad for o in objs] if pad else objs)
+        else:
+            self.csv.writerows([[o.get(k, "") for k in self.fields] for o in objs])
+
+    def flush(self, sync: bool) -> None:
+        self.fh.flush()
+        if sync: os.fsync(self.fh.fileno())
+
+    def close(self) -> None:
+        if self.fh is None: return
+        self.flush(True); self.fh.close(); self.fh = None; self.csv = None
+
+    # --- crash recovery and rotation ---
+    def position(self) -> Dict[str, int]:
+        return {"size": self.fh.tell(), "ino": os.fstat(self.fh.fileno()).st_ino}
+
+    def rewind(self, pos: Dict[str, int]) -> None:
+        """Cut the file back to a checkpointed position (before open)."""
+        if not self.path.exists(): return
+        st = self.path.stat()
+        # a different inode means the file was rotated right after the checkpoint: all of it is newer
+        keep = pos.get("size", 0) if st.st_ino == pos.get("ino") else 0
+        if st.st_size > keep:
+            with self.path.open("r+b") as f: f.truncate(keep)
+            self.repaired_bytes += st.st_size - keep
+
+    def rotate_due(self, now: float) -> bool:
+        if self.fh is None or self.fh.tell() <= self.header_bytes: return False
+        return bool(self.rotate_bytes and self.fh.tell() >= self.rotate_bytes or
+                    self.rotate_secs and now - self.opened >= self.rotate_secs)
+
+    def rotate(self) -> Path:
+        """Close the live file under its rotated name and start a new one; returns the closed part."""
+        self.close()
+        dst = self._rotated_name(time.time()); self.path.rename(dst)
+        self.open()
+        return dst
+
+    def closed_parts(self) -> List[Path]:
+        return [p for p in log_parts(self.path) if p != self.path]
+
+class StorageWriter:
+    """Single background thread owning long-lived append handles for the collector's files.
+
+    `submit` only enqueues; rows are written in batches of `batch_rows` or every
+    `flush_secs`, whichever comes first. `fsync` is one of FSYNC_POLICIES.
+
+    With a WriteAheadLog every batch is logged before the sinks are written, and every
+    `fsync_secs` the sinks are flushed and their positions checkpointed. `batch` then
+    fsyncs only the log per batch. On start the sinks are cut back to the checkpoint and
+    the logged batches replayed (`record` rebuilds tuple rows from the log). Text sinks
+    are rotated at checkpoints and their closed parts compressed in the background.
+
+    A batch that fails (log append, sink write or flush) is held and nothing is checkpointed:
+    the writer stops taking rows off the queue (so `submit` refuses once it is full) and,
+    every `retry_secs` doubling up to RETRY_MAX_SECS, does the same cut-back and replay as a
+    start, then writes the held batch. Without a log only the sinks that had not taken the
+    batch get it again. `stats()["failing"]` has the last error until that succeeds.
+    """
+    def __init__(self, sinks: Sequence[_Sink], batch_rows: int = 64, flush_secs: float = 1.0,
+                 fsync: str = "interval", fsync_secs: float = 5.0, max_queue: int = 100_000,
+                 wal: Any = None, record: Optional[Callable[..., Any]] = None, compress: str = "gzip",
+                 timer: Optional[Callable[[str, float], None]] = None, retry_secs: float = 1.0):
+        if fsync not in FSYNC_POLICIES: raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.sinks = list(sinks)
+        self.batch_rows = max(1, batch_rows); self.flush_secs = flush_secs
+        self.fsync = fsync; self.fsync_secs = fsync_secs
+        self.wal = wal; self.record = record; self.compress = compression(compress); self.timer = timer
+        self.retry_secs = retry_secs
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+        self._last_ckpt = time.monotonic()
+        self._compressing: List[threading.Thread] = []
+        # batches the sinks have not all taken: (rows, in the log, index of the first sink to write)
+        self._held: List[Tuple[List[Any], bool, int]] = []
+        self.failing: Optional[str] = None; self.failing_since: Optional[float] = None; self._tries = 0
+        self.rows_written = 0; self.batches = 0; self.rejected = 0; self.errors = 0
+        self.retries = 0; self.repairs = 0
+        self.rotations = 0; self.compressed = 0; self.compress_errors = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive(): return
+            for s in self.sinks:   # parts left uncompressed by an earlier run
+                if hasattr(s, "closed_parts"):
+                    for p in s.closed_parts():
+                        if p.suffix not in (".gz", ".zst"): self._compress_later(p)
+            self._recover()
+            self._closing.clear()
+            self._thread = threading.Thread(target=self._run, name="ubi-storage", daemon=True)
+            self._thread.start()
+
+    def _recover(self) -> None:
+        if self.wal is None:
+            for s in self.sinks: s.open()
+            return
+        ckpt, batches = self.wal.recover()
+        for s in self.sinks:
+            pos = ckpt["sinks"].get(getattr(s, "name", ""))
+            if pos is not None and hasattr(s, "rewind"): s.rewind(pos)
+            s.open()
+        if self.wal.fd is None: self.wal.open()
+        for batch in batches:
+            rows = [self.record(*r) if self.record is not None and isinstance(r, list) else r for r in batch]
+            for s in self.sinks: s.write(rows)
+        self._checkpoint(sync=self.fsync != "never")
+
+    def submit(self, obj: Dict[str, Any]) -> bool:
+        if self._thread is None: self.start()
+        try: self._q.put_nowait(obj); return True
+        except queue.Full:
+            self.rejected += 1; return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        if self._thread is None or not self._thread.is_alive(): return True
+        done = threading.Event()
+        try: self._q.put(done, timeout=timeout)
+        except queue.Full: return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            t = self._thread
+            if t is None: return
+            self._closing.set()
+            try: self._q.put(None, timeout=timeout)
+            except queue.Full: pass   # failing with a full queue: the thread gives up on its own
+            t.join(timeout)
+            self._thread = None
+            for c in self._compressing: c.join(timeout)
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def _checkpoint(self, sync: bool) -> None:
+        for s in self.sinks: s.flush(sync)
+        if self.wal is not None:
+            self.wal.checkpoint({s.name: s.position() for s in self.sinks if hasattr(s, "position")}, sync)
+        now = time.time()
+        for s in self.sinks:
+            if hasattr(s, "rotate_due") and s.rotate_due(now):
+                self.rotations += 1; self._compress_later(s.rotate())
+
+    def _compress_later(self, path: Path) -> None:
+        if self.compress == "none": return
+        def run() -> None:
+            try: compress_file(path, self.compress); self.compressed += 1
+            except OSError: self.compress_errors += 1
+        self._compressing = [c for c in self._compressing if c.is_alive()]
+        t = threading.Thread(target=run, name="ubi-compress", daemon=True); t.start()
+        self._compressing.append(t)
+
+    def _write(self, batch: List[Dict[str, Any]], force_sync: bool = False) -> None:
+        if batch and not self._put(batch): return   # held: nothing may be checkpointed past it
+        now = time.monotonic()
+        due = force_sync or now - self._last_ckpt >= self.fsync_secs
+        sync = force_sync or self.fsync == "batch" or (self.fsync == "interval" and due)
+        try:
+            if self.wal is None:
+                for s in self.sinks: s.flush(sync)
+                sync = False   # the checkpoint below only rotates
+            else:
+                for s in self.sinks: s.flush(False)
+                sync = force_sync or (due and self.fsync != "never")
+            if due: self._checkpoint(sync); self._last_ckpt = now
+        except Exception as e:
+            self._fail(e)
+
+    def _put(self, batch: List[Any]) -> bool:
+        logged = False; i = 0
+        try:
+            if self.wal is not None:
+                t = time.perf_counter()
+                self.wal.append(batch); logged = True
+                if self.fsync == "batch": self.wal.sync()
+                if self.timer is not None: self.timer("wal", time.perf_counter() - t)
+            for i, s in enumerate(self.sinks):
+                t = time.perf_counter(); s.write(batch)
+                if self.timer is not None: self.timer(s.name, time.perf_counter() - t)
+        except Exception as e:
+            self._held.append((batch, logged, i)); self._fail(e)
+            return False
+        self.rows_written += len(batch); self.batches += 1
+        return True
+
+    def _fail(self, e: Exception) -> None:
+        self.errors += 1; self.failing = f"{type(e).__name__}: {e}"
+        if self.failing_since is None: self.failing_since = time.time()
+
+    def _repair(self) -> bool:
+        """Cut the sinks back to the last checkpoint, replay the log, then write the held batches."""
+        self.retries += 1; self._tries += 1
+        for s in self.sinks:
+            try: s.close()
+            except Exception: pass   # a failed sink may not even flush; the cut-back undoes it
+        try:
+            if self.wal is not None: self._recover()
+            else:
+                for s in self.sinks: s.open()
+            for batch, logged, first in self._held:
+                if self.wal is not None:
+                    if logged: continue   # replayed above
+                    self.wal.append(batch); first = 0
+                for s in self.sinks[first:]: s.write(batch)
+            self._checkpoint(sync=self.fsync != "never"); self._last_ckpt = time.monotonic()
+        except Exception as e:
+            self._fail(e); return False
+        self.rows_written += sum(len(b) for b, _, _ in self._held); self.batches += len(self._held)
+        self._held = []; self._tries = 0; self.failing = None; self.failing_since = None; self.repairs += 1
+        return True
+
+    def _shutdown(self) -> None:
+        for s in self.sinks:
+            try: s.close()
+            except Exception: pass
+        if self.wal is not None: self.wal.close()
+
+    def _run(self) -> None:
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_secs
+        while True:
+            if self.failing is not None:   # leave the queue alone until the sinks take writes again
+                closing = self._closing.wait(min(RETRY_MAX_SECS, self.retry_secs * 2 ** min(self._tries, 6)))
+                if not self._repair() and closing:
+                    self._shutdown(); return
+                batch = []; deadline = time.monotonic() + self.flush_secs
+                continue
+            try: item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty: item = ...
+            if item is None:
+                self._write(batch, force_sync=True)
+                if self.failing is not None: self._repair()   # one last try
+                self._shutdown()
+                return
+            if isinstance(item, threading.Event):
+                self._write(batch); batch = []; item.set()
+                deadline = time.monotonic() + self.flush_secs
+                continue
+            if item is not ...: batch.append(item)
+            if len(batch) >= self.batch_rows or time.monotonic() >= deadline:
+                if batch or self.fsync == "interval" or self.wal is not None: self._write(batch)
+                batch = []; deadline = time.monotonic() + self.flush_secs
+
+    def stats(self) -> Dict[str, Any]:
+        out = {"queued": self.depth(), "rows_written": self.rows_written, "batches": self.batches,
+               "rejected": self.rejected, "errors": self.errors,
+               "failing": self.failing, "failing_since": self.failing_since,
+               "held_rows": sum(len(b) for b, _, _ in self._held), "retries": self.retries, "repairs": self.repairs,
+               "rotations": self.rotations,
+               "compression": self.compress, "compressed": self.compressed,
+               "compress_errors": self.compress_errors,
+               "repaired_bytes": sum(getattr(s, "repaired_bytes", 0) for s in self.sinks),
+               "bytes_written": {s.name: getattr(s, "bytes_written", 0) for s in self.sinks}}
+        if self.wal is not None: out["wal"] = self.wal.stats()
+        return out
+
+def text_sinks(ndjson_path: Path, csv_path: Path, events_path: Path, fields: Sequence[str],
+               rotate_bytes: int = 0, rotate_secs: float = 0.0,
+               events_keep: Optional[Callable[[Any], bool]] = None) -> List[_Sink]:
+    """The legacy text mirror; `events_keep` picks the rows that also go to the events file."""
+    return [
+        _Sink(ndjson_path, "ndjson", rotate_bytes=rotate_bytes, rotate_secs=rotate_secs),
+        _Sink(csv_path, "csv", fields, rotate_bytes=rotate_bytes, rotate_secs=rotate_secs),
+        _Sink(events_path, "csv", list(fields) + ["extra"], rotate_bytes=rotate_bytes, rotate_secs=rotate_secs,
+              keep=events_keep),
+    ]
@@ -0,0 +1,90 @@
+import json, asyncio, collections
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+Message = Tuple[float, str, Dict[str, Any]]   # (ts, kind, data)
+
+class _Subscriber:
+    def __init__(self, device: Optional[str], maxlen: int):
+        self.device = device
+        self.q: Deque[Message] = collections.deque(maxlen=maxlen)
+        self.wake = asyncio.Event()
+        self.dropped = 0
+
+    def offer(self, msg: Message) -> bool:
+        full = len(self.q) == self.q.maxlen
+        if full: self.dropped += 1
+        self.q.append(msg); self.wake.set()
+        return not full
+
+class StreamHub:
+    """Fan-out of ingested samples and events to server-sent-event subscribers.
+
+    Publishing is O(subscribers) and never blocks: each client has its own bounded
+    drop-oldest queue. A short replay ring serves `since` resumes without touching disk.
+    `forward`, when set, also gets every message (the hub process relays them to workers).
+    """
+    def __init__(self, client_queue: int = 256, replay: int = 2048, heartbeat_secs: float = 15.0):
+        self.client_queue = client_queue; self.heartbeat_secs = heartbeat_secs
+        self._subs: Set[_Subscriber] = set()
+        self._ring: Deque[Message] = collections.deque(maxlen=replay)
+        self.published = 0; self.dropped = 0
+        self.forward: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+    def publish(self, kind: str, data: Dict[str, Any]) -> None:
+        msg: Message = (float(data.get("ts") or 0.0), kind, data)
+        self._ring.append(msg); self.published += 1
+        dev = data.get("device")
+        for s in self._subs:
+            if s.device is None or s.device == dev:
+                if not s.offer(msg): self.dropped += 1
+        if self.forward is not None: self.forward(kind, data)
+
+    def forget(self) -> None:
+        """Empty the replay ring, when it can no longer be trusted to have no gaps."""
+        self._ring.clear()
+
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def stats(self) -> Dict[str, int]:
+        return {"subscribers": len(self._subs), "published": self.published, "dropped": self.dropped,
+                "queued": sum(len(s.q) for s in self._subs)}
+
+    def _replay_from_ring(self, since: float, device: Optional[str]) -> Tuple[List[Message], Optional[float]]:
+        oldest = self._ring[0][0] if self._ring else None
+        msgs = [m for m in self._ring if m[0] > since and (device is None or m[2].get("device") == device)]
+        return msgs, oldest
+
+    async def events(self, device: Optional[str], since: Optional[float],
+                     backfill: Callable[[float, float], Iterable[Dict[str, Any]]],
+                     is_disconnected: Callable[[], Any]):
+        sub = _Subscriber(device, self.client_queue)
+        self._subs.add(sub)   # subscribe before replaying so nothing published meanwhile is missed
+        try:
+            replayed: Optional[float] = None
+            if since is not None:
+                ring, oldest = self._replay_from_ring(since, device)
+                replayed = since
+                if oldest is None or since < oldest:
+                    upto = oldest if oldest is not None else float("inf")
+                    for row in backfill(since, upto):
+                        if row.get("ts") is not None and since < row["ts"] < upto:
+                            yield _sse("sample", row); replayed = row["ts"]
+                for m in ring:
+                    yield _sse(m[1], m[2]); replayed = max(replayed, m[0])
+            while True:
+                if not sub.q:
+                    sub.wake.clear()
+                    try: await asyncio.wait_for(sub.wake.wait(), self.heartbeat_secs)
+                    except asyncio.TimeoutError:
+                        if await is_disconnected(): return
+                        yield ": keepalive\n\n"; continue
+                while sub.q:
+                    ts, kind, data = sub.q.popleft()
+                    if replayed is not None and ts <= replayed: continue   # already sent during replay
+                    yield _sse(kind, data)
+        finally:
+            self._subs.discard(sub)
+
+def _sse(kind: str, data: Dict[str, Any]) -> str:
+    return f"id: {data.get('ts', '')}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,117 @@
+import time, collections
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+DEDUP_SECS = 60.0          # repeat window at the highest severity
+SEVERITY_FACTORS = (10.0, 3.0, 1.0)   # window multiplier by severity 0 (safe/n/a), 1 (medium), 2 (low)
+CLEAR_SECS = 120.0         # an improved band must hold this long before it replaces the alerted one
+TTL_SECS = 3600.0          # keys idle this long are forgotten
+MAX_KEYS = 4096
+DIGEST_SECS = 300.0
+DIGEST_TOP = 20
+
+class _Entry:
+    __slots__ = ("severity", "sent_at", "seen_at", "better_since", "suppressed", "first_suppressed")
+    def __init__(self, severity: int, now: float):
+        self.severity = severity; self.sent_at = now; self.seen_at = now
+        self.better_since: Optional[float] = None
+        self.suppressed = 0; self.first_suppressed = 0.0
+
+class Suppressor:
+    """Alert dedup by (device, kind, reason, context) with escalation, hysteresis and digests.
+
+    Entries live in one OrderedDict in last-seen order, so expiring idle keys and evicting the
+    least recently seen key both pop from the front. When `max_keys` is reached, the front key
+    is only evicted once its own repeat window has passed (forgetting it loses nothing);
+    otherwise alerts for new keys are suppressed and counted as overflow, so memory stays
+    bounded and a storm from many devices cannot turn into one message per key.
+
+    A worse severity than the one last alerted is sent at once; a better one only takes over
+    after holding for `clear_secs`, so a value flapping around a band edge does not
+    re-escalate. Suppressed repeats are counted and handed out by `digest()` as one summary
+    per interval.
+    """
+    def __init__(self, dedup_secs: float = DEDUP_SECS, factors: Tuple[float, ...] = SEVERITY_FACTORS,
+                 clear_secs: float = CLEAR_SECS, ttl_secs: float = TTL_SECS, max_keys: int = MAX_KEYS,
+                 digest_secs: float = DIGEST_SECS):
+        self.windows = tuple(dedup_secs * f for f in factors)
+        self.clear_secs = clear_secs; self.ttl_secs = ttl_secs; self.max_keys = max(1, max_keys)
+        self.digest_secs = digest_secs; self.digest_at = time.time() + digest_secs
+        self._keys: "collections.OrderedDict[Hashable, _Entry]" = collections.OrderedDict()
+        self.sent = 0; self.suppressed = 0; self.escalated = 0; self.expired = 0; self.evicted = 0
+        self.digests = 0; self.lost = 0; self.overflow = 0; self._overflow = 0
+
+    def check(self, key: Hashable, severity: int, now: Optional[float] = None) -> Optional[str]:
+        """"new", "escalated" or "repeat" when the alert should go out, None when suppressed."""
+        now = time.time() if now is None else now
+        severity = max(0, min(severity, len(self.windows) - 1))
+        self._expire(now)
+        e = self._keys.get(key)
+        if e is None:
+            if len(self._keys) >= self.max_keys and not self._evict(now):
+                self._overflow += 1; self.overflow += 1; self.suppressed += 1
+                return None
+            self._keys[key] = _Entry(severity, now); self.sent += 1
+            return "new"
+        self._keys.move_to_end(key); e.seen_at = now
+        if severity > e.severity:
+            e.severity = severity; e.better_since = None
+            self._send(e, now); self.escalated += 1
+            return "escalated"
+        if severity < e.severity:
+            if e.better_since is None: e.better_since = now
+            elif now - e.better_since >= self.clear_secs: e.severity = severity; e.better_since = None
+        else:
+            e.better_since = None
+        if now - e.sent_at >= self.windows[e.severity]:
+            self._send(e, now)
+            return "repeat"
+        if not e.suppressed: e.first_suppressed = now
+        e.suppressed += 1; self.suppressed += 1
+        return None
+
+    def _send(self, e: _Entry, now: float) -> None:
+        e.sent_at = now; self.sent += 1
+
+    def _expire(self, now: float) -> None:
+        ks = self._keys
+        while ks:
+            k, e = next(iter(ks.items()))
+            if now - e.seen_at < self.ttl_secs: return
+            self._drop(k, e); self.expired += 1
+
+    def _evict(self, now: float) -> bool:
+        k, e = next(iter(self._keys.items()))
+        if now - e.sent_at < self.windows[e.severity]: return False
+        self._drop(k, e); self.evicted += 1
+        return True
+
+    def _drop(self, k: Hashable, e: _Entry) -> None:
+        del self._keys[k]
+        self.lost += e.suppressed   # counts that never made it into a digest
+
+    def digest(self, now: Optional[float] = None, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Suppressed counts since the last digest, busiest keys first, once per `digest_secs`."""
+        now = time.time() if now is None else now
+        if not force and now < self.digest_at: return None
+        self.digest_at = now + self.digest_secs
+        self._expire(now)
+        items = [(k, e) for k, e in self._keys.items() if e.suppressed]
+        overflow, self._overflow = self._overflow, 0
+        if not items and not overflow: return None
+        items.sort(key=lambda ke: ke[1].suppressed, reverse=True)
+        total = sum(e.suppressed for _, e in items) + overflow
+        top: List[Dict[str, Any]] = [{"key": k, "count": e.suppressed, "severity": e.severity,
+                                      "since": e.first_suppressed} for k, e in items[:DIGEST_TOP]]
+        for _, e in items: e.suppressed = 0
+        self.digests += 1
+        return {"keys": len(items), "suppressed": total, "top": top, "more": max(0, len(items) - DIGEST_TOP),
+                "overflow": overflow}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"keys": len(self._keys), "max_keys": self.max_keys, "sent": self.sent, "escalated": self.escalated,
+                "suppressed": self.suppressed, "expired": self.expired, "evicted": self.evicted,
+                "overflow": self.overflow, "digests": self.digests, "lost_from_digest": self.lost,
+                "windows_s": list(self.windows), "digest_secs": self.digest_secs}
@@ -0,0 +1,84 @@
+"""DiscordDispatcher against a stand-in webhook (httpx.MockTransport).
+
+Run from server/: python -m pytest -q test_alerts.py
+"""
+import sys, json, asyncio
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from alerts import DISCORD_MAX_CHARS, DISCORD_MAX_EMBEDS, DiscordDispatcher, embed_chars
+
+URL = "https://discord.test/api/webhooks/1/x"
+
+def _embed(i: int, chars: int = 0) -> Dict[str, Any]:
+    return {"title": f"e{i}", "description": "x" * chars}
+
+def _run(reply: Callable[[Dict[str, Any], int], httpx.Response], embeds: List[Dict[str, Any]],
+         before_start: bool = False, **kw: Any):
+    """Send `embeds` and return (posted bodies with their loop time, stats); `reply(body, n)` answers post n."""
+    posts: List[Any] = []
+
+    async def go():
+        loop = asyncio.get_running_loop()
+        def handler(req: httpx.Request) -> httpx.Response:
+            body = json.loads(req.content); posts.append((loop.time(), body))
+            return reply(body, len(posts))
+        kw.setdefault("coalesce_secs", 0.05); kw.setdefault("backoff_base", 0.01)
+        d = DiscordDispatcher(lambda: URL, transport=httpx.MockTransport(handler), **kw)
+        if before_start:
+            for e in embeds: d.enqueue(e)
+        await d.start()
+        if not before_start:
+            for e in embeds: d.enqueue(e)
+        await d.stop(drain_secs=5.0)
+        return d.stats()
+
+    st = asyncio.run(go())
+    return posts, st
+
+def _titles(posts) -> List[str]:
+    return [e["title"] for _, b in posts for e in b["embeds"]]
+
+def _ok(body, n) -> httpx.Response:
+    return httpx.Response(204)
+
+def test_burst_is_coalesced_into_messages_of_ten():
+    posts, st = _run(_ok, [_embed(i) for i in range(25)])
+    assert [len(b["embeds"]) for _, b in posts] == [DISCORD_MAX_EMBEDS, DISCORD_MAX_EMBEDS, 5]
+    assert _titles(posts) == [f"e{i}" for i in range(25)]
+    assert st["sent"] == 25 and st["messages"] == 3 and st["dropped"] == st["failed"] == 0
+
+def test_full_queue_drops_the_oldest():
+    posts, st = _run(_ok, [_embed(i) for i in range(8)], before_start=True, max_queue=5)
+    assert _titles(posts) == ["e3", "e4", "e5", "e6", "e7"]
+    assert st["dropped"] == 3 and st["sent"] == 5
+
+def test_429_waits_retry_after():
+    def reply(body, n):
+        return httpx.Response(429, json={"retry_after": 0.3}) if n == 1 else httpx.Response(204)
+    posts, st = _run(reply, [_embed(0)], backoff_base=5.0)   # a backoff would take far longer
+    assert len(posts) == 2 and posts[1][0] - posts[0][0] >= 0.3
+    assert st["retried"] == 1 and st["sent"] == 1 and st["failed"] == 0
+
+def test_rejected_message_is_split_in_halves():
+    def reply(body, n):   # the webhook refuses any message with more than two embeds
+        return httpx.Response(400, json={"message": "too big"}) if len(body["embeds"]) > 2 else httpx.Response(204)
+    posts, st = _run(reply, [_embed(i) for i in range(8)])
+    assert [len(b["embeds"]) for _, b in posts] == [8, 4, 2, 2, 4, 2, 2]
+    assert st["sent"] == 8 and st["messages"] == 4 and st["failed"] == 0
+    sent = [e["title"] for _, b in posts if len(b["embeds"]) <= 2 for e in b["embeds"]]
+    assert sent == [f"e{i}" for i in range(8)]
+
+def test_single_rejected_embed_fails_without_retries():
+    posts, st = _run(lambda body, n: httpx.Response(400), [_embed(0)])
+    assert len(posts) == 1 and st["failed"] == 1 and st["retried"] == 0
+
+def test_messages_stay_under_the_character_limit():
+    embeds = [_embed(i, 2500) for i in range(7)]
+    posts, st = _run(_ok, embeds)
+    assert all(sum(embed_chars(e) for e in b["embeds"]) <= DISCORD_MAX_CHARS for _, b in posts)
+    assert [len(b["embeds"]) for _, b in posts] == [2, 2, 2, 1] and st["sent"] == 7
@@ -0,0 +1,24 @@
+"""Binary frames decode to rows the schema coercer has nothing left to change.
+
+Run from server/: python -m pytest -q test_batch.py
+"""
+import sys, csv
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from batch import coerce_batch, decode_frames, encode_frames
+from schema import coerce
+
+def test_decoded_frames_are_already_coerced():
+    with (Path(__file__).resolve().parent / "data" / "old" / "telemetry_b_test.csv").open(newline="") as f:
+        raw = [{k: v for k, v in r.items() if v != ""} for _, r in zip(range(500), csv.DictReader(f))]
+    rows = [dict(r) for r in raw]
+    for r in rows: coerce(r)
+    rows[7]["lux"] = None; rows[9]["reason"] = ""
+    decoded = decode_frames(encode_frames(rows))
+    assert len(decoded) == len(rows)
+    for r in decoded:
+        before = dict(r)
+        assert coerce(r) == {} and r == before and {type(v) for v in r.values()} <= {bool, int, float, str, type(None)}
+    assert coerce_batch(decoded, typed=True) == [{}] * len(rows)
@@ -0,0 +1,29 @@
+"""Column store string codes past uint16.
+
+Run from server/: python -m pytest -q test_colstore.py
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from colstore import ColumnStore, U16_CODES
+
+def test_string_codes_widen_past_uint16(tmp_path):
+    t = 1_790_000_000.0; n = U16_CODES + 5000
+    store = ColumnStore(tmp_path, ["ts", "reason", "device"]); store.open()
+    rows = [{"ts": t + i * 0.01, "reason": f"r{i}", "device": "a"} for i in range(n)]
+    store.write(rows[:60000]); store.flush(True); pos = store.position()
+    store.write(rows[60000:]); store.close()
+    seg = next(p for p in tmp_path.iterdir() if p.is_dir())
+    assert (seg / "reason.u32").exists() and (seg / "reason.u16").exists() and (seg / "device.u16").exists()
+    got = store.read(fields=["reason", "device"])
+    assert got["reason"].tolist() == [r["reason"] for r in rows] and set(got["device"]) == {"a"}
+    assert store.read(t + 655.0, t + 655.0, ["reason"], "a")["reason"].tolist() == ["r65500"]
+    store = ColumnStore(tmp_path, ["ts", "reason", "device"])
+    store.rewind(pos); store.open()
+    store.write(rows[60000:60010]); store.close()
+    assert not (seg / "reason.u16").exists()   # reopening the segment dropped the stale uint16 file
+    assert store.read(fields=["reason"])["reason"].tolist() == [r["reason"] for r in rows[:60010]]
@@ -0,0 +1,34 @@
+"""The alert embed and /events judge burst efficacy the same way on the same samples.
+
+Run from server/: python -m pytest -q test_efficacy.py
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from colstore import ColumnStore
+from event_window import EventWindow
+from query import pump_summary
+
+def test_embed_and_events_agree(tmp_path):
+    rng = np.random.default_rng(3)
+    store = ColumnStore(tmp_path, ["ts", "device", "rec_ms", "dT_tb"]); store.open()
+    win = EventWindow()
+    t0 = 1_790_000_000.0; d = 0.8; seen = set()
+    for i in range(1800):
+        ts = t0 + 2.0 * i
+        rec = 3000 if i % 150 == 0 else 0
+        if (i // 300) % 2 == 0: d -= 0.004 if rec == 0 else 0.0   # cooling: dT_tb keeps moving
+        dT = round(d + float(rng.normal(0, 0.002)), 3)
+        ev = {"ts": ts, "device": "pond-a", "rec_ms": rec, "dT_tb": None if i % 37 == 5 else dT}
+        win.push(ev); store.write([ev])
+        if i % 10 == 9:
+            store.flush(True)
+            got = pump_summary(store, "pond-a", now=ts)["efficacy_ok"]
+            assert got == win.burst_effect(), i
+            seen.add(got)
+    assert seen == {True, False}   # both outcomes were exercised
+    store.close()
@@ -0,0 +1,35 @@
+"""HotTier keeps each device's window apart: a busy device's evictions leave a quiet one covered.
+
+Run from server/: python -m pytest -q test_hot.py
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from hot import BLOCK_ROWS, HotTier
+
+FIELDS = ["ts", "device", "lux", "alert"]
+
+def test_busy_device_does_not_evict_a_quiet_one():
+    t = 1_790_000_000.0
+    hot = HotTier(FIELDS, secs=86400.0, max_bytes=200_000); hot.open()
+    quiet = [{"ts": t + 10.0 * i, "device": "quiet", "lux": float(i), "alert": i % 7 == 0} for i in range(BLOCK_ROWS + 50)]
+    hot.write(quiet)
+    rng = np.random.default_rng(0)
+    for k in range(12):   # noisy floats compress badly: the cap is soon hit
+        hot.write([{"ts": t + 5.0 + 0.1 * (k * BLOCK_ROWS + i), "device": "busy", "lux": float(v), "alert": False}
+                   for i, v in enumerate(rng.normal(100, 30, BLOCK_ROWS))])
+    st = hot.stats()
+    assert st["evicted_blocks"] > 0 and st["bytes"] <= 200_000
+    assert st["devices"]["quiet"]["floor"] is None and st["devices"]["busy"]["floor"] is not None
+    assert hot.covers(t, "quiet") and not hot.covers(t, "busy") and not hot.covers(t)
+    assert hot.covers(st["devices"]["busy"]["floor"] + 1e-3, "busy")
+    got = hot.read(t, None, ["ts", "lux", "alert"], "quiet")
+    assert np.array_equal(got["ts"], [r["ts"] for r in quiet]) and np.array_equal(got["lux"], [r["lux"] for r in quiet])
+    assert got["alert"].tolist() == [str(r["alert"]) for r in quiet]
+    both = hot.read(t + 5.0 + 0.1 * 9 * BLOCK_ROWS, None, ["ts", "device"])
+    assert (np.diff(both["ts"]) >= 0).all() and set(both["device"]) == {"quiet", "busy"}
+    assert hot.read(t, None, ["ts"], "nobody")["ts"].size == 0
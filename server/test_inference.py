@@ -0,0 +1,53 @@
+"""Batched and streamed inference give the same predictions as one direct interpreter call.
+
+Run from server/: python -m pytest -q test_inference.py (skipped without a TFLite runtime)
+"""
+import sys, csv, asyncio, random
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import inference
+from inference import MicroBatcher, TFLiteModel
+
+if inference.load_interpreter(inference.MODEL_PATH) is None:
+    pytest.skip("no TFLite runtime installed", allow_module_level=True)
+
+def test_singles_and_batches_share_the_batcher():
+    model = TFLiteModel(max_batch=64)
+    X = np.random.default_rng(2).normal(0, 3, (300, len(model.features))).astype(np.float32)
+    idx, conf = model.predict(X)
+    want = [(model.classes[i], round(c, 4)) for i, c in zip(idx.tolist(), conf.tolist())]
+
+    async def run():
+        mb = MicroBatcher(model, max_batch=32, max_wait_ms=2.0)
+        await mb.start()
+        try:
+            got = await asyncio.gather(*[mb.predict(X[i]) for i in range(100)],
+                                       mb.predict_many(X[100:250]), mb.predict_many(X[250:]))
+        finally:
+            await mb.stop()
+        return got[:100] + got[100] + got[101], mb.stats()
+
+    got, st = asyncio.run(run())
+    assert got == want and st["samples"] == 300 and st["pending"] == 0 and st["batches"] < 100
+
+def test_score_file_is_the_same_in_any_chunk_size(tmp_path):
+    model = TFLiteModel(max_batch=256)
+    rng = random.Random(4); src = tmp_path / "in.csv"
+    with src.open("w", newline="") as f:
+        w = csv.writer(f); w.writerow(["ts", "device", "tMid", "tTop", "tBot", "dT_tb", "lux", "tds_mV", "ml_pred"])
+        t = 25.0
+        for i in range(1500):
+            t += rng.gauss(0, 0.05)
+            w.writerow([i, rng.choice("ab"), round(t, 2), round(t + 0.3, 2), round(t - 0.2, 2), 0.5,
+                        rng.randint(0, 900), "" if i % 50 == 3 else rng.randint(300, 500), "calm"])
+    outs = []
+    for batch in (7, 100, 100_000):
+        dst = tmp_path / f"out{batch}.csv"
+        st = inference.score_file(src, dst, model, batch)
+        outs.append((dst.read_text(), st["counts"], st["agree"]))
+    assert st["rows"] == 1500 and outs[0] == outs[1] == outs[2]
@@ -0,0 +1,94 @@
+"""Samples are stored at their own time and read back in ts order, however they arrive.
+
+Both ingest paths await the ML micro-batcher after their samples are stamped, so requests
+finish out of order, and a device uploading its buffer after an outage sends rows much
+older than what other devices sent meanwhile.  Run from server/: python -m pytest -q
+"""
+import os, sys, time, asyncio, tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.update(UBI_DATA_DIR=tempfile.mkdtemp(), DISCORD_WEBHOOK_URL="", UBI_TEXT_MIRROR="0")
+
+import httpx
+import main
+from batch import sample_times
+from colstore import ColumnStore
+
+SAMPLE = {"tMid": 23.5, "tTop": 23.6, "tBot": 23.4, "dT_tb": 0.2, "lux": 120.0, "micRMS": 3.2,
+          "tds_mV": 420, "DOproxy": 6.9, "context": "day"}
+
+async def _ingest() -> int:
+    async with main._lifespan(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://t") as c:
+            async def single(i: int):
+                return await c.post("/ingest", json=dict(SAMPLE, lux=float(i)), headers={"x-device-id": "a"})
+            async def batch(i: int):
+                rows = [dict(SAMPLE, lux=float(i * 10 + j)) for j in range(10)]
+                return await c.post("/ingest/batch", json=rows, headers={"x-device-id": "b"})
+            for rnd in range(5):
+                rs = await asyncio.gather(*[single(rnd * 100 + i) for i in range(20)],
+                                          *[batch(rnd * 100 + i) for i in range(2)])
+                assert all(r.status_code == 200 for r in rs)
+            main._store.flush()
+            return 5 * (20 + 2 * 10)
+
+def test_interleaved_ingest_is_stored_in_ts_order():
+    n = asyncio.run(_ingest())
+    ts = main._backend.read(fields=["ts"])["ts"]
+    assert len(ts) == n
+    assert (np.diff(ts) > 0).all()
+    missed = [t for t in ts if len(main._backend.read(t, t, ["ts"])["ts"]) != 1]
+    assert not missed
+
+async def _backlog(hours_ago: float, n: int) -> float:
+    async with main._lifespan(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://t") as c:
+            for i in range(n):   # pond-a stays online...
+                r = await c.post("/ingest", json=dict(SAMPLE, lux=float(i)), headers={"x-device-id": "pond-a"})
+                assert r.status_code == 200
+            # ...while pond-b comes back and uploads what it buffered, one sample a second
+            rows = [dict(SAMPLE, lux=float(i), age_ms=(hours_ago * 3600 - i) * 1000.0) for i in range(n)]
+            sent = time.time()
+            r = await c.post("/ingest/batch", json=rows, headers={"x-device-id": "pond-b"})
+            assert r.json()["accepted"] == n
+            main._store.flush()
+            return sent
+
+def test_backlog_keeps_its_own_times():
+    sent = asyncio.run(_backlog(1.0, 60))
+    b = main._backend.read(fields=["ts", "lux"], device="pond-b", decode=False)
+    want = sent - 3600 + np.arange(60)
+    assert np.allclose(b["ts"], want, atol=2.0) and (np.diff(b["ts"]) > 0).all()
+    assert b["lux"].tolist() == list(range(60))
+    a = main._backend.read(fields=["ts"], device="pond-a")["ts"]
+    assert a.min() > b["ts"].max() + 3000   # the online device's rows did not move either
+    ts = main._backend.read(fields=["ts"])["ts"]
+    assert (np.diff(ts) >= 0).all()
+    win = main._backend.read(b["ts"][10], b["ts"][19], ["ts"], "pond-b")["ts"]
+    assert np.array_equal(win, b["ts"][10:20])
+    hot = main._hot.read(b["ts"][0], None, ["ts", "lux"], "pond-b", decode=False)
+    assert np.array_equal(hot["ts"], b["ts"]) and np.array_equal(hot["lux"], b["lux"])
+
+def test_rewind_drops_late_rows_after_checkpoint(tmp_path):
+    store = ColumnStore(tmp_path, ["ts", "lux"], segment_secs=3600)
+    t = 1_790_000_000.0
+    store.open(); store.write([{"ts": t + i, "lux": 1.0} for i in range(10)])
+    store.flush(True); pos = store.position()
+    store.write([{"ts": t - 3600.0, "lux": 2.0}, {"ts": t - 7200.0, "lux": 3.0}, {"ts": t + 11, "lux": 4.0}])
+    store.close()
+    store = ColumnStore(tmp_path, ["ts", "lux"], segment_secs=3600)
+    store.rewind(pos); store.open()
+    d = store.read(fields=["ts", "lux"])
+    assert np.array_equal(d["ts"], t + np.arange(10)) and store.repaired_rows == 3
+
+def test_batch_times_are_unique_and_kept():
+    now = 1_790_000_000.0
+    ts = np.array(sample_times([None] * 50 + [5000.0, 0.0], now, now - 1.0))
+    assert len(set(ts.tolist())) == 52 and ts[50] == now - 1.0
+    ts = np.array(sample_times([3000.0, 2000.0, 1000.0], now, 0.0))
+    assert np.allclose(ts, [now - 3, now - 2, now - 1])
+    ts = sample_times([1000.0, 3000.0], now, 0.0)   # out of order on the device: times kept
+    assert ts == [now - 1.0, now - 3.0]
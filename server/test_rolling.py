@@ -0,0 +1,43 @@
+"""RollingStats against numpy over a sliding window, ties included.
+
+Run from server/: python -m pytest -q test_rolling.py
+"""
+import sys, random
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import rolling
+from rolling import RollingStats, SortedWindow
+
+def test_sorted_window_matches_sorted_list():
+    rng = random.Random(1); w = SortedWindow(64); ref = []
+    for _ in range(3000):
+        if ref and rng.random() < 0.45:
+            x = rng.choice(ref); ref.remove(x); w.discard(x)
+        else:
+            x = float(rng.randint(0, 40)); ref.append(x); w.add(x)
+        ref.sort()
+        assert len(w) == len(ref)
+        if ref:
+            i = rng.randrange(len(ref)); assert w[i] == ref[i] and w[-1] == ref[-1]
+            q = rng.randint(-1, 41); assert w.bisect_left(q) == sum(v < q for v in ref)
+
+def test_window_stats_match_numpy(monkeypatch):
+    _check_against_numpy()
+    monkeypatch.setattr(rolling, "LIST_WINDOW_MAX", 0)   # the same through the skiplist
+    _check_against_numpy()
+
+def _check_against_numpy():
+    rng = np.random.default_rng(7)
+    for window in (1, 2, 5, 300):
+        st = RollingStats(window)
+        xs = np.round(rng.normal(20, 3, 1500), 1)   # rounded: plenty of ties
+        for i, x in enumerate(xs):
+            st.push(x)
+            win = xs[max(0, i + 1 - window):i + 1]
+            med = np.median(win)
+            assert st.median() == med and st.mad() == np.median(np.abs(win - med))
+            assert st.sorted[0] == win.min() and st.sorted[-1] == win.max()
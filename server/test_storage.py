@@ -0,0 +1,79 @@
+"""A failed storage write is held and replayed, never checkpointed away.
+
+Run from server/: python -m pytest -q test_storage.py
+"""
+import sys, time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from colstore import ColumnStore
+from storage import StorageWriter
+from wal import WriteAheadLog
+
+class FlakySink:
+    """Keeps rows in memory; `fail` makes writes (or flushes) raise like a full disk."""
+    name = "flaky"
+
+    def __init__(self):
+        self.rows = []; self.fail = None; self.at = 0
+
+    def open(self): pass
+    def close(self): pass
+    def position(self): return {"rows": len(self.rows)}
+    def rewind(self, pos): del self.rows[pos["rows"]:]
+
+    def write(self, objs):
+        self.rows.extend(objs[:len(objs) // 2])
+        if self.fail == "write": raise OSError(28, "No space left on device")
+        self.rows.extend(objs[len(objs) // 2:])
+
+    def flush(self, sync):
+        if self.fail == "flush": raise OSError(5, "Input/output error")
+
+def _wait(cond, secs=10.0):
+    end = time.monotonic() + secs
+    while not cond() and time.monotonic() < end: time.sleep(0.02)
+    return cond()
+
+def _run(tmp_path, mode, wal):
+    store = ColumnStore(tmp_path / "columns", ["ts", "lux"])
+    flaky = FlakySink()
+    w = StorageWriter([store, flaky], batch_rows=10, flush_secs=0.05, fsync_secs=0.0, retry_secs=0.05,
+                      wal=WriteAheadLog(tmp_path / "storage.wal") if wal else None)
+    t = 1_790_000_000.0
+    for i in range(30): w.submit({"ts": t + i, "lux": float(i)})
+    assert w.flush()
+    flaky.fail = mode
+    for i in range(30, 60): w.submit({"ts": t + i, "lux": float(i)})
+    assert _wait(lambda: w.stats()["failing"] is not None)
+    st = w.stats()
+    assert "OSError" in st["failing"] and st["failing_since"] and st["errors"] >= 1
+    time.sleep(0.3)   # retries keep failing meanwhile, and nothing may be checkpointed
+    assert w.stats()["repairs"] == 0 and w.stats()["retries"] >= 1
+    flaky.fail = None
+    assert _wait(lambda: w.stats()["failing"] is None)
+    w.close()
+    return store, flaky, w
+
+def _check(store, flaky, wal):
+    lux = store.read(fields=["lux"])["lux"]
+    assert np.array_equal(lux, np.arange(60, dtype=np.float32))
+    got = [r["lux"] for r in flaky.rows]
+    if wal: assert got == list(map(float, range(60)))
+    else: assert sorted(set(got)) == list(map(float, range(60)))   # no log: the failed sink may repeat rows
+
+def test_failed_write_is_replayed_from_the_log(tmp_path):
+    store, flaky, w = _run(tmp_path, "write", wal=True)
+    _check(store, flaky, True)
+    assert w.stats()["rows_written"] == 60 and w.stats()["repairs"] >= 1
+
+def test_failed_flush_is_replayed_from_the_log(tmp_path):
+    store, flaky, w = _run(tmp_path, "flush", wal=True)
+    _check(store, flaky, True)
+
+def test_failed_write_without_a_log_is_retried(tmp_path):
+    store, flaky, w = _run(tmp_path, "write", wal=False)
+    _check(store, flaky, False)
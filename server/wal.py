@@ -0,0 +1,80 @@
+import os, json, zlib, struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+REC = struct.Struct("<IIQ")   # payload bytes, crc32 of payload, sequence number
+
+class WriteAheadLog:
+    """Checksummed append log in front of the storage sinks.
+
+    Every batch is appended here before any sink sees it. A checkpoint records each sink's
+    position once the sinks are flushed and empties the log, so after a crash the sinks are
+    cut back to the checkpoint and the batches logged since are written again. A torn last
+    record (short or failing its crc) is dropped.
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path); self.ckpt_path = self.path.with_suffix(".ckpt")
+        self.fd: Optional[int] = None; self.seq = 0
+        self.appended = 0; self.checkpoints = 0; self.replayed = 0; self.torn_bytes = 0
+
+    def recover(self) -> Tuple[Dict[str, Any], List[Any]]:
+        """(last checkpoint, batches logged after it), cutting a torn tail off the log."""
+        ckpt: Dict[str, Any] = {"seq": 0, "sinks": {}}
+        if self.ckpt_path.exists():
+            try: ckpt.update(json.loads(self.ckpt_path.read_text(encoding="utf-8")))
+            except ValueError: pass
+        batches: List[Any] = []; seq = int(ckpt["seq"])
+        data = self.path.read_bytes() if self.path.exists() else b""
+        off = 0
+        while off + REC.size <= len(data):
+            n, crc, s = REC.unpack_from(data, off)
+            body = data[off + REC.size:off + REC.size + n]
+            if len(body) < n or zlib.crc32(body) != crc: break
+            if s > int(ckpt["seq"]): batches.append(json.loads(body)); seq = max(seq, s)
+            off += REC.size + n
+        if off < len(data):
+            self.torn_bytes += len(data) - off
+            with self.path.open("r+b") as f: f.truncate(off)
+        self.seq = seq; self.replayed += sum(len(b) for b in batches)
+        return ckpt, batches
+
+    def open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, batch: List[Any]) -> int:
+        body = json.dumps(batch, separators=(",", ":"), ensure_ascii=False).encode()
+        self.seq += 1
+        os.write(self.fd, REC.pack(len(body), zlib.crc32(body), self.seq) + body)
+        self.appended += len(batch)
+        return self.seq
+
+    def sync(self) -> None:
+        if self.fd is not None: os.fsync(self.fd)
+
+    def checkpoint(self, positions: Dict[str, Any], sync: bool) -> None:
+        """Record sink positions for everything logged so far and empty the log.
+
+        The sinks must already be flushed (and fsynced, when `sync`) up to `positions`.
+        """
+        tmp = self.ckpt_path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({"seq": self.seq, "sinks": positions}, f)
+            if sync: f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self.ckpt_path)
+        if sync:   # the new checkpoint must survive a crash before the log it replaces is emptied
+            fd = os.open(self.ckpt_path.parent, os.O_RDONLY)
+            try: os.fsync(fd)
+            finally: os.close(fd)
+        if self.fd is not None: os.ftruncate(self.fd, 0)
+        self.checkpoints += 1
+
+    def close(self) -> None:
+        if self.fd is not None: os.close(self.fd); self.fd = None
+
+    def size(self) -> int:
+        return os.fstat(self.fd).st_size if self.fd is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"seq": self.seq, "bytes": self.size(), "appended": self.appended,
+                "checkpoints": self.checkpoints, "replayed": self.replayed, "torn_bytes": self.torn_bytes}